@@ -2,19 +2,29 @@
 Crawler with MinimalCrawler components + bonuses
 """
 import os
-import time
-import socket
-import sqlite3
-
-from urllib.request import urlopen
-from urllib.parse import urlparse
-from urllib.robotparser import RobotFileParser
-
-from bs4 import BeautifulSoup
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .scheduler import PolitenessScheduler
+from .frontier import make_seen_set
+from .database import CrawlDatabase
+from .robots import RobotsCache
+from .httpclient import HttpClient
+from .documentextractor import DocumentExtractor
+from .documentstore import DocumentStore
+from .sitemaps import SitemapCache
+from .sharding import ShardCoordinator
+from .fingerprint import simhash, SimHashIndex
+from .metrics import CrawlMetrics
 
 # handling errors
 from urllib.error import URLError
-from http.client import BadStatusLine, IncompleteRead
+from http.client import IncompleteRead
 
 class Crawler():
 
@@ -24,7 +34,15 @@ class Crawler():
                  max_urls_per_page:int=5, 
                  crawl_delay:int=5, 
                  robot_delay:int=3, 
-                 timeout_delay:int=5) -> None:
+                 timeout_delay:int=5,
+                 robots_cache:RobotsCache|None=None,
+                 sitemap_cache:SitemapCache|None=None,
+                 bloom_capacity:int=0,
+                 db_batch_size:int=50,
+                 checkpoint_every:int=10,
+                 http_client:HttpClient|None=None,
+                 dedup_distance:int=3,
+                 metrics:CrawlMetrics|None=None) -> None:
         """
         Attributes
         ----------
@@ -40,6 +58,41 @@ class Crawler():
             Time in seconds to wait before interrogating another /robots.txt (politeness)
         __timeout_seconds: int
             Time in seconds to try to fetch an url, default = 5.
+        __bloom_capacity: int
+            If not 0, urls already seen are stored in a Bloom filter of this capacity instead of a set,
+            which bounds memory on very large crawls.
+        __db_batch_size: int
+            Number of crawled urls written to the database at once.
+        __checkpoint_every: int
+            Number of crawled pages between two checkpoints of the crawl state in the database.
+        __dedup_distance: int
+            Pages whose SimHash fingerprints differ by at most this number of bits from a page
+            already stored are not stored in the document store, negative to store all pages.
+        __frontier: PolitenessScheduler
+            URLs to crawl, handed out as soon as their host can be requested again.
+            Each url is only queued once.
+        __http: HttpClient
+            HTTP client keeping connections alive, can be shared between crawlers.
+        __metrics: CrawlMetrics
+            Time spent in each stage of the crawl, pages and bytes of each host.
+        __robots_cache: RobotsCache
+            Parsed /robots.txt files of the websites, can be shared between crawlers.
+        __sitemap_cache: SitemapCache
+            Pages exposed by the sitemaps of the websites, can be shared between crawlers.
+        __sitemap_hosts: set[str]
+            Websites whose sitemap urls were all added to the frontier.
+        __sitemap_urls: dict[str, deque[str]]
+            For each website whose sitemaps were scanned, its sitemap urls not added to the frontier yet.
+        __validators: dict[str, tuple[str|None, str|None, str]]
+            ETag, Last-Modified and content hash of the pages fetched, until they are saved in the database.
+        __documents: dict[str, dict[str, str]]
+            Title, h1 and text of the pages parsed, until they are saved in the document store.
+        __lock: threading.Lock
+            Guards the sitemap hosts and urls, validators and documents, written by the threads of crawl_async.
+        __fingerprints: SimHashIndex|None
+            Fingerprints of the pages stored, None if duplicates are stored.
+        __duplicates: int
+            Number of pages not stored because they are duplicates of a stored page.
         """
         self.__seed = start_url
 
@@ -49,6 +102,47 @@ class Crawler():
         self.__crawl_delay = crawl_delay # seconds
         self.__robot_delay = robot_delay # seconds
         self.__timeout_delay = timeout_delay # seconds
+
+        self.__bloom_capacity = bloom_capacity
+        self.__db_batch_size = db_batch_size
+        self.__checkpoint_every = checkpoint_every
+        self.__dedup_distance = dedup_distance
+        self.__frontier = PolitenessScheduler(crawl_delay, make_seen_set(bloom_capacity))
+        self.__http = http_client if http_client is not None else HttpClient(timeout_delay)
+        self.__metrics = metrics if metrics is not None else CrawlMetrics()
+        if self.__http.metrics is None:
+            self.__http.metrics = self.__metrics
+        self.__robots_cache = robots_cache if robots_cache is not None else RobotsCache(robot_delay=robot_delay,
+                                                                                         http_client=self.__http)
+        self.__sitemap_cache = sitemap_cache if sitemap_cache is not None else SitemapCache(self.__robots_cache,
+                                                                                            http_client=self.__http)
+        self.__sitemap_hosts = set()
+        self.__sitemap_urls = {}
+        self.__validators = {}
+        self.__documents = {}
+        self.__lock = threading.Lock()
+        self.__fingerprints = SimHashIndex(dedup_distance) if dedup_distance >= 0 else None
+        self.__duplicates = 0
+
+    @property
+    def http_client(self) -> HttpClient:
+        return self.__http
+
+    @property
+    def metrics(self) -> CrawlMetrics:
+        return self.__metrics
+
+    @property
+    def duplicates(self) -> int:
+        return self.__duplicates
+
+    @property
+    def robots_cache(self) -> RobotsCache:
+        return self.__robots_cache
+
+    @property
+    def sitemap_cache(self) -> SitemapCache:
+        return self.__sitemap_cache
     
 
     def __write_visited_urls(self, urls:list[str], path:str, filename:str) -> None:
@@ -78,39 +172,78 @@ class Crawler():
             for url in urls:
                 file.write(url + '\n')
     
-    def __scan_links_in_page(self, page_url:str) -> (bool, list[str]):
+    def __scan_links_in_page(self, 
+                             page_url:str, 
+                             validators:tuple[str|None, str|None, str|None]|None=None) -> (bool, list[str]|None):
         """Scans page for outgoing links
         
-        Parameter
-        ---------
+        Parameters
+        ----------
         page_url: str
             Url of the page to crawl
+        validators: tuple(str|None, str|None, str|None)|None
+            ETag, Last-Modified and content hash of the page when it was last crawled. If given,
+            the page is requested conditionally and is not parsed again if it did not change.
         
         Returns
         -------
-        tuple(boolean, list)
+        tuple(boolean, list|None)
             First element is True if no exceptions were raised, and in this case the list contains 
-            all outgoing links.
+            all outgoing links, or is None if the page did not change since it was last crawled.
             If first element is False, then the results list is empty
         """
+        etag, last_modified, content_hash = validators or (None, None, None)
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
         try:
             # parse the page
-            with urlopen(page_url, timeout=self.__timeout_delay) as response:
-                content = b''
+            with self.__http.request(page_url, headers) as response:
+                if response.status == 304: # not modified, nothing is downloaded
+                    with self.__lock:
+                        self.__validators[page_url] = (response.headers.get('ETag') or etag,
+                                                       response.headers.get('Last-Modified') or last_modified,
+                                                       content_hash)
+                    return True, None
+
+                # links and text are extracted while the page is downloaded, relative links
+                # are resolved against the url of the page (after redirections)
+                extractor = DocumentExtractor(response.geturl(), response.headers.get_content_charset() or 'utf-8')
+                digest = hashlib.blake2b(digest_size=16)
+                chunks = [] # kept only if the page may be unchanged, to parse it only if it changed
                 while True:
                     chunk = response.read(8192)
                     if not chunk:
                         break
-                    content += chunk
-
-                html = content
-            soup = BeautifulSoup(html, 'html.parser')
+                    digest.update(chunk)
+                    if content_hash is None:
+                        with self.__metrics.timer('parse'):
+                            extractor.feed_bytes(chunk)
+                    else:
+                        chunks.append(chunk)
+
+                with self.__lock:
+                    self.__validators[page_url] = (response.headers.get('ETag'),
+                                                   response.headers.get('Last-Modified'),
+                                                   digest.hexdigest())
+                if digest.hexdigest() == content_hash: # same content, no need to parse it again
+                    return True, None
+
+                with self.__metrics.timer('parse'):
+                    for chunk in chunks:
+                        extractor.feed_bytes(chunk)
+                    extractor.close()
+                with self.__lock:
+                    self.__documents[page_url] = extractor.document
 
             # list all outgoing links from page and remove duplicates
             # dont consider '#' (section) and other formats (tel etc)
-            outgoing_links = [a['href'] for a in soup.find_all('a', href=True) 
-                              if a['href'].startswith('http') and ' ' not in a['href']
-                              and a['href'].endswith(('.html', '.htm', '/'))]
+            outgoing_links = [link for link in extractor.links
+                              if link.startswith('http') and ' ' not in link
+                              and link.endswith(('.html', '.htm', '/'))]
             outgoing_links = list(set(outgoing_links))
 
             return True, outgoing_links
@@ -121,6 +254,9 @@ class Crawler():
         except TimeoutError:
             print(f"Timeout occurred. Connection timed out after {self.__timeout_delay} seconds.")
             return False, []
+        except ValueError as e: # page larger than the maximum body size
+            print(f"Error reading the page: {e}")
+            return False, []
         except IncompleteRead as e:
             print(f"IncompleteRead error: {e}")
             # Handle the error by retrying the request or any other appropriate action
@@ -140,130 +276,98 @@ class Crawler():
         boolean
             True if page is crawlable, False otherwise1;
         """
-        # parsing the url to retrieve the home page url
-        try:
-            parsed_url = urlparse(page_url)
-            home_page_url = parsed_url.scheme+'://'+parsed_url.netloc
-
-            # instanciating the robots.txt file parser
-            rp = RobotFileParser()
-            rp.set_url(os.path.join(home_page_url, "robots.txt"))
-
-            try: 
-                socket.setdefaulttimeout(self.__timeout_delay)
-                rp.read()
-                # returns True if page is crawlable, False otherwise
-                return rp.can_fetch("*", page_url)
-            except BadStatusLine as e:
-                print(f"BadStatusLine error: {e}")
-                return False
-            except (URLError, socket.timeout) as e:
-                print(f"Error fetching robots.txt: {e}")
-                return False
-        except URLError as e:
-            print(f"URLError: {e}")
+        # the robots.txt is only downloaded if it is not already in the cache
+        with self.__metrics.timer('robots'):
+            rp = self.__robots_cache.get(page_url)
+        if rp is None: # robots.txt could not be fetched
             return False
+
+        # honor the Crawl-delay of the website if it asks for a longer delay
+        self.__frontier.set_crawl_delay(page_url, rp.crawl_delay("*"))
+        # returns True if page is crawlable, False otherwise
+        return rp.can_fetch("*", page_url)
     
-    def __get_sitemaps(self, url:str) -> (list[str]|None):
-        """Get sitemaps from a website, returns None if not sitemap is exposed
+    def __scan_urls_from_sitemap(self, url:str) -> (bool, list[str]):
+        """Get urls of pages exposed by sitemaps for the whole website.
+        Sitemaps are read from the sitemap cache, so they are not downloaded and parsed for every page.
 
         Parameters
         ----------
         url: str
-            Website URL.
-        
-        Returns
-        -------
-        list[str]
-            List of sitemaps of the website, None if there are no sitemaps.
-        """
-
-        parsed_url = urlparse(url)
-        home_page_url = parsed_url.scheme+'://'+parsed_url.netloc
-        rp = RobotFileParser()
-        rp.set_url(os.path.join(home_page_url,"robots.txt"))
-        rp.read()
-
-        return rp.site_maps() # None if no sitemaps
-
-    def __scan_sitemap(self, sitemap:str) -> list[str]:
-        """Scans a sitemap and returns all pages exposed by the sitemap (if they can be crawled)
-
-        Parameters
-        ----------
-        sitemap: str
-            URL of a sitemap
+            Url of website.
         
         Returns
         -------
-        list[str]
-            List of URLs of html pages exposed in the sitemap, empty list if error raised.
+        tuple(boolean, list)
+            First element is True if the sitemaps of the website could be read (the website may
+            expose no page in its sitemaps), and in this case the list contains all exposed URLs
+            which can be crawled.
         """
         try:
-            with urlopen(sitemap) as response:
-                xml_content = response.read()
+            with self.__metrics.timer('sitemap'):
+                urls = self.__sitemap_cache.urls(url)
+            if urls is None: # a sitemap could not be fetched
+                return False, []
 
-            soup = BeautifulSoup(xml_content, 'xml')
+            # only keep html pages
+            cleaned_urls = [url for url in urls if url.startswith('http') and ' ' not in url
+                            and url.endswith(('.html', '.htm', '/'))]
 
-            urls = [loc.text.strip() for loc in soup.find_all('loc') if loc.text.endswith(('.html', '.htm', '/'))]            
-            return urls
-        
+            # only keep urls which can be crawled
+            with self.__metrics.timer('robots'):
+                cleaned_urls_ok = [url for url in cleaned_urls if self.__robots_cache.can_fetch(url)]
+
+            return True, cleaned_urls_ok
+            
         except URLError as e:
-            print(f"Error fetching sitemap: {e}")
-            return []
+            print(f"URLError: {e}")
+            return False, []
 
-    def __scan_urls_from_sitemap(self, url:str) -> (bool, list[str]):
-        """Get urls of pages exposed by sitemaps for the whole website
+    def __take_sitemap_urls(self, url:str) -> list[str]:
+        """Get the next urls exposed by the sitemaps of the website of url to add to the frontier.
+
+        Sitemaps are scanned for the first page crawled of each website, and scanned again for
+        the next page if they could not be read. Their urls are then fed to the frontier at most
+        self.__max_urls_per_page at a time, for each page of the website crawled, so that a large
+        sitemap does not fill the frontier at once. The website is done once all its sitemap
+        urls were fed.
 
         Parameters
         ----------
-        urls: list[str]
-            Url of website.
-        
+        url: str
+            URL of the page crawled.
+
         Returns
         -------
         list[str]
-            List of all exposed URLs in the website.
+            URLs exposed by the sitemaps to add to the frontier, which can all be crawled.
         """
-        try:
-            # get all sitemaps from website
-            sitemaps = self.__get_sitemaps(url)
-            time.sleep(self.__robot_delay) 
-
-
-            parsed_url = urlparse(url)
-            home_page_url = parsed_url.scheme+'://'+parsed_url.netloc
-
-            # instanciating the robots.txt file parser
-            rp = RobotFileParser()
-            rp.set_url(os.path.join(home_page_url, "robots.txt"))
-
-            if sitemaps:
-                result_urls = set()
-
-                for sitemap in [st for st in sitemaps if st.startswith('http')]:
-                    urls = self.__scan_sitemap(sitemap)
-
-                    # remove previously scanned sitemaps from urls
-                    cleaned_urls = [url for url in urls if url not in sitemaps and url.startswith('http') and ' ' not in url]
-
-                    # only keep urls which can be crawled
-                    cleaned_urls_ok = [url for url in cleaned_urls if rp.can_fetch('*', url)]
-                    
-                    # add newly found pages to result
-                    result_urls = result_urls.union(set(cleaned_urls_ok))
-
-                return True, list(result_urls)
-            return False, []
-            
-        except URLError as e:
-            print(f"URLError: {e}")
-            return False, []
+        host = PolitenessScheduler.host(url)
+        with self.__lock:
+            if host in self.__sitemap_hosts:
+                return []
+            pending = self.__sitemap_urls.get(host)
+
+        if pending is None:
+            ok, urls = self.__scan_urls_from_sitemap(url)
+            if not ok:
+                return []
+            with self.__lock:
+                # another thread may have scanned the sitemaps of the website at the same time
+                pending = self.__sitemap_urls.setdefault(host, deque(urls))
+
+        with self.__lock:
+            sitemap_urls = [pending.popleft() for _ in range(min(self.__max_urls_per_page, len(pending)))]
+            if not pending:
+                self.__sitemap_hosts.add(host)
+                self.__sitemap_urls.pop(host, None)
+        return sitemap_urls
     
     def __get_links_one_page(self, url:str) -> (list[str]|None):
         """Get list of URL to add to the frontier from the url given.
 
-        Adds up to self.__max_urls_per_page
+        Adds up to self.__max_urls_per_page links of the page, and up to self.__max_urls_per_page
+        crawlable pages exposed by the sitemaps of the website which were not added yet.
 
         Parameters
         ----------
@@ -275,14 +379,15 @@ class Crawler():
         list[str]
             List of URLs to add to the frontier, None if no links.
         """
-        sitemap_urls = self.__scan_urls_from_sitemap(url)[1] # can all be crawled
-        page_outgoing_urls = self.__scan_links_in_page(url)[1] 
-
-        all_urls = list(set(sitemap_urls).union(set(page_outgoing_urls)))
+        sitemap_urls = self.__take_sitemap_urls(url) # can all be crawled
+        ok, page_outgoing_urls = self.__scan_links_in_page(url)
+        self.__metrics.record_page(url, ok)
 
-        all_urls = [url for url in all_urls if url.startswith('http') and ' ' not in url]
+        sitemap_urls_set = set(sitemap_urls)
+        all_urls = [url for url in set(page_outgoing_urls) 
+                    if url.startswith('http') and ' ' not in url and url not in sitemap_urls_set]
 
-        if len(all_urls)==0:
+        if len(all_urls)==0 and len(sitemap_urls)==0:
             return None
 
         ok_urls = []
@@ -290,157 +395,614 @@ class Crawler():
 
         # get list of ok urls of max(len) = self.max_urls_per_page 
         while len(ok_urls)<self.__max_urls_per_page and tested_urls<len(all_urls):
-            if all_urls[tested_urls] in sitemap_urls: # already checked that those are crawlable
+            if self.__is_crawlable(all_urls[tested_urls]):
                 ok_urls.append(all_urls[tested_urls])
-            elif self.__is_crawlable(all_urls[tested_urls]):
-                ok_urls.append(all_urls[tested_urls])
-                time.sleep(self.__robot_delay)
             tested_urls+=1
 
-        return ok_urls
+        return sitemap_urls + ok_urls
+
+    def __take_page(self, url:str) -> (tuple[str|None, str|None, str|None], dict[str, str]|None):
+        """Returns and forgets the validators and the document of a crawled page"""
+        with self.__lock:
+            return self.__validators.pop(url, (None, None, None)), self.__documents.pop(url, None)
+
+    def __store_document(self, store:DocumentStore|None, url:str, document:dict[str, str]|None) -> None:
+        """Saves the text of a crawled page in the document store, if any, unless the page
+        is an exact or near duplicate of a page already stored"""
+        if store is None or document is None:
+            return
+
+        if self.__fingerprints is not None:
+            fingerprint = simhash(' '.join((document['title'], document['h1'], document['content'])))
+            if fingerprint is not None:
+                duplicate = self.__fingerprints.add_if_new(url, fingerprint)
+                if duplicate is not None:
+                    print(f"Duplicate of {duplicate}, not stored: {url}")
+                    self.__duplicates += 1
+                    return
+
+        store.add(url, document['title'], document['h1'], document['content'])
+
+    def __open_crawl(self, db:CrawlDatabase, tablename:str, resume:bool) -> (str, dict|None):
+        """Creates the table of a new crawl, or finds the table of the crawl to resume
+        and loads its last checkpoint.
+
+        Parameters
+        ----------
+        db: CrawlDatabase
+            Database in which to store the ages and checkpoints.
+        tablename: str
+            Name of the table in the datatabase to store the ages.
+        resume: bool
+            Whether to resume the last crawl saved in tablename.
+
+        Returns
+        -------
+        tuple(str, dict|None)
+            Name of the table used and the checkpoint loaded (see CrawlDatabase.load_checkpoint),
+            None if a new crawl is started.
+        """
+        if resume:
+            resumed_tablename = db.latest_table(tablename)
+            if resumed_tablename is not None:
+                state = db.load_checkpoint(resumed_tablename)
+                with self.__lock:
+                    self.__sitemap_hosts |= state['sitemap_hosts']
+                print(f"Resuming crawl saved in {resumed_tablename}: {len(state['crawled'])} pages already crawled, "
+                      f"{len(state['frontier'])} urls in the frontier.\n")
+                return resumed_tablename, state
+            print(f"No crawl to resume in {tablename}, starting a new crawl...\n")
+
+        return db.create_table(tablename), None
+
+    def __start_frontier(self, state:dict|None) -> set[str]:
+        """Restores the frontier and seen urls of a checkpoint, or adds the seed to the frontier
+        if a new crawl is started, and returns the urls already crawled"""
+        if state is not None:
+            self.__frontier = PolitenessScheduler(self.__crawl_delay, state['seen'])
+            self.__frontier.restore(state['frontier'], state['host_delays'])
+            return state['crawled']
+        self.__frontier.add(self.__seed)
+        return set()
+
+    def __checkpointed_sitemap_hosts(self) -> set[str]:
+        """Copy of the sitemap hosts, which threads of crawl_async may add to during a checkpoint"""
+        with self.__lock:
+            return set(self.__sitemap_hosts)
+
+    def __checkpoint(self, db:CrawlDatabase, tablename:str, in_progress:list[str]) -> None:
+        """Saves the frontier, seen urls and hosts state of the crawl in the database.
 
-    def __db_create_table(self, tablename:str, dbname:str, path:str) -> str:
-        """Create table in database
-        
         Parameters
         ----------
+        db: CrawlDatabase
+            Database in which to store the checkpoint.
         tablename: str
-            Name of the table to create to store the urls and their age.
+            Name of the table of the crawl.
+        in_progress: list[str]
+            Urls taken from the frontier but not crawled yet, saved back in the frontier.
+        """
+        db.checkpoint(tablename,
+                      in_progress + self.__frontier.queued(),
+                      self.__frontier.take_unsaved(),
+                      self.__frontier.seen,
+                      self.__frontier.host_delays(),
+                      self.__checkpointed_sitemap_hosts())
+
+    def crawl(self, 
+              filename:str, 
+              dbname:str, 
+              tablename:str, 
+              path:str, 
+              resume:bool=False, 
+              documents:str|None=None) -> None:
+        """Crawls from the given seed (start url).
+
+        Parameters
+        ----------
+        filename: str
+            Name of file containing the URLs.
         dbname: str
-            Name of the database.
+            Name of the database in which to store the ages.
+        tablename: str
+            Name of the table in the datatabase to store the ages.
         path: str
-            Path of the folder containing the database
+            Path to folder in which the file will be saved.
+        resume: bool
+            If True, the last crawl saved in tablename is continued from its last checkpoint:
+            pages already crawled are not fetched again. Default False.
+        documents: str|None
+            Name of the JSONL file in which to store the text of the crawled pages, None to not store them.
+
+        Returns
+        -------
+        None
         """
-        # connecting to the db
-        con = sqlite3.connect(os.path.join(path,dbname))
-        cur = con.cursor()
-
-        # get list of tables in the database
-        res = cur.execute("SELECT name FROM sqlite_master")
-        tablenames = [name[0] for name in res.fetchall()]
-
-        # useful if table does not already exists
-        new_tablename = tablename
-
-        # if table already exists
-        if tablename in tablenames:
-            ind = 1
-            new_tablename = tablename + '_' + str(ind)
-
-            # increase until no table matches the name
-            while new_tablename in tablenames:
-                ind += 1
-                new_tablename = tablename + '_' + str(ind)
-            
-            print(f"Table {tablename} already exists in {os.path.join(path,dbname)}. Writing into {new_tablename} instead...\n")
+        # initalise db / ages table, the connection is kept open during the whole crawl
+        db = CrawlDatabase(dbname, path, self.__db_batch_size)
+        tablename, state = self.__open_crawl(db, tablename, resume)
+        store = DocumentStore(documents, path) if documents else None
 
-        # creating the table
-        cur.execute(f"CREATE TABLE {new_tablename}(url TEXT PRIMARY KEY, age INTEGER)")  # Specify column names and types
-        con.commit()
+        crawled = self.__start_frontier(state) # parsed URLs
 
-        cur.close()
-        con.close()
+        # the frontier hands out urls whose host can be requested again (per host politeness)
+        frontier = self.__frontier
+        in_progress = []
 
-        return new_tablename # in case the tablename changed, to insert the urls later on
+        try:
+            while frontier and len(crawled)<self.__max_urls_crawled:
+
+                # we will crawl the first url of a host which is not cooling down
+                # (only waits if all hosts in the frontier were requested recently)
+                # urls are deduplicated when added, so an url is never crawled twice
+                idle_time = frontier.idle_time
+                current_url = frontier.pop()
+                self.__metrics.add_time('politeness', frontier.idle_time - idle_time)
+                in_progress = [current_url]
+
+                # some verbose to follow the process
+                print(f"[{len(crawled)+1}/{self.__max_urls_crawled}] {current_url}")
+
+                # get list of links from page as well as sitemap
+                # this list contains at most self.__max_urls_per_page elements
+                outgoing_links = self.__get_links_one_page(current_url)
+                validators, document = self.__take_page(current_url)
+
+                if outgoing_links:
+                    frontier.extend(outgoing_links)
+                    crawled.add(current_url)
+
+                    # add crawled url to the database, which ages the other urls by 1
+                    with self.__metrics.timer('db'):
+                        db.add_url(current_url, tablename, *validators)
+                    self.__store_document(store, current_url, document)
+                in_progress = []
+
+                # save the state of the crawl regularly so that it can be resumed if interrupted
+                if outgoing_links and len(crawled) % self.__checkpoint_every == 0:
+                    with self.__metrics.timer('db'):
+                        self.__checkpoint(db, tablename, in_progress)
+        finally:
+            self.__checkpoint(db, tablename, in_progress)
+            db.close()
+            if store is not None:
+                store.close()
+        
+        if len(frontier)==0:
+            print("No more links to explore.")
 
+        print(f"Time spent waiting for politeness: {round(frontier.idle_time,2)}s")
 
-    def __db_add_url(self, url:str, tablename:str, dbname:str, path:str) -> None:
-        """Add url to the database and increases the age of URLs already in the databse.
+        # write results
+        self.__write_visited_urls(list(crawled), path, filename)
+
+    async def crawl_async(self, 
+                          filename:str, 
+                          dbname:str, 
+                          tablename:str, 
+                          path:str, 
+                          max_concurrency:int=10, 
+                          resume:bool=False,
+                          documents:str|None=None) -> None:
+        """Crawls from the given seed (start url), fetching several pages at once.
+
+        Pages are downloaded and parsed in a pool of threads so that up to `max_concurrency`
+        pages are being crawled at the same time. Politeness is enforced per host: two pages
+        of the same website are never requested less than self.__crawl_delay seconds (or
+        the Crawl-delay of the website) apart, but pages from different websites do not
+        wait for each other.
 
         Parameters
         ----------
-        url: str
-            URL to add to the database.
-        tablename: str
-            Name of the table to create to store the urls and their age.
+        filename: str
+            Name of file containing the URLs.
         dbname: str
-            Name of the database.
+            Name of the database in which to store the ages.
+        tablename: str
+            Name of the table in the datatabase to store the ages.
         path: str
-            Path of the folder containing the database
+            Path to folder in which the file will be saved.
+        max_concurrency: int
+            Maximum number of pages crawled at the same time, default 10.
+        resume: bool
+            If True, the last crawl saved in tablename is continued from its last checkpoint:
+            pages already crawled are not fetched again. Default False.
+        documents: str|None
+            Name of the JSONL file in which to store the text of the crawled pages, None to not store them.
+
+        Returns
+        -------
+        None
         """
-        # connecting to the db
-        con = sqlite3.connect(os.path.join(path, dbname))
-        cur = con.cursor()
+        # initalise db / ages table, the connection is kept open during the whole crawl
+        db = CrawlDatabase(dbname, path, self.__db_batch_size)
+        tablename, state = self.__open_crawl(db, tablename, resume)
+        store = DocumentStore(documents, path) if documents else None
+        crawled = self.__start_frontier(state) # parsed URLs
+
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+        # the frontier only hands out urls whose host can be requested now, and keeps the host
+        # busy until its page is crawled, so that tasks never wait for their host
+        frontier = self.__frontier
+        in_flight = {} # task -> url being crawled
+
+        async def crawl_one(url:str) -> (str, list[str]|None):
+            try:
+                outgoing_links = await loop.run_in_executor(executor, self.__get_links_one_page, url)
+            except Exception as e:
+                print(f"Error crawling {url}: {e}")
+                outgoing_links = None
+            finally:
+                frontier.release(url)
+            return url, outgoing_links
 
         try:
-            # update ages of urls already in table
-            cur.execute(f"UPDATE {tablename} SET age = age + 1;")
-            con.commit()
-
-            # check if url is already in table
-            query = f"SELECT COUNT(*) FROM {tablename} WHERE url = ?;"
-            cur.execute(query, (url,))
-            already_in = cur.fetchone()[0]>0
-
-            if not already_in:
-                # insert url into table
-                query = f"INSERT INTO {tablename} (url, age) VALUES (?, ?);"
-                con.execute(query, (url, 0))
-                con.commit()
-            else:
-                # set age to 0 if url was already in table
-                query = f"UPDATE {tablename} SET age = 0 WHERE url = ?;"
-                con.execute(query, (url,))
-                con.commit()
-        
-        except Exception as e:
-            print(f"Error: {e}")
+            while True:
+                # schedule pages of the hosts which can be requested, as allowed by the remaining budget
+                while len(in_flight)<max_concurrency and len(crawled)+len(in_flight)<self.__max_urls_crawled:
+                    current_url = frontier.pop_ready()
+                    if current_url is None:
+                        break
+                    print(f"[{len(crawled)+len(in_flight)+1}/{self.__max_urls_crawled}] {current_url}")
+                    in_flight[asyncio.create_task(crawl_one(current_url))] = current_url
+
+                # wake up when a page is crawled, or when another host can be requested
+                can_schedule = len(in_flight)<max_concurrency and len(crawled)+len(in_flight)<self.__max_urls_crawled
+                wait = frontier.wait_time() if can_schedule else None
+                if not in_flight:
+                    if wait is None:
+                        break
+                    # politeness: every host with urls left was requested recently
+                    self.__metrics.add_time('politeness', wait)
+                    await asyncio.sleep(wait)
+                    continue
+
+                done, _ = await asyncio.wait(in_flight.keys(), timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    del in_flight[task]
+                    current_url, outgoing_links = task.result()
+                    validators, document = self.__take_page(current_url)
+
+                    if outgoing_links:
+                        frontier.extend(outgoing_links)
+                        crawled.add(current_url)
+
+                        # add crawled url to the database, which ages the other urls by 1
+                        with self.__metrics.timer('db'):
+                            db.add_url(current_url, tablename, *validators)
+                        self.__store_document(store, current_url, document)
+
+                        # save the state of the crawl regularly so that it can be resumed if interrupted
+                        if len(crawled) % self.__checkpoint_every == 0:
+                            with self.__metrics.timer('db'):
+                                self.__checkpoint(db, tablename, list(in_flight.values()))
         finally:
-            cur.close()
-            con.close()
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.__checkpoint(db, tablename, list(in_flight.values()))
+            db.close()
+            if store is not None:
+                store.close()
 
-    def crawl(self, filename:str, dbname:str, tablename:str, path:str) -> None:
-        """Crawls from the given seed (start url).
+        if len(frontier)==0:
+            print("No more links to explore.")
+
+        # write results
+        self.__write_visited_urls(list(crawled), path, filename)
+
+
+    def recrawl(self, filename:str, dbname:str, tablename:str, path:str, documents:str|None=None) -> None:
+        """Crawls again the pages of the last crawl saved in tablename, the oldest first.
+
+        Pages are requested with their ETag and Last-Modified headers (If-None-Match,
+        If-Modified-Since): a page answering 304 Not Modified is not downloaded, and a
+        downloaded page whose content hash did not change is not parsed. Only changed
+        pages are parsed, and the new pages they link to are crawled too, within the
+        limit of self.__max_urls_crawled pages. Refreshed pages get an age of 0.
 
         Parameters
         ----------
         filename: str
-            Name of file containing the URLs.
+            Name of file containing the URLs refreshed.
         dbname: str
-            Name of the database in which to store the ages.
+            Name of the database in which the ages are stored.
         tablename: str
-            Name of the table in the datatabase to store the ages.
+            Name of the table of the crawl to refresh.
         path: str
             Path to folder in which the file will be saved.
+        documents: str|None
+            Name of the JSONL file in which to store the text of the crawled pages, None to not store them.
 
         Returns
         -------
         None
         """
-        # initalise db / ages table
-        tablename = self.__db_create_table(tablename, dbname, path)
+        db = CrawlDatabase(dbname, path, self.__db_batch_size)
+        recrawled_tablename = db.latest_table(tablename)
+        if recrawled_tablename is None:
+            print(f"No crawl to refresh in {tablename}.")
+            db.close()
+            return
+        tablename = recrawled_tablename
+
+        # known pages are not added again to the frontier, the oldest ones are queued to be refreshed
+        known_validators = db.validators(tablename)
+        seen = make_seen_set(self.__bloom_capacity)
+        for url in known_validators:
+            seen.add(url)
+        self.__frontier = PolitenessScheduler(self.__crawl_delay, seen)
+        self.__frontier.restore(list(known_validators)[:self.__max_urls_crawled], {})
+        print(f"Refreshing crawl saved in {tablename}: {len(known_validators)} pages known.\n")
+        store = DocumentStore(documents, path) if documents else None
+
+        frontier = self.__frontier
+        crawled = set() # refreshed or new URLs
+        unchanged = 0
+
+        try:
+            while frontier and len(crawled)<self.__max_urls_crawled:
+                idle_time = frontier.idle_time
+                current_url = frontier.pop()
+                self.__metrics.add_time('politeness', frontier.idle_time - idle_time)
+                print(f"[{len(crawled)+1}/{self.__max_urls_crawled}] {current_url}")
+
+                if not self.__is_crawlable(current_url):
+                    continue
+
+                ok, outgoing_links = self.__scan_links_in_page(current_url, known_validators.get(current_url))
+                self.__metrics.record_page(current_url, ok)
+                validators, document = self.__take_page(current_url)
+                if not ok:
+                    continue
+
+                if outgoing_links is None:
+                    unchanged += 1
+                else:
+                    # pages which were not linked before are crawled too
+                    frontier.extend(outgoing_links[:self.__max_urls_per_page])
+                crawled.add(current_url)
 
-        frontier = [self.__seed]
-        crawled = set() # parsed URLs
+                # the page was checked now, its age goes back to 0
+                with self.__metrics.timer('db'):
+                    db.add_url(current_url, tablename, *validators)
+                self.__store_document(store, current_url, document) # only changed pages are stored again
+        finally:
+            db.close()
+            if store is not None:
+                store.close()
 
-        while frontier and len(crawled)<self.__max_urls_crawled:
+        print(f"{unchanged}/{len(crawled)} pages unchanged since the last crawl.")
+        print(f"Time spent waiting for politeness: {round(frontier.idle_time,2)}s")
 
-            # we will crawl the first url from the frontier
-            current_url = frontier.pop(0) 
+        # write results
+        self.__write_visited_urls(list(crawled), path, filename)
+
+    def crawl_shard(self, 
+                    worker_id:int, 
+                    coordinator:ShardCoordinator, 
+                    filename:str, 
+                    dbname:str, 
+                    tablename:str, 
+                    path:str,
+                    documents:str|None=None) -> None:
+        """Crawls the websites assigned to one worker of a distributed crawl.
+
+        The urls of other websites found in the pages are sent to the worker crawling them,
+        and the urls of the websites of this worker are received from the other workers.
+        The worker stops when the pages crawled by all workers reach self.__max_urls_crawled,
+        or when no worker has urls left to crawl.
 
-            # some verbose to follow the process
-            print(f"[{len(crawled)+1}/{self.__max_urls_crawled}] {current_url}")
+        Parameters
+        ----------
+        worker_id: int
+            Index of the worker.
+        coordinator: ShardCoordinator
+            State shared by the workers.
+        filename: str
+            Name of the file of the worker containing the URLs.
+        dbname: str
+            Name of the database of the worker in which to store the ages.
+        tablename: str
+            Name of the table in the datatabase to store the ages.
+        path: str
+            Path to folder in which the file will be saved.
+        documents: str|None
+            Name of the JSONL file of the worker in which to store the text of the crawled pages,
+            None to not store them.
 
-            # we do not crawl an already crawled page (could be changed later)
-            if current_url in crawled:
-                print("Page already crawled. Moving on...")
-                continue
+        Returns
+        -------
+        None
+        """
+        db = CrawlDatabase(dbname, path, self.__db_batch_size)
+        tablename = db.create_table(tablename)
+        store = DocumentStore(documents, path) if documents else None
 
-            # get list of links from page as well as sitemap
-            # this list contains at most self.__max_urls_per_page elements
-            outgoing_links = self.__get_links_one_page(current_url)
+        frontier = self.__frontier
+        crawled = [] # parsed URLs
+        waiting = False # whole budget booked, waiting for pages of other workers which may give it back
 
-            if outgoing_links:
-                frontier.extend(outgoing_links)
-                crawled.add(current_url)
+        try:
+            while True:
+                # urls of the websites of this worker found by the other workers
+                frontier.extend(coordinator.receive(worker_id, timeout=0 if frontier and not waiting else 0.1))
 
-                # add crawled url to the database + increment other url's age by 1
-                self.__db_add_url(current_url, tablename, dbname, path)
+                if not frontier:
+                    if coordinator.idle(worker_id):
+                        break
+                    continue
 
-            time.sleep(self.__crawl_delay)
-        
-        if len(frontier)==0:
-            print("No more links to explore.")
+                # pages being crawled by other workers may still fail and give their budget back
+                waiting = not coordinator.reserve(worker_id)
+                if waiting:
+                    if coordinator.idle(worker_id, waiting_for_budget=True):
+                        break
+                    continue
+
+                idle_time = frontier.idle_time
+                current_url = frontier.pop()
+                self.__metrics.add_time('politeness', frontier.idle_time - idle_time)
+                print(f"[worker {worker_id}] {current_url}")
+
+                try:
+                    outgoing_links = self.__get_links_one_page(current_url)
+                except BaseException:
+                    coordinator.release()
+                    raise
+                validators, document = self.__take_page(current_url)
+
+                if outgoing_links:
+                    coordinator.confirm()
+                    frontier.extend(coordinator.send(outgoing_links, worker_id))
+                    crawled.append(current_url)
+
+                    # sequence numbers are shared by the workers, so that the ages can be merged
+                    with self.__metrics.timer('db'):
+                        db.add_url(current_url, tablename, *validators, seq=coordinator.next_seq())
+                    self.__store_document(store, current_url, document)
+                else:
+                    coordinator.release()
+        finally:
+            coordinator.add_duplicates(self.__duplicates)
+            db.close()
+            if store is not None:
+                store.close()
+
+        http_stats = self.__http.stats
+        print(f"[worker {worker_id}] {len(crawled)} pages crawled, {self.__duplicates} duplicates not stored, "
+              f"{http_stats['requests']} requests, "
+              f"{http_stats['connections_reused']} connections reused, "
+              f"{round(frontier.idle_time,2)}s waiting for politeness")
+
+        self.__write_visited_urls(crawled, path, filename)
+
+    @staticmethod
+    def __remove_worker_files(worker_files:list[tuple[str, str, str|None]], path:str) -> None:
+        """Removes the urls files, databases and document stores of the workers of a distributed crawl"""
+        for worker_filename, worker_dbname, worker_documents in worker_files:
+            for name in (worker_filename, worker_dbname, worker_dbname+'-wal', worker_dbname+'-shm', worker_documents):
+                if name is not None and os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+
+    def crawl_distributed(self, 
+                          filename:str, 
+                          dbname:str, 
+                          tablename:str, 
+                          path:str, 
+                          nb_processes:int=4,
+                          documents:str|None=None) -> None:
+        """Crawls from the given seed (start url) with several processes.
+
+        Each website is assigned to one process by hashing its host, so that politeness is
+        respected without the processes having to agree on when to request a website.
+        Processes send each other the urls they find through queues. Each process writes its
+        own urls file, database and document store, which are merged at the end.
+
+        The processes do not share the caches of this crawler, each one uses its own. Each one
+        also has its own metrics, written to the files of the metrics of this crawler suffixed
+        with the index of the worker.
+
+        Parameters
+        ----------
+        filename: str
+            Name of file containing the URLs.
+        dbname: str
+            Name of the database in which to store the ages.
+        tablename: str
+            Name of the table in the datatabase to store the ages.
+        path: str
+            Path to folder in which the file will be saved.
+        nb_processes: int
+            Number of worker processes, default 4.
+        documents: str|None
+            Name of the JSONL file in which to store the text of the crawled pages, None to not store them.
+
+        Returns
+        -------
+        None
+        """
+        db = CrawlDatabase(dbname, path, self.__db_batch_size)
+        tablename = db.create_table(tablename)
+
+        context = multiprocessing.get_context('spawn')
+        coordinator = ShardCoordinator(nb_processes, self.__max_urls_crawled, context)
+        coordinator.send([self.__seed])
+
+        settings = {'start_url': self.__seed,
+                    'max_urls_crawled': self.__max_urls_crawled,
+                    'max_urls_per_page': self.__max_urls_per_page,
+                    'crawl_delay': self.__crawl_delay,
+                    'robot_delay': self.__robot_delay,
+                    'timeout_delay': self.__timeout_delay,
+                    'bloom_capacity': self.__bloom_capacity,
+                    'db_batch_size': self.__db_batch_size,
+                    'dedup_distance': self.__dedup_distance}
+        http_settings = {'timeout_delay': self.__http.timeout_delay,
+                         'max_connections_per_host': self.__http.max_connections_per_host,
+                         'max_body_size': self.__http.max_body_size,
+                         'max_redirects': self.__http.max_redirects,
+                         'user_agent': self.__http.user_agent}
+
+        worker_files = [(f"{filename}.worker{i}", f"{dbname}.worker{i}", f"{documents}.worker{i}" if documents else None)
+                        for i in range(nb_processes)]
+        metrics_settings = [{'json_file': f"{self.__metrics.json_file}.worker{i}" if self.__metrics.json_file else None,
+                             'prometheus_file': (f"{self.__metrics.prometheus_file}.worker{i}"
+                                                 if self.__metrics.prometheus_file else None),
+                             'dump_every': self.__metrics.dump_every}
+                            for i in range(nb_processes)]
+        self.__remove_worker_files(worker_files, path) # left by an interrupted crawl
+        workers = [context.Process(target=_crawl_shard_process,
+                                   args=(i, coordinator, settings, http_settings, metrics_settings[i],
+                                         worker_filename, worker_dbname, tablename, path, worker_documents))
+                   for i, (worker_filename, worker_dbname, worker_documents) in enumerate(worker_files)]
+
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        finally:
+            # merge the results of the workers
+            crawled = []
+            store = DocumentStore(documents, path) if documents else None
+            for worker_filename, worker_dbname, worker_documents in worker_files:
+                worker_file = os.path.join(path, worker_filename)
+                if os.path.exists(worker_file):
+                    with open(worker_file, encoding='utf-8') as file:
+                        crawled.extend(line.strip() for line in file if line.strip())
+
+                worker_db = os.path.join(path, worker_dbname)
+                if os.path.exists(worker_db):
+                    db.merge(tablename, worker_db)
+
+                if store is not None and os.path.exists(os.path.join(path, worker_documents)):
+                    store.merge(os.path.join(path, worker_documents))
+            self.__remove_worker_files(worker_files, path)
+            db.close()
+            if store is not None:
+                store.close()
+
+        self.__duplicates = coordinator.duplicates
+        print(f"{len(crawled)} pages crawled by {nb_processes} processes.")
 
         # write results
-        self.__write_visited_urls(list(crawled), path, filename)
\ No newline at end of file
+        self.__write_visited_urls(crawled, path, filename)
+
+
+def _crawl_shard_process(worker_id:int, 
+                         coordinator:ShardCoordinator, 
+                         settings:dict, 
+                         http_settings:dict, 
+                         metrics_settings:dict, 
+                         filename:str, 
+                         dbname:str, 
+                         tablename:str, 
+                         path:str,
+                         documents:str|None) -> None:
+    """Entry point of a worker process of Crawler.crawl_distributed"""
+    metrics = CrawlMetrics(**metrics_settings)
+    crawler = Crawler(**settings, http_client=HttpClient(**http_settings, metrics=metrics), metrics=metrics)
+    crawler.crawl_shard(worker_id, coordinator, filename, dbname, tablename, path, documents)
+    metrics.dump()
@@ -0,0 +1,332 @@
+"""
+SQLite database storing the crawled urls and their age
+"""
+import os
+import re
+import sqlite3
+
+from .frontier import BloomFilter
+
+class CrawlDatabase():
+
+    def __init__(self, dbname:str, path:str, batch_size:int=50) -> None:
+        """One connection is kept open for the whole crawl, and urls are written by batches.
+
+        The age of an url is not stored: each crawled url gets the next crawl sequence number,
+        and its age is the number of urls crawled after it (max(seq) - seq). Adding an url is
+        then a single upsert instead of an update of every row of the table.
+
+        The ETag, Last-Modified and content hash of each page are stored next to its sequence
+        number, so that a later crawl can request it conditionally.
+
+        Attributes
+        ----------
+        __dbname: str
+            Name of the database.
+        __path: str
+            Path of the folder containing the database.
+        __batch_size: int
+            Number of urls buffered before being written in one transaction, default = 50.
+        __con: sqlite3.Connection
+            Connection to the database, opened in WAL mode.
+        __pending: dict[str, list[tuple[str, int, str|None, str|None, str|None]]]
+            For each table, (url, seq, etag, last_modified, content_hash) rows not written yet.
+        __seq: dict[str, int]
+            For each table, last crawl sequence number given.
+        """
+        self.__dbname = dbname
+        self.__path = path
+        self.__batch_size = batch_size
+
+        self.__con = sqlite3.connect(os.path.join(path, dbname))
+        self.__con.execute("PRAGMA journal_mode=WAL")
+        self.__con.execute("PRAGMA synchronous=NORMAL")
+
+        self.__pending = {}
+        self.__seq = {}
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        return self.__con
+
+    @staticmethod
+    def seq_table(tablename:str) -> str:
+        """Name of the table storing the crawl sequence numbers, tablename being the view of ages"""
+        return tablename + '_seq'
+
+    def __names(self) -> set[str]:
+        """Names of all tables and views of the database"""
+        res = self.__con.execute("SELECT name FROM sqlite_master")
+        return {name[0] for name in res.fetchall()}
+
+    def create_table(self, tablename:str) -> str:
+        """Create table in database
+
+        The urls and their crawl sequence number are stored in tablename+'_seq', and
+        tablename is a view with columns (url, age).
+
+        Parameters
+        ----------
+        tablename: str
+            Name of the table to create to store the urls and their age.
+
+        Returns
+        -------
+        str
+            Name of the table created, a suffix is added if tablename already exists.
+        """
+        names = self.__names()
+
+        # useful if table does not already exists
+        new_tablename = tablename
+
+        # if table already exists
+        if tablename in names or self.seq_table(tablename) in names:
+            ind = 1
+            new_tablename = tablename + '_' + str(ind)
+
+            # increase until no table matches the name
+            while new_tablename in names or self.seq_table(new_tablename) in names:
+                ind += 1
+                new_tablename = tablename + '_' + str(ind)
+
+            print(f"Table {tablename} already exists in {os.path.join(self.__path, self.__dbname)}. Writing into {new_tablename} instead...\n")
+
+        # creating the table and the view computing the ages
+        seq_table = self.seq_table(new_tablename)
+        with self.__con:
+            self.__con.execute(f"CREATE TABLE {seq_table}(url TEXT PRIMARY KEY, seq INTEGER, "
+                               "etag TEXT, last_modified TEXT, content_hash TEXT)")
+            self.__con.execute(f"CREATE INDEX {seq_table}_seq_idx ON {seq_table}(seq)")
+            self.__con.execute(f"CREATE VIEW {new_tablename} AS "
+                               f"SELECT url, (SELECT MAX(seq) FROM {seq_table}) - seq AS age FROM {seq_table}")
+
+        return new_tablename # in case the tablename changed, to insert the urls later on
+
+    def __add_validator_columns(self, tablename:str) -> None:
+        """Adds the etag, last_modified and content_hash columns to tables created without them"""
+        seq_table = self.seq_table(tablename)
+        columns = {row[1] for row in self.__con.execute(f"PRAGMA table_info({seq_table})")}
+        with self.__con:
+            for column in ('etag', 'last_modified', 'content_hash'):
+                if column not in columns:
+                    self.__con.execute(f"ALTER TABLE {seq_table} ADD COLUMN {column} TEXT")
+
+    def __next_seq(self, tablename:str) -> int:
+        if tablename not in self.__seq:
+            res = self.__con.execute(f"SELECT MAX(seq) FROM {self.seq_table(tablename)}")
+            self.__seq[tablename] = res.fetchone()[0] or 0
+        self.__seq[tablename] += 1
+        return self.__seq[tablename]
+
+    def add_url(self, 
+                url:str, 
+                tablename:str, 
+                etag:str|None=None, 
+                last_modified:str|None=None, 
+                content_hash:str|None=None,
+                seq:int|None=None) -> None:
+        """Add url to the database with age 0, which ages the urls already in the table by 1.
+        Written to the database once batch_size urls are waiting.
+
+        Parameters
+        ----------
+        url: str
+            URL to add to the database.
+        tablename: str
+            Name of the table returned by create_table.
+        etag: str|None
+            ETag header of the page, if any.
+        last_modified: str|None
+            Last-Modified header of the page, if any.
+        content_hash: str|None
+            Hash of the content of the page, if known.
+        seq: int|None
+            Crawl sequence number of the url, the next one of the table if None. Given by the
+            workers of a distributed crawl, so that their tables can be merged.
+        """
+        seq = seq if seq is not None else self.__next_seq(tablename)
+        self.__pending.setdefault(tablename, []).append((url, seq, etag, last_modified, content_hash))
+        if len(self.__pending[tablename]) >= self.__batch_size:
+            self.flush(tablename)
+
+    def __write_pending(self, tablename:str) -> None:
+        """Writes waiting urls of a table, inside the current transaction"""
+        rows = self.__pending.pop(tablename, [])
+        if rows:
+            self.__con.executemany(f"INSERT INTO {self.seq_table(tablename)} "
+                                   "(url, seq, etag, last_modified, content_hash) VALUES (?, ?, ?, ?, ?) "
+                                   "ON CONFLICT(url) DO UPDATE SET seq = excluded.seq, etag = excluded.etag, "
+                                   "last_modified = excluded.last_modified, content_hash = excluded.content_hash",
+                                   rows)
+
+    def flush(self, tablename:str|None=None) -> None:
+        """Writes waiting urls in a single transaction, for one table or for all of them"""
+        tablenames = [tablename] if tablename is not None else list(self.__pending)
+        for name in tablenames:
+            try:
+                with self.__con:
+                    self.__write_pending(name)
+            except sqlite3.Error as e:
+                print(f"Error: {e}")
+
+    def merge(self, tablename:str, dbfile:str) -> None:
+        """Adds the urls of the same table of another database, keeping their sequence numbers.
+        Used to gather the tables of the workers of a distributed crawl.
+
+        Parameters
+        ----------
+        tablename: str
+            Name of the table returned by create_table, in both databases.
+        dbfile: str
+            Path of the other database.
+        """
+        self.flush(tablename)
+        seq_table = self.seq_table(tablename)
+        self.__con.execute("ATTACH DATABASE ? AS other", (dbfile,))
+        try:
+            with self.__con:
+                self.__con.execute(f"INSERT INTO {seq_table} (url, seq, etag, last_modified, content_hash) "
+                                   f"SELECT url, seq, etag, last_modified, content_hash FROM other.{seq_table} WHERE true "
+                                   "ON CONFLICT(url) DO UPDATE SET seq = excluded.seq, etag = excluded.etag, "
+                                   "last_modified = excluded.last_modified, content_hash = excluded.content_hash "
+                                   f"WHERE excluded.seq > {seq_table}.seq")
+        except sqlite3.Error as e:
+            print(f"Error while merging {dbfile}: {e}")
+        finally:
+            self.__con.execute("DETACH DATABASE other")
+        self.__seq.pop(tablename, None) # sequence numbers changed
+
+    def latest_table(self, tablename:str) -> str|None:
+        """Returns the most recent table created by create_table from tablename, None if there is none"""
+        names = self.__names()
+        candidates = [name for name in names
+                      if re.fullmatch(re.escape(tablename) + r'(_\d+)?', name) and self.seq_table(name) in names]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda name: int(name[len(tablename)+1:] or 0))
+
+    def __create_checkpoint_tables(self, tablename:str) -> None:
+        self.__con.execute(f"CREATE TABLE IF NOT EXISTS {tablename}_frontier(url TEXT)")
+        self.__con.execute(f"CREATE TABLE IF NOT EXISTS {tablename}_seen(url TEXT PRIMARY KEY)")
+        self.__con.execute(f"CREATE TABLE IF NOT EXISTS {tablename}_hosts"
+                           "(host TEXT PRIMARY KEY, crawl_delay REAL, sitemap_done INTEGER)")
+        self.__con.execute(f"CREATE TABLE IF NOT EXISTS {tablename}_state(key TEXT PRIMARY KEY, value BLOB)")
+
+    def checkpoint(self,
+                   tablename:str,
+                   frontier:list[str],
+                   new_seen:list[str],
+                   seen:set|BloomFilter,
+                   host_delays:dict[str, float],
+                   sitemap_hosts:set[str]) -> None:
+        """Saves the state of the crawl in a single transaction, along with the waiting urls,
+        so that the crawl can be resumed from there.
+
+        Parameters
+        ----------
+        tablename: str
+            Name of the table returned by create_table.
+        frontier: list[str]
+            Urls waiting to be crawled, replaces the previously saved frontier.
+        new_seen: list[str]
+            Urls seen since the previous checkpoint (only saved if seen is a set).
+        seen: set|BloomFilter
+            All urls seen, saved as a whole if it is a Bloom filter.
+        host_delays: dict[str, float]
+            Delays of the hosts asking for a longer delay than the default one.
+        sitemap_hosts: set[str]
+            Hosts whose sitemap urls were already added to the frontier.
+        """
+        try:
+            with self.__con:
+                self.__create_checkpoint_tables(tablename)
+                self.__write_pending(tablename)
+
+                self.__con.execute(f"DELETE FROM {tablename}_frontier")
+                self.__con.executemany(f"INSERT INTO {tablename}_frontier (url) VALUES (?)",
+                                       [(url,) for url in frontier])
+
+                if isinstance(seen, BloomFilter):
+                    self.__con.execute(f"INSERT OR REPLACE INTO {tablename}_state (key, value) VALUES ('bloom', ?)",
+                                       (seen.to_bytes(),))
+                else:
+                    self.__con.executemany(f"INSERT OR IGNORE INTO {tablename}_seen (url) VALUES (?)",
+                                           [(url,) for url in new_seen])
+
+                self.__con.execute(f"DELETE FROM {tablename}_hosts")
+                self.__con.executemany(f"INSERT INTO {tablename}_hosts (host, crawl_delay, sitemap_done) VALUES (?, ?, ?)",
+                                       [(host, host_delays.get(host), host in sitemap_hosts)
+                                        for host in set(host_delays) | set(sitemap_hosts)])
+        except sqlite3.Error as e:
+            print(f"Error while saving checkpoint: {e}")
+
+    def load_checkpoint(self, tablename:str) -> dict:
+        """Loads the last checkpoint of a crawl.
+
+        Parameter
+        ---------
+        tablename: str
+            Name of the table of the crawl.
+
+        Returns
+        -------
+        dict
+            Keys are 'crawled' (set of crawled urls), 'frontier' (list of waiting urls), 'seen'
+            (set or BloomFilter of seen urls), 'host_delays' (dict) and 'sitemap_hosts' (set).
+        """
+        with self.__con:
+            self.__create_checkpoint_tables(tablename)
+        self.__add_validator_columns(tablename)
+
+        crawled = set(self.ages(tablename))
+        frontier = [row[0] for row in self.__con.execute(f"SELECT url FROM {tablename}_frontier ORDER BY rowid")]
+
+        bloom = self.__con.execute(f"SELECT value FROM {tablename}_state WHERE key = 'bloom'").fetchone()
+        if bloom is not None:
+            seen = BloomFilter.from_bytes(bloom[0])
+        else:
+            seen = {row[0] for row in self.__con.execute(f"SELECT url FROM {tablename}_seen")}
+        for url in crawled:
+            seen.add(url)
+
+        hosts = self.__con.execute(f"SELECT host, crawl_delay, sitemap_done FROM {tablename}_hosts").fetchall()
+        host_delays = {host: delay for host, delay, _ in hosts if delay is not None}
+        sitemap_hosts = {host for host, _, sitemap_done in hosts if sitemap_done}
+
+        return {'crawled': crawled,
+                'frontier': frontier,
+                'seen': seen,
+                'host_delays': host_delays,
+                'sitemap_hosts': sitemap_hosts}
+
+    def validators(self, tablename:str) -> dict[str, tuple[str|None, str|None, str|None]]:
+        """Returns the ETag, Last-Modified and content hash of every url of the table,
+        the oldest urls first.
+
+        Parameter
+        ---------
+        tablename: str
+            Name of the table of the crawl.
+
+        Returns
+        -------
+        dict[str, tuple(str|None, str|None, str|None)]
+            (etag, last_modified, content_hash) of each url, None when unknown.
+        """
+        self.__add_validator_columns(tablename)
+        self.flush(tablename)
+        res = self.__con.execute(f"SELECT url, etag, last_modified, content_hash "
+                                 f"FROM {self.seq_table(tablename)} ORDER BY seq")
+        return {url: (etag, last_modified, content_hash) for url, etag, last_modified, content_hash in res}
+
+    def ages(self, tablename:str) -> dict[str, int]:
+        """Returns the age of every url of the table"""
+        self.flush(tablename)
+        res = self.__con.execute(f"SELECT url, age FROM {tablename}")
+        return dict(res.fetchall())
+
+    def close(self) -> None:
+        """Writes waiting urls and closes the connection"""
+        self.flush()
+        self.__con.close()
@@ -0,0 +1,76 @@
+"""
+Streaming extraction of the links and text of an html page
+"""
+import re
+
+from .linkextractor import LinkExtractor
+
+class DocumentExtractor(LinkExtractor):
+
+    # elements whose text is not displayed
+    SKIPPED_TAGS = {'script', 'style', 'noscript', 'template', 'svg'}
+
+    def __init__(self, base_url:str, encoding:str='utf-8', max_links:int=10000) -> None:
+        """Extracts the links of a page as LinkExtractor does, and collects in the same pass
+        the title, h1 headings and text of the body of the page.
+
+        Attributes
+        ----------
+        __open_tags: dict[str, int]
+            Number of currently open title, h1 and skipped elements.
+        __title: list[str]
+            Text found in the <title> of the page.
+        __h1: list[str]
+            Text found in the <h1> headings of the page.
+        __content: list[str]
+            Text of the page outside of its title, scripts and styles.
+        """
+        super().__init__(base_url, encoding, max_links)
+        self.__open_tags = {'title': 0, 'h1': 0, 'skipped': 0}
+        self.__title = []
+        self.__h1 = []
+        self.__content = []
+
+    @staticmethod
+    def __join(texts:list[str]) -> str:
+        """Joins pieces of text, collapsing whitespaces"""
+        return re.sub(r'\s+', ' ', ''.join(texts)).strip()
+
+    def __separate(self) -> None:
+        """Text on both sides of a tag belongs to different words, text between two tags can
+        however be given in several pieces when the page is parsed by chunks"""
+        self.__content.append(' ')
+        if self.__open_tags['h1']:
+            self.__h1.append(' ')
+
+    @property
+    def document(self) -> dict[str, str]:
+        """Title, h1 headings and text of the body of the page"""
+        return {'title': self.__join(self.__title),
+                'h1': self.__join(self.__h1),
+                'content': self.__join(self.__content)}
+
+    def handle_starttag(self, tag:str, attrs:list[tuple[str, str|None]]) -> None:
+        super().handle_starttag(tag, attrs)
+        self.__separate()
+        if tag in self.SKIPPED_TAGS:
+            self.__open_tags['skipped'] += 1
+        elif tag in self.__open_tags:
+            self.__open_tags[tag] += 1
+
+    def handle_endtag(self, tag:str) -> None:
+        self.__separate()
+        if tag in self.SKIPPED_TAGS:
+            tag = 'skipped'
+        if self.__open_tags.get(tag, 0) > 0:
+            self.__open_tags[tag] -= 1
+
+    def handle_data(self, data:str) -> None:
+        if self.__open_tags['skipped']:
+            return
+        if self.__open_tags['title']:
+            self.__title.append(data)
+        elif self.__open_tags['h1']:
+            self.__h1.append(data)
+        if not self.__open_tags['title']:
+            self.__content.append(data)
@@ -0,0 +1,100 @@
+"""
+Append-only store of the text of the crawled pages, read by the indexer
+"""
+import os
+import json
+
+class DocumentStore():
+
+    def __init__(self, filename:str, path:str, batch_size:int=50) -> None:
+        """Each crawled page is appended to a JSONL file as one line
+        {"id", "url", "title", "h1", "content"}, so that the corpus can be indexed without
+        downloading or parsing the pages again.
+
+        A page gets an id the first time it is stored and keeps it: a page crawled again is
+        appended with the same id, and the last line of an id is the current version of the page.
+
+        Attributes
+        ----------
+        __file: str
+            Path of the JSONL file.
+        __batch_size: int
+            Number of documents buffered before being written, default = 50.
+        __ids: dict[str, int]
+            Id of each url already stored.
+        __pending: list[str]
+            JSON lines not written yet.
+        """
+        self.__file = os.path.join(path, filename)
+        self.__batch_size = batch_size
+        self.__ids = {}
+        self.__pending = []
+
+        if os.path.exists(self.__file):
+            for document in read_documents(self.__file):
+                self.__ids[document['url']] = document['id']
+
+    def __len__(self) -> int:
+        return len(self.__ids)
+
+    @property
+    def filename(self) -> str:
+        return self.__file
+
+    def add(self, url:str, title:str, h1:str, content:str) -> int:
+        """Stores a crawled page, written to the file once batch_size pages are waiting.
+
+        Parameters
+        ----------
+        url: str
+            URL of the page.
+        title: str
+            Title of the page.
+        h1: str
+            Text of the h1 headings of the page.
+        content: str
+            Text of the page.
+
+        Returns
+        -------
+        int
+            Id of the document, the same as before if the page was already stored.
+        """
+        doc_id = self.__ids.setdefault(url, len(self.__ids))
+        self.__pending.append(json.dumps({'id': doc_id, 'url': url, 'title': title, 'h1': h1, 'content': content},
+                                         ensure_ascii=False))
+        if len(self.__pending) >= self.__batch_size:
+            self.flush()
+        return doc_id
+
+    def merge(self, filename:str) -> int:
+        """Adds the documents of another store (e.g. of a worker of a distributed crawl),
+        returns the number of documents added"""
+        documents = read_documents(filename)
+        for document in documents:
+            self.add(document['url'], document['title'], document['h1'], document['content'])
+        return len(documents)
+
+    def flush(self) -> None:
+        """Appends waiting documents to the file"""
+        if self.__pending:
+            with open(self.__file, 'a', encoding='utf-8') as file:
+                file.write('\n'.join(self.__pending) + '\n')
+            self.__pending = []
+
+    def close(self) -> None:
+        self.flush()
+
+
+def read_documents(filename:str) -> list[dict]:
+    """Returns the current version of each document of a store, sorted by id.
+    A line left incomplete by an interrupted crawl is ignored."""
+    documents = {}
+    with open(filename, encoding='utf-8') as file:
+        for line in file:
+            try:
+                document = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            documents[document['id']] = document
+    return [documents[doc_id] for doc_id in sorted(documents)]
@@ -0,0 +1,114 @@
+"""
+SimHash fingerprints of documents, to detect exact and near-duplicate pages
+"""
+import re
+import hashlib
+
+from collections import Counter
+
+import numpy as np
+
+def shingles(text:str, size:int=3) -> list[str]:
+    """Returns the sequences of size consecutive words of text (lowercased),
+    the whole text if it has less than size words"""
+    words = re.findall(r'\w+', text.lower())
+    if len(words) <= size:
+        return [' '.join(words)] if words else []
+    return [' '.join(words[i:i+size]) for i in range(len(words)-size+1)]
+
+def simhash(text:str, bits:int=64, shingle_size:int=3) -> int|None:
+    """Computes the SimHash fingerprint of a text: texts sharing most of their shingles
+    have fingerprints differing by a few bits only.
+
+    Parameters
+    ----------
+    text: str
+        Text of the document.
+    bits: int
+        Size of the fingerprint in bits, a multiple of 8 up to 512, default 64.
+    shingle_size: int
+        Number of words of the shingles, default 3.
+
+    Returns
+    -------
+    int|None
+        Fingerprint of the text, None if the text has no words.
+    """
+    counts = Counter(shingles(text, shingle_size))
+    if not counts:
+        return None
+
+    # one row of bits per shingle, each shingle adds its count to the weight of the bits
+    # set in its hash and removes it from the others
+    digests = b''.join(hashlib.blake2b(shingle.encode('utf-8'), digest_size=bits//8).digest() for shingle in counts)
+    hash_bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(counts), bits)
+    weights = np.fromiter(counts.values(), dtype=np.int64, count=len(counts)) @ (2*hash_bits.astype(np.int64) - 1)
+
+    return int.from_bytes(np.packbits(weights > 0).tobytes(), 'big')
+
+def hamming_distance(fingerprint1:int, fingerprint2:int) -> int:
+    """Number of bits differing between two fingerprints"""
+    return bin(fingerprint1 ^ fingerprint2).count('1')
+
+
+class SimHashIndex():
+
+    def __init__(self, max_distance:int=3, bits:int=64) -> None:
+        """Finds the fingerprints close to a given fingerprint without comparing it to all of them.
+
+        Fingerprints are split into max_distance+1 bands of bits: two fingerprints differing
+        by at most max_distance bits have at least one identical band, so only the fingerprints
+        sharing a band with the searched one are compared.
+
+        Attributes
+        ----------
+        __max_distance: int
+            Maximum number of differing bits for two documents to be duplicates, default = 3.
+        __bands: list[tuple[int, int]]
+            Shift and mask of each band.
+        __tables: list[dict[int, list]]
+            For each band, keys of the fingerprints having each value of the band.
+        __fingerprints: dict
+            Fingerprint of each key added.
+        """
+        self.__max_distance = max_distance
+
+        nb_bands = max_distance + 1
+        band_size = bits // nb_bands
+        self.__bands = []
+        for band in range(nb_bands):
+            # the last band takes the remaining bits
+            size = band_size if band < nb_bands-1 else bits - band_size*(nb_bands-1)
+            self.__bands.append((band*band_size, (1 << size) - 1))
+
+        self.__tables = [{} for _ in self.__bands]
+        self.__fingerprints = {}
+
+    def __len__(self) -> int:
+        return len(self.__fingerprints)
+
+    def find(self, fingerprint:int):
+        """Returns the key of a fingerprint at most max_distance bits away, None if there is none"""
+        for (shift, mask), table in zip(self.__bands, self.__tables):
+            for key in table.get(fingerprint >> shift & mask, []):
+                if hamming_distance(fingerprint, self.__fingerprints[key]) <= self.__max_distance:
+                    return key
+        return None
+
+    def add(self, key, fingerprint:int) -> None:
+        """Adds the fingerprint of a document"""
+        self.__fingerprints[key] = fingerprint
+        for (shift, mask), table in zip(self.__bands, self.__tables):
+            table.setdefault(fingerprint >> shift & mask, []).append(key)
+
+    def add_if_new(self, key, fingerprint:int):
+        """Adds the fingerprint of a document unless it is a duplicate of a document already added.
+
+        Returns
+        -------
+        Key of the document it duplicates, None if it was added.
+        """
+        duplicate = self.find(fingerprint)
+        if duplicate is None:
+            self.add(key, fingerprint)
+        return duplicate
@@ -0,0 +1,105 @@
+"""
+Helpers for the crawl frontier: url normalization and seen-sets
+"""
+import math
+import struct
+import hashlib
+
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url:str) -> str:
+    """Normalizes an url so that the same page is always represented the same way.
+
+    The scheme and host are lowercased, default ports and fragments are removed and an
+    empty path is replaced by '/'.
+
+    Parameter
+    ---------
+    url: str
+        URL to normalize.
+
+    Returns
+    -------
+    str
+        Normalized URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+
+    netloc = (parts.hostname or '').lower()
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += ':' + str(parts.port)
+    if parts.username:
+        userinfo = parts.username + (':' + parts.password if parts.password else '')
+        netloc = userinfo + '@' + netloc
+
+    path = parts.path or '/'
+    return urlunsplit((scheme, netloc, path, parts.query, ''))
+
+
+class BloomFilter():
+
+    def __init__(self, capacity:int, error_rate:float=0.001) -> None:
+        """Probabilistic set with a fixed memory footprint: an url which was added is always
+        found, an url which was not added is wrongly found with probability error_rate
+        (as long as less than capacity urls were added).
+
+        Attributes
+        ----------
+        __size: int
+            Number of bits of the filter.
+        __nb_hashes: int
+            Number of bits set for each element.
+        __bits: bytearray
+            Bit array of the filter.
+        __count: int
+            Number of elements added.
+        """
+        self.__size = max(8, int(-capacity * math.log(error_rate) / math.log(2)**2))
+        self.__nb_hashes = max(1, round(self.__size / capacity * math.log(2)))
+        self.__bits = bytearray((self.__size + 7) // 8)
+        self.__count = 0
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __positions(self, item:str) -> list[int]:
+        # double hashing: h1 + i*h2 gives nb_hashes independent enough positions
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i*h2) % self.__size for i in range(self.__nb_hashes)]
+
+    def add(self, item:str) -> None:
+        added = False
+        for pos in self.__positions(item):
+            if not self.__bits[pos >> 3] & (1 << (pos & 7)):
+                self.__bits[pos >> 3] |= 1 << (pos & 7)
+                added = True
+        if added:
+            self.__count += 1
+
+    def __contains__(self, item:str) -> bool:
+        return all(self.__bits[pos >> 3] & (1 << (pos & 7)) for pos in self.__positions(item))
+
+    def to_bytes(self) -> bytes:
+        """Serializes the filter, e.g. to checkpoint it in a database"""
+        header = struct.pack('<QQQ', self.__size, self.__nb_hashes, self.__count)
+        return header + bytes(self.__bits)
+
+    @classmethod
+    def from_bytes(cls, data:bytes) -> 'BloomFilter':
+        """Deserializes a filter serialized with to_bytes"""
+        bloom = cls.__new__(cls)
+        bloom.__size, bloom.__nb_hashes, bloom.__count = struct.unpack_from('<QQQ', data)
+        bloom.__bits = bytearray(data[struct.calcsize('<QQQ'):])
+        return bloom
+
+
+def make_seen_set(bloom_capacity:int=0) -> set|BloomFilter:
+    """Returns an exact set if bloom_capacity is 0, a BloomFilter of that capacity otherwise"""
+    if bloom_capacity > 0:
+        return BloomFilter(bloom_capacity)
+    return set()
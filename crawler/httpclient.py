@@ -0,0 +1,333 @@
+"""
+HTTP client keeping connections alive between requests to a same host
+"""
+import ssl
+import time
+import zlib
+import threading
+
+from collections import deque
+from http.client import HTTPConnection, HTTPSConnection, HTTPResponse, HTTPException
+from urllib.parse import urlsplit, urljoin
+from urllib.error import URLError, HTTPError
+
+from .metrics import CrawlMetrics
+
+# brotli is optional, responses are only requested in brotli if it is installed and can bound
+# the size of its output (output_buffer_limit, brotli >= 1.2), for the maximum body size
+try:
+    import brotli
+    brotli.Decompressor().process(b'', output_buffer_limit=1)
+except (ImportError, TypeError):
+    brotli = None
+
+class HttpResponse():
+
+    def __init__(self, url:str, raw:HTTPResponse, connection:HTTPConnection, pool_key:str, client:'HttpClient') -> None:
+        """Response of a request, whose body can be read by chunks.
+        The connection goes back to the pool once the body has been entirely read.
+
+        Attributes
+        ----------
+        url: str
+            URL of the response, after redirections.
+        status: int
+            HTTP status code.
+        headers: http.client.HTTPMessage
+            Headers of the response.
+        """
+        self.url = url
+        self.status = raw.status
+        self.headers = raw.headers
+
+        self.__raw = raw
+        self.__connection = connection
+        self.__pool_key = pool_key
+        self.__client = client
+        self.__read_bytes = 0
+        self.__decoded_bytes = 0
+        self.__done = False
+
+        # the body is decompressed on the fly if the server compressed it, producing at most
+        # max_length bytes for a chunk so that a small compressed body can not fill the memory
+        encoding = (self.headers.get('Content-Encoding') or '').lower()
+        if encoding in ('gzip', 'x-gzip', 'deflate'):
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding != 'deflate' else zlib.MAX_WBITS)
+            self.__decompress, self.__flush = decompressor.decompress, decompressor.flush
+        elif encoding == 'br' and brotli is not None:
+            decompressor = brotli.Decompressor()
+            self.__decompress = lambda data, max_length: decompressor.process(data, output_buffer_limit=max_length)
+            self.__flush = lambda max_length: b''
+        else:
+            self.__decompress, self.__flush = None, None
+
+    def __enter__(self) -> 'HttpResponse':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def geturl(self) -> str:
+        return self.url
+
+    def read(self, amt:int|None=None) -> bytes:
+        """Reads (up to about amt bytes of) the decoded body, b'' once it has been entirely read.
+
+        Raises
+        ------
+        ValueError
+            If the body is larger than the maximum body size of the client.
+        """
+        chunks = []
+        while not self.__done:
+            start = time.perf_counter()
+            try:
+                data = self.__raw.read(amt if amt is not None else 65536)
+            except Exception:
+                self.close()
+                raise
+            finally:
+                if self.__client.metrics is not None:
+                    self.__client.metrics.add_time('download', time.perf_counter() - start)
+
+            if not data:
+                if self.__flush is not None:
+                    chunks.append(self.__decoded(self.__flush(self.__remaining_bytes() + 1)))
+                self.__finish()
+                break
+
+            self.__read_bytes += len(data)
+            self.__client._count_bytes(self.url, len(data))
+            if self.__read_bytes > self.__client.max_body_size:
+                self.close()
+                raise ValueError(f"Response body larger than {self.__client.max_body_size} bytes: {self.url}")
+
+            if self.__decompress is not None:
+                data = self.__decompress(data, self.__remaining_bytes() + 1)
+            chunks.append(self.__decoded(data))
+            if amt is not None and data:
+                break
+        return b''.join(chunks)
+
+    def __remaining_bytes(self) -> int:
+        """Number of decoded bytes which can still be read"""
+        return max(self.__client.max_body_size - self.__decoded_bytes, 0)
+
+    def __decoded(self, data:bytes) -> bytes:
+        """Counts decoded bytes, the body being too large if they exceed the maximum body size"""
+        self.__decoded_bytes += len(data)
+        if self.__decoded_bytes > self.__client.max_body_size:
+            self.close()
+            raise ValueError(f"Decoded response body larger than {self.__client.max_body_size} bytes: {self.url}")
+        return data
+
+    def __finish(self) -> None:
+        """Body entirely read, the connection can be reused unless the server closes it"""
+        self.__done = True
+        reusable = not self.__raw.will_close
+        self.__raw.close()
+        self.__client._release(self.__connection, self.__pool_key, reusable)
+
+    def close(self) -> None:
+        """Closes the response, the connection is dropped if the body was not entirely read"""
+        if self.__done:
+            return
+        if self.__raw.length == 0: # no body (e.g. 304 Not Modified)
+            self.__finish()
+            return
+        self.__done = True
+        self.__raw.close()
+        self.__client._release(self.__connection, self.__pool_key, False)
+
+
+class HttpClient():
+
+    def __init__(self,
+                 timeout_delay:int=5,
+                 max_connections_per_host:int=2,
+                 max_body_size:int=10*1024*1024,
+                 max_redirects:int=5,
+                 user_agent:str='Mozilla/5.0 (compatible; ENSAI-crawler)',
+                 metrics:CrawlMetrics|None=None) -> None:
+        """
+        Attributes
+        ----------
+        timeout_delay: int
+            Time in seconds to wait for a connection or for data, default = 5.
+        max_connections_per_host: int
+            Maximum number of connections opened at the same time to a same host, default = 2.
+        max_body_size: int
+            Maximum size in bytes of a response body, as received and once decompressed, default = 10MB.
+        max_redirects: int
+            Maximum number of redirections followed, default = 5.
+        metrics: CrawlMetrics|None
+            If given, time spent opening connections and downloading, and bytes received per host.
+        __pools: dict[str, deque[HTTPConnection]]
+            Idle connections of each host (scheme://netloc), ready to be reused.
+        __slots: dict[str, threading.BoundedSemaphore]
+            Limit the number of connections in use for each host.
+        __stats: dict[str, int]
+            Number of requests, connections opened, connections reused and bytes received.
+        """
+        self.timeout_delay = timeout_delay # seconds
+        self.max_connections_per_host = max_connections_per_host
+        self.max_body_size = max_body_size
+        self.max_redirects = max_redirects
+        self.user_agent = user_agent
+        self.metrics = metrics
+
+        self.__pools = {}
+        self.__slots = {}
+        self.__lock = threading.Lock()
+        self.__ssl_context = ssl.create_default_context()
+
+        self.__stats = {'requests': 0, 'connections_opened': 0, 'connections_reused': 0, 'bytes_received': 0}
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Number of requests, connections opened, connections reused and bytes received"""
+        with self.__lock:
+            return dict(self.__stats)
+
+    def _count_bytes(self, url:str, nb_bytes:int) -> None:
+        with self.__lock:
+            self.__stats['bytes_received'] += nb_bytes
+        if self.metrics is not None:
+            self.metrics.add_bytes(url, nb_bytes)
+
+    def __acquire(self, key:str, scheme:str, netloc:str) -> HTTPConnection:
+        """Returns an idle connection to the host if any, a new one otherwise"""
+        with self.__lock:
+            if key not in self.__slots:
+                self.__slots[key] = threading.BoundedSemaphore(self.max_connections_per_host)
+                self.__pools[key] = deque()
+            slots = self.__slots[key]
+
+        if not slots.acquire(timeout=self.timeout_delay):
+            raise URLError(f"no connection available to {key} after {self.timeout_delay}s")
+
+        with self.__lock:
+            pool = self.__pools[key]
+            if pool:
+                self.__stats['connections_reused'] += 1
+                return pool.pop()
+            self.__stats['connections_opened'] += 1
+
+        if scheme == 'https':
+            connection = HTTPSConnection(netloc, timeout=self.timeout_delay, context=self.__ssl_context)
+        else:
+            connection = HTTPConnection(netloc, timeout=self.timeout_delay)
+        return connection
+
+    def _release(self, connection:HTTPConnection, key:str, reusable:bool) -> None:
+        """Gives a connection back to the pool of its host, or closes it"""
+        if reusable:
+            with self.__lock:
+                self.__pools[key].append(connection)
+        else:
+            connection.close()
+        self.__slots[key].release()
+
+    def request(self, url:str, headers:dict[str, str]|None=None) -> HttpResponse:
+        """Sends a GET request, following redirections.
+
+        Parameters
+        ----------
+        url: str
+            URL to request.
+        headers: dict[str, str]|None
+            Additional headers, e.g. conditional request headers.
+
+        Returns
+        -------
+        HttpResponse
+            Response with a 2xx or 304 status. The body must be read or the response closed
+            for the connection to be reused.
+
+        Raises
+        ------
+        HTTPError
+            For other statuses than 2xx and 304.
+        URLError
+            If the server could not be reached.
+        """
+        request_headers = {'User-Agent': self.user_agent,
+                           'Accept-Encoding': 'gzip, deflate' + (', br' if brotli is not None else ''),
+                           'Connection': 'keep-alive'}
+        request_headers.update(headers or {})
+
+        for _ in range(self.max_redirects+1):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                raise URLError(f"unsupported scheme: {url}")
+            path = (parts.path or '/') + ('?'+parts.query if parts.query else '')
+
+            response = self.__send(parts.scheme, parts.netloc, path, request_headers, url)
+
+            if response.status in (301, 302, 303, 307, 308) and response.headers.get('Location'):
+                location = response.headers.get('Location')
+                # drain the (small) body of the redirection so that the connection can be reused
+                try:
+                    while response.read(65536):
+                        pass
+                except ValueError:
+                    pass
+                url = urljoin(url, location)
+                continue
+
+            if response.status >= 400 or (response.status >= 300 and response.status != 304):
+                response.close()
+                raise HTTPError(url, response.status, f"HTTP Error {response.status}", response.headers, None)
+            return response
+
+        raise URLError(f"too many redirections: {url}")
+
+    def __send(self, scheme:str, netloc:str, path:str, headers:dict[str, str], url:str) -> HttpResponse:
+        with self.__lock:
+            self.__stats['requests'] += 1
+
+        key = scheme+'://'+netloc
+
+        # a reused connection may have been closed by the server, in which case we retry once
+        for attempt in range(2):
+            connection = self.__acquire(key, scheme, netloc)
+            try:
+                if connection.sock is None: # new connection: dns resolution, tcp (and tls) handshakes
+                    start = time.perf_counter()
+                    try:
+                        connection.connect()
+                    finally:
+                        if self.metrics is not None:
+                            self.metrics.add_time('connect', time.perf_counter() - start)
+
+                start = time.perf_counter()
+                connection.request('GET', path, headers=headers)
+                raw = connection.getresponse()
+                if self.metrics is not None:
+                    self.metrics.add_time('download', time.perf_counter() - start)
+                return HttpResponse(url, raw, connection, key, self)
+            except (HTTPException, ConnectionError) as e:
+                self._release(connection, key, False)
+                if attempt == 1:
+                    raise URLError(e)
+            except OSError as e: # includes timeouts and ssl errors
+                self._release(connection, key, False)
+                raise URLError(e)
+
+    def get(self, url:str, headers:dict[str, str]|None=None) -> bytes:
+        """Returns the whole (decoded) body of url"""
+        with self.request(url, headers) as response:
+            chunks = []
+            while True:
+                chunk = response.read(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return b''.join(chunks)
+
+    def close(self) -> None:
+        """Closes all idle connections"""
+        with self.__lock:
+            for pool in self.__pools.values():
+                while pool:
+                    pool.pop().close()
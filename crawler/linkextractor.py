@@ -0,0 +1,66 @@
+"""
+Streaming extraction of the links of an html page
+"""
+import codecs
+
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urldefrag
+
+class LinkExtractor(HTMLParser):
+
+    def __init__(self, base_url:str, encoding:str='utf-8', max_links:int=10000) -> None:
+        """Extracts the links of a page while it is being downloaded: chunks are given to
+        feed_bytes as they arrive, so the page is never stored in memory nor parsed as a tree.
+
+        Attributes
+        ----------
+        __base_url: str
+            URL against which relative links are resolved, the url of the page or its <base href>.
+        __max_links: int
+            Maximum number of distinct links kept for a page.
+        __decoder: codecs.IncrementalDecoder
+            Decodes chunks of bytes, even if a character is split between two chunks.
+        __links: dict[str, None]
+            Absolute links found so far, without fragments, in order of appearance.
+        """
+        super().__init__(convert_charrefs=True)
+        self.__base_url = base_url
+        self.__max_links = max_links
+
+        try:
+            self.__decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        except LookupError: # unknown charset announced by the server
+            self.__decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+        self.__links = {}
+        self.__base_set = False
+
+    @property
+    def links(self) -> list[str]:
+        """Absolute links found in the page, without duplicates"""
+        return list(self.__links)
+
+    def feed_bytes(self, chunk:bytes) -> None:
+        """Parses a chunk of the page"""
+        self.feed(self.__decoder.decode(chunk))
+
+    def close(self) -> None:
+        self.feed(self.__decoder.decode(b'', final=True))
+        super().close()
+
+    def handle_starttag(self, tag:str, attrs:list[tuple[str, str|None]]) -> None:
+        if tag == 'base' and not self.__base_set:
+            # only the first <base href> of a page is taken into account
+            href = dict(attrs).get('href')
+            if href:
+                self.__base_url = urljoin(self.__base_url, href.strip())
+                self.__base_set = True
+
+        elif tag == 'a' and len(self.__links) < self.__max_links:
+            href = dict(attrs).get('href')
+            if href:
+                try:
+                    link = urldefrag(urljoin(self.__base_url, href.strip()))[0]
+                except ValueError: # malformed url
+                    return
+                self.__links[link] = None
@@ -1,10 +1,16 @@
 """Main to run crawlers"""
 
+import os
 import time
+import asyncio
 import argparse
 
-from minimalcrawler import MinimalCrawler
-from crawler import Crawler
+from .minimalcrawler import MinimalCrawler
+from .crawler import Crawler
+from .robots import RobotsCache
+from .sitemaps import SitemapCache
+from .httpclient import HttpClient
+from .metrics import CrawlMetrics
 
 
 def main():
@@ -35,7 +41,39 @@ def main():
                          type=int)
     parser.add_argument("-td", "--timeout_delay", 
                         default=5,
-                        help="Timeout for urllib.requests.urlopen, in seconds, default 5.",
+                        help="Timeout of HTTP requests, in seconds, default 5.",
+                        type=int)
+    parser.add_argument("-mh", "--max_connections_per_host", 
+                        default=2,
+                        help="Maximum number of connections opened at the same time to a website, default 2.",
+                        type=int)
+    parser.add_argument("-mb", "--max_body_size", 
+                        default=10*1024*1024,
+                        help="Maximum size of a downloaded page, in bytes, default 10485760 (10MB).",
+                        type=int)
+    parser.add_argument("-rt", "--robots_ttl", 
+                        default=3600,
+                        help="Time after which a cached robots.txt is downloaded again, in seconds, default 3600.",
+                        type=int)
+    parser.add_argument("-rs", "--robots_cache_size", 
+                        default=1000,
+                        help="Maximum number of websites whose robots.txt is kept in cache, default 1000.",
+                        type=int)
+    parser.add_argument("-st", "--sitemap_ttl", 
+                        default=3600,
+                        help="Time after which a cached sitemap is revalidated, in seconds, default 3600.",
+                        type=int)
+    parser.add_argument("-bf", "--bloom_capacity", 
+                        default=0,
+                        help="If not 0, seen urls are stored in a Bloom filter sized for this number of urls instead of a set, default 0.",
+                        type=int)
+    parser.add_argument("-bs", "--db_batch_size", 
+                        default=50,
+                        help="Number of crawled urls written to the database in one transaction, default 50.",
+                        type=int)
+    parser.add_argument("-ce", "--checkpoint_every", 
+                        default=10,
+                        help="Number of crawled pages between two checkpoints of the crawl in the database, default 10.",
                         type=int)
     
     # to pass to Crawler.crawl()
@@ -55,14 +93,84 @@ def main():
                         default='webpages_age',
                         help="Name of table in which crawled webpages URLs and their age are saved, default 'webpages_age'.",
                         type=str)
+    parser.add_argument("-ds", "--documents", 
+                        default=None, 
+                        help="JSONL file in which the title, h1 and text of crawled webpages are saved for the indexer, default None (not saved, not available for the minimal crawler).",
+                        type=str)
+    parser.add_argument("-dd", "--dedup_distance", 
+                        default=3,
+                        help="Crawled webpages whose SimHash fingerprint differs by at most this number of bits from a saved webpage are not saved in the documents file, negative to save all webpages, default 3.",
+                        type=int)
+    parser.add_argument("-mf", "--metrics_file", 
+                        default=None,
+                        help="JSON file in which the metrics of the crawl (time per stage, pages and bytes per host) are written regularly, default None (not written).",
+                        type=str)
+    parser.add_argument("-pf", "--prometheus_file", 
+                        default=None,
+                        help="File in which the metrics of the crawl are written regularly in the Prometheus text format, default None (not written).",
+                        type=str)
+    parser.add_argument("-me", "--metrics_every", 
+                        default=10,
+                        help="Time between two writes of the metrics files during the crawl, in seconds, default 10.",
+                        type=float)
     parser.add_argument("-c", "--crawler", 
                         default='normal',
                         help="Crawler to use, default 'normal'.",
                         type=str,
-                        choices=['minimal', 'normal'])
+                        choices=['minimal', 'normal', 'async'])
+    parser.add_argument("-r", "--resume", 
+                        action="store_true",
+                        help="Resume the last crawl saved in the table from its checkpoint (not available for the minimal crawler).")
+    parser.add_argument("-rc", "--recrawl", 
+                        action="store_true",
+                        help="Crawl again the pages of the last crawl saved in the table, the oldest first, with conditional requests (not available for the minimal crawler).")
+    parser.add_argument("-np", "--processes", 
+                        default=1,
+                        help="Number of processes crawling at the same time, each website being crawled by a single process, default 1 (not available for the minimal and async crawlers).",
+                        type=int)
+    parser.add_argument("-w", "--workers", 
+                        default=10,
+                        help="Maximum number of pages crawled at the same time by the async crawler, default 10.",
+                        type=int)
 
     args = parser.parse_args()
 
+    # options which can not be combined are rejected rather than ignored
+    if args.processes < 1:
+        parser.error("--processes must be at least 1")
+    if args.processes > 1 and args.crawler != 'normal':
+        parser.error("--processes is only available for the normal crawler")
+    if args.processes > 1 and (args.resume or args.recrawl):
+        parser.error("--resume and --recrawl are not available with --processes")
+    if args.crawler == 'minimal' and (args.resume or args.recrawl):
+        parser.error("--resume and --recrawl are not available for the minimal crawler")
+    if args.resume and args.recrawl:
+        parser.error("--resume and --recrawl can not be used together")
+
+    # time spent in each stage of the crawl, pages and bytes per host
+    metrics = CrawlMetrics(os.path.join(args.path, args.metrics_file) if args.metrics_file else None,
+                           os.path.join(args.path, args.prometheus_file) if args.prometheus_file else None,
+                           args.metrics_every)
+
+    # one HTTP client for pages, robots.txt and sitemaps, connections are kept alive
+    http_client = HttpClient(args.timeout_delay,
+                             args.max_connections_per_host,
+                             args.max_body_size,
+                             metrics=metrics)
+
+    # robots.txt files are downloaded once per website and kept in cache
+    robots_cache = RobotsCache(args.robots_ttl,
+                               args.robots_cache_size,
+                               args.robot_delay,
+                               args.timeout_delay,
+                               http_client)
+
+    # sitemaps are scanned once per website and revalidated after sitemap_ttl seconds
+    sitemap_cache = SitemapCache(robots_cache,
+                                 args.sitemap_ttl,
+                                 args.timeout_delay,
+                                 http_client=http_client)
+
     # initalize crawler
     if args.crawler == 'minimal':
         crawler = MinimalCrawler(args.seed, 
@@ -70,14 +178,24 @@ def main():
                                  args.max_urls_per_page,
                                  args.crawl_delay,
                                  args.robot_delay,
-                                 args.timeout_delay)
+                                 args.timeout_delay,
+                                 robots_cache,
+                                 http_client)
     else:
         crawler = Crawler(args.seed, 
                           args.max_urls_to_crawl,
                           args.max_urls_per_page,
                           args.crawl_delay,
                           args.robot_delay,
-                          args.timeout_delay)
+                          args.timeout_delay,
+                          robots_cache,
+                          sitemap_cache,
+                          args.bloom_capacity,
+                          args.db_batch_size,
+                          args.checkpoint_every,
+                          http_client,
+                          args.dedup_distance,
+                          metrics)
         
     print("---------- Crawler initialized ----------\n")
 
@@ -89,13 +207,45 @@ def main():
     if args.crawler == 'minimal':
         crawler.crawl(args.filename,
                       args.path)
+    elif args.recrawl:
+        crawler.recrawl(args.filename,
+                        args.dbname,
+                        args.tablename,
+                        args.path,
+                        args.documents)
+    elif args.processes > 1:
+        crawler.crawl_distributed(args.filename,
+                                  args.dbname,
+                                  args.tablename,
+                                  args.path,
+                                  args.processes,
+                                  args.documents)
+    elif args.crawler == 'async':
+        asyncio.run(crawler.crawl_async(args.filename,
+                                        args.dbname,
+                                        args.tablename,
+                                        args.path,
+                                        args.workers,
+                                        args.resume,
+                                        args.documents))
     else:
         crawler.crawl(args.filename,
                       args.dbname,
                       args.tablename,
-                      args.path)
+                      args.path,
+                      args.resume,
+                      args.documents)
 
     print(f"\n...crawling took {round(time.time()-start_time,2)}s")
+    metrics.dump()
+    print(metrics.summary())
+    print(f"robots.txt cache: {robots_cache.hits} hits, {robots_cache.misses} misses")
+    http_stats = http_client.stats
+    print(f"HTTP: {http_stats['requests']} requests, {http_stats['connections_opened']} connections opened, "
+          f"{http_stats['connections_reused']} reused, {http_stats['bytes_received']} bytes received")
+    if args.crawler != 'minimal':
+        print(f"sitemap cache: {sitemap_cache.hits} hits, {sitemap_cache.misses} misses, {sitemap_cache.not_modified} not modified")
+        print(f"duplicate webpages not saved: {crawler.duplicates}")
 
 if __name__=="__main__":
     
@@ -0,0 +1,154 @@
+"""
+Metrics of a crawl: time spent in each stage, per host counters and throughput
+"""
+import os
+import json
+import time
+import threading
+
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+class CrawlMetrics():
+
+    # stages of the crawl, robots and sitemap include the downloads of robots.txt files and sitemaps
+    STAGES = ('connect', 'download', 'parse', 'robots', 'sitemap', 'db', 'politeness')
+
+    def __init__(self, json_file:str|None=None, prometheus_file:str|None=None, dump_every:float=10) -> None:
+        """Counters shared by the threads of a crawl, regularly written to files.
+
+        Attributes
+        ----------
+        json_file: str|None
+            File in which the metrics are written as JSON, None to not write them.
+        prometheus_file: str|None
+            File in which the metrics are written in the Prometheus text format, None to not write them.
+        dump_every: float
+            Time in seconds between two writes of the files during the crawl, default = 10.
+        __stages: dict[str, list[float, int]]
+            Time spent in each stage and number of times it was timed.
+        __hosts: dict[str, dict[str, int]]
+            Number of pages crawled, errors and bytes received for each host.
+        """
+        self.json_file = json_file
+        self.prometheus_file = prometheus_file
+        self.dump_every = dump_every
+
+        self.__lock = threading.Lock()
+        self.__start = time.monotonic()
+        self.__last_dump = self.__start
+
+        self.__stages = {stage: [0.0, 0] for stage in self.STAGES}
+        self.__hosts = {}
+
+    @staticmethod
+    def __host(url:str) -> str:
+        return urlparse(url).netloc
+
+    def __host_counters(self, host:str) -> dict[str, int]:
+        """Counters of a host, must be called with the lock acquired"""
+        return self.__hosts.setdefault(host, {'pages': 0, 'errors': 0, 'bytes': 0})
+
+    def add_time(self, stage:str, seconds:float) -> None:
+        """Adds time spent in a stage"""
+        with self.__lock:
+            self.__stages[stage][0] += seconds
+            self.__stages[stage][1] += 1
+
+    @contextmanager
+    def timer(self, stage:str):
+        """Times the body of a with statement as being spent in stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_bytes(self, url:str, nb_bytes:int) -> None:
+        """Counts bytes received from the host of url"""
+        with self.__lock:
+            self.__host_counters(self.__host(url))['bytes'] += nb_bytes
+
+    def record_page(self, url:str, ok:bool) -> None:
+        """Counts a page crawled (or an error if not ok), and writes the files if it is time to"""
+        with self.__lock:
+            self.__host_counters(self.__host(url))['pages' if ok else 'errors'] += 1
+            dump = time.monotonic() - self.__last_dump >= self.dump_every
+            if dump:
+                self.__last_dump = time.monotonic()
+        if dump:
+            self.dump()
+
+    def snapshot(self) -> dict:
+        """Returns the current values of the metrics"""
+        with self.__lock:
+            elapsed = time.monotonic() - self.__start
+            hosts = {host: dict(counters) for host, counters in self.__hosts.items()}
+            stages = {stage: {'seconds': round(seconds, 6), 'count': count}
+                      for stage, (seconds, count) in self.__stages.items()}
+
+        pages = sum(counters['pages'] for counters in hosts.values())
+        return {'elapsed_seconds': round(elapsed, 6),
+                'pages': pages,
+                'errors': sum(counters['errors'] for counters in hosts.values()),
+                'bytes': sum(counters['bytes'] for counters in hosts.values()),
+                'pages_per_second': pages / elapsed if elapsed > 0 else 0.0,
+                'stages': stages,
+                'hosts': hosts}
+
+    @staticmethod
+    def to_prometheus(snapshot:dict) -> str:
+        """Formats a snapshot in the Prometheus text exposition format"""
+        def label(value:str) -> str:
+            return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        lines = []
+        def metric(name:str, kind:str, description:str, samples:list[tuple[str, float]]) -> None:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+        metric('crawler_elapsed_seconds', 'gauge', 'Time since the start of the crawl.',
+               [('', snapshot['elapsed_seconds'])])
+        metric('crawler_pages_total', 'counter', 'Pages crawled.', [('', snapshot['pages'])])
+        metric('crawler_errors_total', 'counter', 'Pages which could not be crawled.', [('', snapshot['errors'])])
+        metric('crawler_bytes_total', 'counter', 'Bytes received.', [('', snapshot['bytes'])])
+        metric('crawler_pages_per_second', 'gauge', 'Pages crawled per second since the start of the crawl.',
+               [('', snapshot['pages_per_second'])])
+        metric('crawler_stage_seconds_total', 'counter', 'Time spent in each stage of the crawl.',
+               [(f'{{stage="{stage}"}}', values['seconds']) for stage, values in snapshot['stages'].items()])
+        metric('crawler_stage_count_total', 'counter', 'Number of times each stage of the crawl was timed.',
+               [(f'{{stage="{stage}"}}', values['count']) for stage, values in snapshot['stages'].items()])
+        for counter in ('pages', 'errors', 'bytes'):
+            metric(f'crawler_host_{counter}_total', 'counter', f'{counter.capitalize()} of each host.',
+                   [(f'{{host="{label(host)}"}}', values[counter]) for host, values in sorted(snapshot['hosts'].items())])
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def __write(filename:str, content:str) -> None:
+        """Writes a file atomically, so that it is never read half written"""
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(tmp_filename, filename)
+
+    def dump(self) -> None:
+        """Writes the metrics to the JSON and Prometheus files, if any"""
+        if self.json_file is None and self.prometheus_file is None:
+            return
+        snapshot = self.snapshot()
+        try:
+            if self.json_file is not None:
+                self.__write(self.json_file, json.dumps(snapshot, indent=4))
+            if self.prometheus_file is not None:
+                self.__write(self.prometheus_file, self.to_prometheus(snapshot))
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+    def summary(self) -> str:
+        """Time spent in each stage and throughput, to be printed at the end of the crawl"""
+        snapshot = self.snapshot()
+        stages = ', '.join(f"{stage} {values['seconds']:.2f}s" for stage, values in snapshot['stages'].items())
+        return (f"{snapshot['pages']} pages ({snapshot['errors']} errors, {snapshot['bytes']} bytes) "
+                f"at {snapshot['pages_per_second']:.2f} pages/s\n"
+                f"time per stage: {stages}")
@@ -2,18 +2,14 @@
 Minimal crawler implementation
 """
 import os
-import time
-import socket
 
-from urllib.request import urlopen
-from urllib.parse import urlparse
-from urllib.robotparser import RobotFileParser
-
-from bs4 import BeautifulSoup
+from .scheduler import PolitenessScheduler
+from .robots import RobotsCache
+from .httpclient import HttpClient
+from .linkextractor import LinkExtractor
 
 # handling errors
 from urllib.error import URLError
-from http.client import BadStatusLine
 
 class MinimalCrawler():
 
@@ -23,7 +19,9 @@ class MinimalCrawler():
                  max_urls_per_page:int=5,
                  crawl_delay:int=5, 
                  robot_delay:int=3,
-                 timeout_delay:int=5) -> None:
+                 timeout_delay:int=5,
+                 robots_cache:RobotsCache|None=None,
+                 http_client:HttpClient|None=None) -> None:
         """
         Attributes
         ----------
@@ -39,6 +37,12 @@ class MinimalCrawler():
             Time in seconds to wait before interrogating another /robots.txt (politeness), default = 3.
         __timeout_seconds: int
             Time in seconds to try to fetch an url, default = 5.
+        __frontier: PolitenessScheduler
+            URLs to crawl, handed out as soon as their host can be requested again.
+        __http: HttpClient
+            HTTP client keeping connections alive, can be shared between crawlers.
+        __robots_cache: RobotsCache
+            Parsed /robots.txt files of the websites, can be shared between crawlers.
         """
         self.__seed = start_url
 
@@ -49,6 +53,19 @@ class MinimalCrawler():
         self.__robot_delay = robot_delay  # seconds
         self.__timeout_delay = timeout_delay # seconds
 
+        self.__frontier = PolitenessScheduler(crawl_delay)
+        self.__http = http_client if http_client is not None else HttpClient(timeout_delay)
+        self.__robots_cache = robots_cache if robots_cache is not None else RobotsCache(robot_delay=robot_delay,
+                                                                                         http_client=self.__http)
+
+    @property
+    def http_client(self) -> HttpClient:
+        return self.__http
+
+    @property
+    def robots_cache(self) -> RobotsCache:
+        return self.__robots_cache
+
     def __write_visited_urls(self, urls:list[str], path:str, filename:str) -> None:
         """Writes list of urls into a file
 
@@ -94,21 +111,21 @@ class MinimalCrawler():
         """
         try:
             # parse the page
-            with urlopen(page_url, timeout=self.__timeout_delay) as response:
-                content = b''
+            with self.__http.request(page_url) as response:
+                # links are extracted while the page is downloaded, relative links are
+                # resolved against the url of the page (after redirections)
+                extractor = LinkExtractor(response.geturl(), response.headers.get_content_charset() or 'utf-8')
                 while True:
                     chunk = response.read(8192)
                     if not chunk:
                         break
-                    content += chunk
-
-                html = content
-            soup = BeautifulSoup(html, 'html.parser')
+                    extractor.feed_bytes(chunk)
+                extractor.close()
 
             # list all outgoing links from page and remove duplicates
-            outgoing_links = [a['href'] for a in soup.find_all('a', href=True) 
-                              if a['href'].startswith('http') and ' ' not in a['href']
-                              and a['href'].endswith(('.html', '.htm', '/'))]  # dont consider # (section) and other formats (tel etc)
+            outgoing_links = [link for link in extractor.links
+                              if link.startswith('http') and ' ' not in link
+                              and link.endswith(('.html', '.htm', '/'))]  # dont consider # (section) and other formats (tel etc)
             outgoing_links = list(set(outgoing_links))
 
             # only select a certain number (or less) of crawlable outgoing links
@@ -120,9 +137,6 @@ class MinimalCrawler():
                 if self.__is_crawlable(outgoing_links[tested_outgoing_links]):
                     links_selection.append(
                         outgoing_links[tested_outgoing_links])
-                    
-                    # delay to satisfy politeness between robots.txt accesses
-                    time.sleep(self.__robot_delay)
 
                 tested_outgoing_links += 1
 
@@ -134,6 +148,9 @@ class MinimalCrawler():
         except TimeoutError:
             print(f"Timeout occurred. Connection timed out after {self.__timeout_delay} seconds.")
             return False, []
+        except ValueError as e: # page larger than the maximum body size
+            print(f"Error reading the page: {e}")
+            return False, []
 
     def __is_crawlable(self, page_url:str) -> bool:
         """Checks if a page can be crawled by interrogating the /robots.txt file of the website.
@@ -148,30 +165,16 @@ class MinimalCrawler():
         boolean
             True if page is crawlable, False otherwise1;
         """
-        try:
-            # parsing the url to retrieve the home page url
-            parsed_url = urlparse(page_url)
-            home_page_url = parsed_url.scheme+'://'+parsed_url.netloc
-
-            # instanciating the robots.txt file parser
-            rp = RobotFileParser()
-            rp.set_url(os.path.join(home_page_url, "robots.txt"))
-
-            try: 
-                socket.setdefaulttimeout(self.__timeout_delay)
-                rp.read()
-                # returns True if page is crawlable, False otherwise
-                return rp.can_fetch("*", page_url)
-            except BadStatusLine as e:
-                print(f"BadStatusLine error: {e}")
-                return False
-            except (URLError, socket.timeout) as e:
-                print(f"Error fetching robots.txt: {e}")
-                return False
-        except URLError as e:
-            print(f"URLError: {e}")
+        # the robots.txt is only downloaded if it is not already in the cache
+        rp = self.__robots_cache.get(page_url)
+        if rp is None: # robots.txt could not be fetched
             return False
 
+        # honor the Crawl-delay of the website if it asks for a longer delay
+        self.__frontier.set_crawl_delay(page_url, rp.crawl_delay("*"))
+        # returns True if page is crawlable, False otherwise
+        return rp.can_fetch("*", page_url)
+
     def crawl(self, filename:str, path:str) -> None:
         """Crawls from the given seed (start url).
 
@@ -186,22 +189,21 @@ class MinimalCrawler():
         -------
         None
         """
-        frontier = [self.__seed]
+        # the frontier hands out urls whose host can be requested again (per host politeness)
+        frontier = self.__frontier
+        frontier.add(self.__seed)
         crawled = set() # parsed URLs
 
         while frontier and len(crawled) < self.__max_urls_crawled:
 
-            # we will crawl the first url from the frontier
-            current_url = frontier.pop(0)
+            # we will crawl the first url of a host which is not cooling down
+            # (only waits if all hosts in the frontier were requested recently)
+            # urls are deduplicated when added, so an url is never crawled twice
+            current_url = frontier.pop()
 
             # some verbose to follow the process
             print(f"[{len(crawled)+1}/{self.__max_urls_crawled}] {current_url}")
 
-            # we do not crawl an already crawled page
-            if current_url in crawled:
-                print("Page already crawled. Moving on...")
-                continue
-
             # parse page and get up to self.__max_urls_per_page outgoing URLs
             response = self.__scan_links_in_page(current_url)
             # if the page has been scanned and the links retrieved (no exception raised)
@@ -214,8 +216,5 @@ class MinimalCrawler():
                 # adding the current url to the list of visited URLs
                 crawled.add(current_url)
 
-            # waiting some time before parsing another page
-            time.sleep(self.__crawl_delay)
-
         # write results into file
         self.__write_visited_urls(list(crawled), path, filename)
@@ -0,0 +1,150 @@
+"""
+Cache of parsed robots.txt files, shared by the crawlers
+"""
+import time
+import threading
+
+from collections import OrderedDict
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from .httpclient import HttpClient
+
+# handling errors
+from urllib.error import URLError, HTTPError
+from http.client import IncompleteRead
+
+class RobotsCache():
+
+    def __init__(self,
+                 ttl:float=3600,
+                 max_size:int=1000,
+                 robot_delay:float=3,
+                 timeout_delay:int=5,
+                 http_client:HttpClient|None=None) -> None:
+        """
+        Attributes
+        ----------
+        __ttl: float
+            Time in seconds after which a robots.txt is downloaded again, default = 3600.
+        __max_size: int
+            Maximum number of hosts kept in the cache, the least recently used are evicted first.
+        __http: HttpClient
+            Client used to download the robots.txt files, keeping connections alive.
+        __robot_delay: float
+            Time in seconds between two requests of the robots.txt of a same host, default = 3.
+        __next_fetch: dict[str, float]
+            Time (time.monotonic) from which the robots.txt of each host can be requested again.
+        __entries: OrderedDict[str, tuple[float, RobotFileParser|None]]
+            For each host (scheme+netloc), the time at which its robots.txt was fetched and the parser,
+            None if the robots.txt could not be fetched.
+        __hits: int
+            Number of lookups answered from the cache.
+        __misses: int
+            Number of lookups which required downloading a robots.txt.
+        """
+        self.__ttl = ttl # seconds
+        self.__max_size = max_size
+        self.__http = http_client if http_client is not None else HttpClient(timeout_delay)
+        self.__robot_delay = robot_delay # seconds
+        self.__next_fetch = {}
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+        self.__hits = 0
+        self.__misses = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    def __wait(self, home_page_url:str) -> None:
+        """Waits until the robots.txt of a host can be requested again and books the next slot"""
+        with self.__lock:
+            start = max(time.monotonic(), self.__next_fetch.get(home_page_url, 0))
+            self.__next_fetch[home_page_url] = start + self.__robot_delay
+        wait = start - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def __fetch(self, home_page_url:str) -> RobotFileParser|None:
+        """Downloads and parses the robots.txt of a host, None if it could not be fetched"""
+        rp = RobotFileParser()
+        rp.set_url(home_page_url+"/robots.txt")
+
+        try:
+            # politeness between robots.txt accesses of a same host
+            self.__wait(home_page_url)
+            content = self.__http.get(home_page_url+"/robots.txt")
+            rp.parse(content.decode('utf-8', errors='replace').splitlines())
+            return rp
+        except HTTPError as e:
+            # same behaviour as RobotFileParser.read
+            if e.code in (401, 403):
+                rp.disallow_all = True
+            elif 400 <= e.code < 500:
+                rp.allow_all = True
+            return rp
+        except (URLError, IncompleteRead, TimeoutError) as e:
+            print(f"Error fetching robots.txt: {e}")
+        except ValueError as e:
+            print(f"Error reading robots.txt: {e}")
+        return None
+
+    def get(self, url:str) -> RobotFileParser|None:
+        """Returns the parsed robots.txt of the host of url, downloading it if it is not
+        cached or if the cached version is older than the ttl.
+
+        Parameter
+        ---------
+        url: str
+            Any url of the website.
+
+        Returns
+        -------
+        RobotFileParser|None
+            Parsed robots.txt, None if it could not be fetched.
+        """
+        parsed_url = urlparse(url)
+        home_page_url = parsed_url.scheme+'://'+parsed_url.netloc
+
+        with self.__lock:
+            entry = self.__entries.get(home_page_url)
+            if entry is not None and time.monotonic()-entry[0] < self.__ttl:
+                self.__entries.move_to_end(home_page_url)
+                self.__hits += 1
+                return entry[1]
+            self.__misses += 1
+
+        rp = self.__fetch(home_page_url)
+
+        with self.__lock:
+            self.__entries[home_page_url] = (time.monotonic(), rp)
+            self.__entries.move_to_end(home_page_url)
+            # evict least recently used hosts
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+        return rp
+
+    def can_fetch(self, url:str, useragent:str="*") -> bool:
+        """True if url can be crawled, False otherwise or if the robots.txt could not be fetched"""
+        rp = self.get(url)
+        return rp is not None and rp.can_fetch(useragent, url)
+
+    def site_maps(self, url:str) -> list[str]|None:
+        """Sitemaps listed in the robots.txt of the website, None if there are none"""
+        rp = self.get(url)
+        return rp.site_maps() if rp is not None else None
+
+    def crawl_delay(self, url:str, useragent:str="*") -> float|None:
+        """Crawl-delay asked by the website, None if there is none"""
+        rp = self.get(url)
+        return rp.crawl_delay(useragent) if rp is not None else None
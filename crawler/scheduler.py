@@ -0,0 +1,245 @@
+"""
+Per-host politeness scheduler, used as the frontier of the crawlers
+"""
+import time
+import heapq
+import threading
+
+from collections import deque
+from urllib.parse import urlparse
+
+from .frontier import normalize_url
+
+class PolitenessScheduler():
+
+    def __init__(self, crawl_delay:float=5, seen:set|None=None) -> None:
+        """
+        Attributes
+        ----------
+        __crawl_delay: float
+            Default time in seconds between two requests to the same host.
+        __seen: set|BloomFilter
+            Normalized urls which were ever added, an url is only queued once.
+        __host_delays: dict[str, float]
+            Delay of hosts asking for a longer delay than the default one (Crawl-delay in robots.txt).
+        __next_fetch: dict[str, float]
+            Time (time.monotonic) from which each host can be requested again.
+        __queues: dict[str, deque]
+            URLs waiting to be crawled, grouped by host.
+        __ready: list[tuple[float, str]]
+            Heap of (next allowed fetch time, host) for hosts with waiting URLs, which are not busy.
+        __busy: set[str]
+            Hosts with a page handed out by pop_ready and not released yet.
+        __size: int
+            Number of URLs waiting to be crawled.
+        __idle_time: float
+            Total time in seconds spent waiting because every host was cooling down.
+        __unsaved: list[str]
+            Urls seen since the last call to take_unsaved, used to checkpoint the seen urls.
+        """
+        self.__crawl_delay = crawl_delay # seconds
+        self.__seen = seen if seen is not None else set()
+        self.__host_delays = {}
+        self.__next_fetch = {}
+
+        self.__queues = {}
+        self.__ready = []
+        self.__busy = set()
+        self.__size = 0
+
+        self.__idle_time = 0.0
+        self.__unsaved = []
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def host(url:str) -> str:
+        """Returns the host (scheme and netloc) of an url"""
+        parsed_url = urlparse(url)
+        return parsed_url.scheme+'://'+parsed_url.netloc
+
+    def __len__(self) -> int:
+        return self.__size
+
+    @property
+    def idle_time(self) -> float:
+        """Total time in seconds spent waiting for a host to be ready"""
+        return self.__idle_time
+
+    def crawl_delay(self, url:str) -> float:
+        """Returns the delay in seconds to respect between two requests to the host of url"""
+        with self.__lock:
+            return self.__host_delays.get(self.host(url), self.__crawl_delay)
+
+    def set_crawl_delay(self, url:str, delay:float|None) -> None:
+        """Sets the delay of the host of url, e.g. from the Crawl-delay of its robots.txt.
+
+        The default delay is kept if the host asks for a shorter one.
+
+        Parameters
+        ----------
+        url: str
+            Any url of the host.
+        delay: float|None
+            Delay in seconds asked by the host, ignored if None.
+        """
+        if delay is not None and float(delay)>self.__crawl_delay:
+            with self.__lock:
+                self.__host_delays[self.host(url)] = float(delay)
+
+    @property
+    def seen(self) -> set:
+        """Normalized urls which were ever added to the scheduler"""
+        return self.__seen
+
+    def add(self, url:str) -> bool:
+        """Adds an url to the queue of its host, unless it was already added before.
+
+        Parameter
+        ---------
+        url: str
+            URL to crawl, it is normalized before being queued.
+
+        Returns
+        -------
+        bool
+            True if the url was queued, False if it was already seen.
+        """
+        url = normalize_url(url)
+        with self.__lock:
+            if url in self.__seen:
+                return False
+            self.__seen.add(url)
+            self.__unsaved.append(url)
+            self.__queue(url)
+            return True
+
+    def __queue(self, url:str) -> None:
+        """Appends url to the queue of its host. Must be called with the lock acquired."""
+        host = self.host(url)
+        if host not in self.__queues:
+            self.__queues[host] = deque()
+        queue = self.__queues[host]
+        if not queue and host not in self.__busy:
+            # host was not waiting to be crawled yet
+            heapq.heappush(self.__ready, (self.__next_fetch.get(host, 0), host))
+        queue.append(url)
+        self.__size += 1
+
+    def extend(self, urls:list[str]) -> int:
+        """Adds several urls to the scheduler, returns the number of urls queued"""
+        return sum(self.add(url) for url in urls)
+
+    def __reserve(self, host:str) -> float:
+        """Books the next request slot of a host and returns the time at which it starts.
+        Must be called with the lock acquired.
+        """
+        start = max(time.monotonic(), self.__next_fetch.get(host, 0))
+        self.__next_fetch[host] = start + self.__host_delays.get(host, self.__crawl_delay)
+        return start
+
+    def __sleep_until(self, start:float) -> None:
+        wait = start - time.monotonic()
+        if wait > 0:
+            self.__idle_time += wait
+            time.sleep(wait)
+
+    def pop(self) -> str:
+        """Returns the next url whose host can be requested, waiting only if all hosts
+        with queued urls are cooling down.
+
+        Returns
+        -------
+        str
+            URL to crawl. The request slot of its host is booked.
+        """
+        with self.__lock:
+            if not self.__size:
+                raise IndexError("pop from an empty scheduler")
+
+            _, host = heapq.heappop(self.__ready)
+            queue = self.__queues[host]
+            url = queue.popleft()
+            self.__size -= 1
+            start = self.__reserve(host)
+            if queue:
+                heapq.heappush(self.__ready, (self.__next_fetch[host], host))
+            else:
+                del self.__queues[host]
+
+        self.__sleep_until(start)
+        return url
+
+    def pop_ready(self) -> str|None:
+        """Returns the next url whose host can be requested now, without waiting.
+
+        The host of the url is busy until release is called: no other url of the host is
+        handed out before the page is crawled and the delay of the host has passed since.
+
+        Returns
+        -------
+        str|None
+            URL to crawl, None if no host with queued urls can be requested now.
+        """
+        with self.__lock:
+            if not self.__ready or self.__ready[0][0] > time.monotonic():
+                return None
+
+            _, host = heapq.heappop(self.__ready)
+            queue = self.__queues[host]
+            url = queue.popleft()
+            self.__size -= 1
+            if not queue:
+                del self.__queues[host]
+            self.__busy.add(host)
+            return url
+
+    def release(self, url:str) -> None:
+        """Marks the host of an url handed out by pop_ready as crawled, it can be requested
+        again once its delay has passed"""
+        host = self.host(url)
+        with self.__lock:
+            self.__busy.discard(host)
+            self.__next_fetch[host] = time.monotonic() + self.__host_delays.get(host, self.__crawl_delay)
+            if host in self.__queues:
+                heapq.heappush(self.__ready, (self.__next_fetch[host], host))
+
+    def wait_time(self) -> float|None:
+        """Time in seconds until pop_ready can return an url, None if all hosts with queued
+        urls are busy (or no url is queued)"""
+        with self.__lock:
+            if not self.__ready:
+                return None
+            return max(self.__ready[0][0] - time.monotonic(), 0)
+
+    def queued(self) -> list[str]:
+        """Urls waiting to be crawled, in the order of each host's queue"""
+        with self.__lock:
+            return [url for queue in self.__queues.values() for url in queue]
+
+    def host_delays(self) -> dict[str, float]:
+        """Hosts asking for a longer delay than the default one, with their delay"""
+        with self.__lock:
+            return dict(self.__host_delays)
+
+    def take_unsaved(self) -> list[str]:
+        """Returns the urls seen since the previous call, to checkpoint them"""
+        with self.__lock:
+            unsaved, self.__unsaved = self.__unsaved, []
+            return unsaved
+
+    def restore(self, urls:list[str], host_delays:dict[str, float]) -> None:
+        """Queues urls of a checkpointed frontier, even if they are already in the seen-set,
+        and restores the delays of the hosts.
+
+        Parameters
+        ----------
+        urls: list[str]
+            Urls which were waiting to be crawled when the checkpoint was saved.
+        host_delays: dict[str, float]
+            Delays of the hosts asking for a longer delay than the default one.
+        """
+        with self.__lock:
+            self.__host_delays.update(host_delays)
+            for url in urls:
+                self.__seen.add(url)
+                self.__queue(url)
@@ -0,0 +1,172 @@
+"""
+Assignment of websites to the processes of a distributed crawl
+"""
+import zlib
+import queue
+
+from multiprocessing.context import BaseContext
+
+from .scheduler import PolitenessScheduler
+from .frontier import normalize_url
+
+def host_worker(url:str, nb_workers:int) -> int:
+    """Index of the worker crawling the website of url, all urls of a website go to the same worker"""
+    return zlib.crc32(PolitenessScheduler.host(url).encode('utf-8')) % nb_workers
+
+
+class ShardCoordinator():
+
+    def __init__(self, nb_workers:int, max_urls_crawled:int, context:BaseContext) -> None:
+        """State shared by the processes of a distributed crawl.
+
+        Each website is crawled by a single worker (see host_worker), so the politeness and
+        the deduplication of the urls of a website stay local to a worker. Urls found by a
+        worker are sent to the worker owning their website through its inbox.
+
+        Attributes
+        ----------
+        __nb_workers: int
+            Number of worker processes.
+        __max_urls_crawled: int
+            Maximum number of pages crawled by all the workers together.
+        __inboxes: list[multiprocessing.Queue]
+            Lists of urls sent to each worker.
+        __crawled: multiprocessing.Value
+            Number of pages crawled, or being crawled, by all the workers.
+        __pending: multiprocessing.Value
+            Number of pages being crawled, whose budget may still be given back with release.
+        __seq: multiprocessing.Value
+            Last crawl sequence number given, shared so that the ages can be merged.
+        __in_transit: multiprocessing.Value
+            Number of urls sent to an inbox and not received yet.
+        __idle: multiprocessing.Array
+            1 for each worker with nothing to crawl, the crawl ends when all workers are idle
+            and no url is in transit.
+        __duplicates: multiprocessing.Value
+            Number of pages not stored by the workers because they are duplicates.
+        """
+        self.__nb_workers = nb_workers
+        self.__max_urls_crawled = max_urls_crawled
+
+        self.__inboxes = [context.Queue() for _ in range(nb_workers)]
+        self.__lock = context.Lock()
+        self.__crawled = context.Value('i', 0, lock=False)
+        self.__pending = context.Value('i', 0, lock=False)
+        self.__seq = context.Value('i', 0, lock=False)
+        self.__in_transit = context.Value('i', 0, lock=False)
+        self.__idle = context.Array('b', nb_workers, lock=False)
+        self.__duplicates = context.Value('i', 0, lock=False)
+
+    @property
+    def nb_workers(self) -> int:
+        return self.__nb_workers
+
+    def send(self, urls:list[str], worker_id:int=-1) -> list[str]:
+        """Sends urls to the workers crawling their website.
+
+        Parameters
+        ----------
+        urls: list[str]
+            Urls found by a worker.
+        worker_id: int
+            Index of the worker sending the urls, -1 if sent by the main process.
+
+        Returns
+        -------
+        list[str]
+            Urls of the websites crawled by worker_id itself, which are not sent.
+        """
+        by_worker = {}
+        for url in map(normalize_url, urls):
+            by_worker.setdefault(host_worker(url, self.__nb_workers), []).append(url)
+        own_urls = by_worker.pop(worker_id, [])
+
+        with self.__lock:
+            self.__in_transit.value += sum(len(worker_urls) for worker_urls in by_worker.values())
+        for worker, worker_urls in by_worker.items():
+            self.__inboxes[worker].put(worker_urls)
+        return own_urls
+
+    def receive(self, worker_id:int, timeout:float=0) -> list[str]:
+        """Returns the urls sent to a worker, waiting at most timeout seconds if there are none"""
+        urls = []
+        try:
+            urls.extend(self.__inboxes[worker_id].get(timeout=timeout) if timeout > 0
+                        else self.__inboxes[worker_id].get_nowait())
+            while True:
+                urls.extend(self.__inboxes[worker_id].get_nowait())
+        except queue.Empty:
+            pass
+
+        if urls:
+            with self.__lock:
+                self.__in_transit.value -= len(urls)
+                self.__idle[worker_id] = 0
+        return urls
+
+    @property
+    def duplicates(self) -> int:
+        """Number of pages not stored by the workers because they are duplicates"""
+        with self.__lock:
+            return self.__duplicates.value
+
+    def idle(self, worker_id:int, waiting_for_budget:bool=False) -> bool:
+        """Marks a worker as having nothing to crawl, returns True if the whole crawl is over.
+
+        The crawl is over once no page is being crawled, and either the whole budget was
+        crawled or all workers are idle with no url in transit.
+
+        Parameters
+        ----------
+        worker_id: int
+            Index of the worker.
+        waiting_for_budget: bool
+            True if the worker still has urls to crawl but could not reserve a page, because
+            the whole budget is booked by pages being crawled which may still be given back.
+            The worker is then not marked as idle. Default False.
+
+        Returns
+        -------
+        bool
+            True if the worker can stop.
+        """
+        with self.__lock:
+            self.__idle[worker_id] = 0 if waiting_for_budget else 1
+            if self.__pending.value > 0:
+                return False
+            return (self.__crawled.value >= self.__max_urls_crawled
+                    or (all(self.__idle) and self.__in_transit.value == 0))
+
+    def reserve(self, worker_id:int) -> bool:
+        """Books one page of the crawl budget for a worker, False if the whole budget is
+        crawled or being crawled. The page must then be given back with release, or
+        confirmed with confirm once crawled."""
+        with self.__lock:
+            if self.__crawled.value >= self.__max_urls_crawled:
+                return False
+            self.__crawled.value += 1
+            self.__pending.value += 1
+            self.__idle[worker_id] = 0
+            return True
+
+    def release(self) -> None:
+        """Gives back a page of the crawl budget, when a page could not be crawled"""
+        with self.__lock:
+            self.__crawled.value -= 1
+            self.__pending.value -= 1
+
+    def confirm(self) -> None:
+        """Marks a page of the crawl budget as crawled, it is not given back"""
+        with self.__lock:
+            self.__pending.value -= 1
+
+    def add_duplicates(self, nb_duplicates:int) -> None:
+        """Counts pages not stored by a worker because they are duplicates"""
+        with self.__lock:
+            self.__duplicates.value += nb_duplicates
+
+    def next_seq(self) -> int:
+        """Next crawl sequence number, unique among all workers"""
+        with self.__lock:
+            self.__seq.value += 1
+            return self.__seq.value
@@ -0,0 +1,222 @@
+"""
+Cache of the sitemaps of websites, revalidated with conditional requests
+"""
+import gzip
+import time
+import threading
+
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+from .robots import RobotsCache
+from .httpclient import HttpClient
+
+# handling errors
+from urllib.error import URLError
+from http.client import IncompleteRead
+
+class SitemapCache():
+
+    def __init__(self,
+                 robots_cache:RobotsCache,
+                 ttl:float=3600,
+                 timeout_delay:int=5,
+                 max_depth:int=3,
+                 http_client:HttpClient|None=None) -> None:
+        """
+        Attributes
+        ----------
+        __robots_cache: RobotsCache
+            Cache of robots.txt files, in which the sitemaps of a website are listed.
+        __ttl: float
+            Time in seconds after which a sitemap is revalidated, default = 3600.
+        __http: HttpClient
+            Client used to download the sitemaps, keeping connections alive.
+        __max_depth: int
+            Maximum depth of nested sitemap indexes to follow, default = 3.
+        __sitemaps: dict[str, dict]
+            For each sitemap url, the time it was fetched, its ETag and Last-Modified headers,
+            the pages it lists and the nested sitemaps it links to.
+        __hosts: dict[str, tuple[float, list[str]]]
+            For each host (scheme+netloc), the time its urls were computed and the urls.
+        __host_locks: dict[str, threading.Lock]
+            Lock of each host, held while its sitemaps are fetched so that they are fetched once,
+            while the sitemaps of other hosts are fetched at the same time.
+        __lock: threading.Lock
+            Guards the cached sitemaps and hosts and the counters, never held during a request.
+        __hits: int
+            Number of lookups answered from the cache.
+        __misses: int
+            Number of sitemaps downloaded.
+        __not_modified: int
+            Number of sitemaps revalidated without being downloaded again (304 Not Modified).
+        """
+        self.__robots_cache = robots_cache
+        self.__ttl = ttl # seconds
+        self.__http = http_client if http_client is not None else HttpClient(timeout_delay)
+        self.__max_depth = max_depth
+
+        self.__sitemaps = {}
+        self.__hosts = {}
+        self.__host_locks = {}
+        self.__lock = threading.Lock()
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__not_modified = 0
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    @property
+    def not_modified(self) -> int:
+        return self.__not_modified
+
+    def __download(self, sitemap:str, cached:dict|None) -> dict:
+        """Downloads and parses a sitemap, sending the validators of the cached version if any.
+
+        Returns
+        -------
+        dict
+            Entry of the sitemap in the cache, the cached one if it is still valid.
+        """
+        headers = {}
+        if cached is not None:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        with self.__http.request(sitemap, headers) as response:
+            if response.status == 304 and cached is not None:
+                with self.__lock:
+                    self.__not_modified += 1
+                    cached['fetched'] = time.monotonic()
+                return cached
+            content = response.read()
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+
+        # sitemaps can be compressed (sitemap.xml.gz)
+        if content[:2] == b'\x1f\x8b':
+            content = gzip.decompress(content)
+
+        # sitemap changed, parse it again
+        soup = BeautifulSoup(content, 'xml')
+        locs = [loc.text.strip() for loc in soup.find_all('loc')]
+        is_index = soup.find('sitemapindex') is not None
+        entry = {'fetched': time.monotonic(),
+                 'etag': etag,
+                 'last_modified': last_modified,
+                 'pages': [] if is_index else locs,
+                 'children': locs if is_index else []}
+
+        with self.__lock:
+            self.__misses += 1
+            self.__sitemaps[sitemap] = entry
+        return entry
+
+    def __scan_sitemap(self, sitemap:str, depth:int, visited:set[str]) -> list[str]:
+        """Returns the pages listed by a sitemap, following nested sitemap indexes.
+
+        Parameters
+        ----------
+        sitemap: str
+            URL of a sitemap or of a sitemap index.
+        depth: int
+            Depth of the sitemap in the sitemap indexes.
+        visited: set[str]
+            Sitemaps already scanned, to avoid cycles between indexes.
+
+        Returns
+        -------
+        list[str]
+            List of URLs of pages exposed by the sitemap.
+
+        Raises
+        ------
+        URLError, IncompleteRead, TimeoutError, ValueError
+            If the sitemap or one of its nested sitemaps could not be fetched or parsed.
+        """
+        if sitemap in visited or depth > self.__max_depth:
+            return []
+        visited.add(sitemap)
+
+        with self.__lock:
+            cached = self.__sitemaps.get(sitemap)
+            expired = cached is None or time.monotonic()-cached['fetched'] >= self.__ttl
+            if not expired:
+                self.__hits += 1
+        if expired:
+            cached = self.__download(sitemap, cached)
+
+        urls = list(cached['pages'])
+        for child in cached['children']:
+            urls.extend(self.__scan_sitemap(child, depth+1, visited))
+        return urls
+
+    def urls(self, url:str) -> list[str]|None:
+        """Get urls of pages exposed by the sitemaps of the website of url.
+        Sitemaps are only downloaded again once the ttl expired, and only if they changed.
+        If a sitemap could not be fetched, the urls of the website are not cached, so that
+        the sitemaps are fetched again on the next call.
+
+        Parameter
+        ---------
+        url: str
+            Any url of the website.
+
+        Returns
+        -------
+        list[str]|None
+            List of all URLs exposed by the sitemaps of the website, without duplicates,
+            None if a sitemap could not be fetched.
+        """
+        parsed_url = urlparse(url)
+        home_page_url = parsed_url.scheme+'://'+parsed_url.netloc
+
+        with self.__lock:
+            cached = self.__cached_urls(home_page_url)
+            if cached is not None:
+                return cached
+            host_lock = self.__host_locks.setdefault(home_page_url, threading.Lock())
+
+        with host_lock:
+            # the urls may have been computed by another thread while this one was waiting
+            with self.__lock:
+                cached = self.__cached_urls(home_page_url)
+            if cached is not None:
+                return cached
+
+            sitemaps = self.__robots_cache.site_maps(url) or []
+            visited = set()
+            result_urls = {}
+
+            try:
+                for sitemap in [st for st in sitemaps if st.startswith('http')]:
+                    for page in self.__scan_sitemap(sitemap, 0, visited):
+                        result_urls[page] = None # keeps the order of the sitemaps
+            except (URLError, IncompleteRead, TimeoutError, ValueError) as e:
+                print(f"Error fetching sitemap: {e}")
+                return None
+
+            result_urls = [page for page in result_urls if page not in visited]
+            with self.__lock:
+                self.__hosts[home_page_url] = (time.monotonic(), result_urls)
+            return result_urls
+
+    def __cached_urls(self, home_page_url:str) -> list[str]|None:
+        """Urls of a host if they were computed less than ttl seconds ago, None otherwise.
+        Must be called with the lock acquired.
+        """
+        cached = self.__hosts.get(home_page_url)
+        if cached is not None and time.monotonic()-cached[0] < self.__ttl:
+            self.__hits += 1
+            return cached[1]
+        return None
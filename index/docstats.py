@@ -0,0 +1,116 @@
+"""
+docstats.py
+
+Statistics of the titles of the documents used by the ranking (field lengths, stopword-weighted
+lengths, corpus metadata), computed once when building the index instead of for each query.
+
+Titles are tokenized with the tokenizer of the ranking (titles.py), which is not the tokenization
+of the index, so that the ranking gets exactly the values it would compute itself.
+"""
+
+import json
+import argparse
+
+import numpy as np
+
+from nltk.corpus import stopwords
+
+from .titles import tokenize, STOPWORDS_WEIGHT, TOKENIZER_VERSION
+
+def compute_doc_stats(ids:list[int], titles:list[str], language:str, stopwords_weight:float=STOPWORDS_WEIGHT) -> dict:
+    """Computes the statistics of the titles, arrays being indexed by docId.
+
+    Parameters
+    ----------
+    ids: list[int]
+        Ids of the documents
+    titles: list[str]
+        Titles of the documents
+    language: str
+        Language of the corpus, to compute stopwords list
+    stopwords_weight: float
+        Weight of stopwords in the stopword-weighted lengths, default 0.2
+
+    Returns
+    -------
+    dict
+        'field_length': number of tokens of each title,
+        'nb_tokens': number of words of each title (split by any whitespace),
+        'nb_stopwords': number of these words which are stopwords,
+        'weighted_length': number of these words, stopwords counting for stopwords_weight,
+        and the metadata of the corpus 'nb_doc', 'nb_tokens_title_total', 'mean_nb_tokens_title',
+        'language', 'stopwords_weight' and 'tokenizer_version' (TOKENIZER_VERSION)
+    """
+    lstopwords = set(stopwords.words(language))
+    size = max(ids) + 1 if len(ids) else 0
+    field_length = np.zeros(size, dtype=np.int32)
+    nb_tokens = np.zeros(size, dtype=np.int32)
+    nb_stopwords = np.zeros(size, dtype=np.int32)
+    weighted_length = np.zeros(size, dtype=np.float64)
+
+    nb_tokens_title_total = 0
+    for doc_id, title in zip(ids, titles):
+        length = len(tokenize(title))
+        field_length[doc_id] = length
+        nb_tokens_title_total += length
+        words = title.lower().split()
+        nb_tokens[doc_id] = len(words)
+        nb_stopwords[doc_id] = sum(word in lstopwords for word in words)
+        # summed in the order of the title, as the ranking does
+        weighted_length[doc_id] = sum([stopwords_weight if word in lstopwords else 1 for word in words])
+
+    return {'field_length': field_length,
+            'nb_tokens': nb_tokens,
+            'nb_stopwords': nb_stopwords,
+            'weighted_length': weighted_length,
+            'nb_doc': len(ids),
+            'nb_tokens_title_total': nb_tokens_title_total,
+            'mean_nb_tokens_title': nb_tokens_title_total/len(ids) if len(ids) else 0.0,
+            'language': language,
+            'stopwords_weight': stopwords_weight,
+            'tokenizer_version': TOKENIZER_VERSION}
+
+def save_doc_stats(stats:dict, filename:str) -> None:
+    """Writes the statistics as a numpy archive (.npz)"""
+    with open(filename, 'wb') as file:
+        np.savez(file, **stats)
+
+    print(f"Document statistics saved at: {filename}")
+
+def load_doc_stats(filename:str) -> dict:
+    """Loads statistics written by save_doc_stats, arrays as lists and metadata as numbers
+    so that they are read as fast as Python values"""
+    with np.load(filename) as archive:
+        return {key: archive[key].tolist() for key in archive.files}
+
+
+def main() -> None:
+    """Computes the statistics of the documents exported for the ranking"""
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("documents",
+                        help="Filename of the documents list of the ranking (url, id and title of each document).",
+                        type=str)
+    parser.add_argument("doc_stats",
+                        help="Filename of the statistics to write ('.npz').",
+                        type=str)
+    parser.add_argument("-l", "--language",
+                        default='french',
+                        help="Language of the documents, to compute stopwords list, default 'french'.",
+                        type=str)
+
+    args = parser.parse_args()
+
+    with open(args.documents, encoding='utf-8') as file:
+        documents = json.load(file)
+
+    stats = compute_doc_stats([doc['id'] for doc in documents], [doc['title'] for doc in documents], args.language)
+    save_doc_stats(stats, args.doc_stats)
+
+
+if __name__=="__main__":
+
+    main()
+
+    # example: python3 -m index.docstats ranking/documents.json ranking/doc_stats.npz
@@ -2,39 +2,95 @@
 main.py
 """
 
+import os
+import json
 import argparse
 import pandas as pd
 
-#import nltk
-#nltk.download('punkt')
-from nltk.tokenize import word_tokenize
-from nltk.stem.snowball import SnowballStemmer
+from joblib import Parallel, delayed
 
+# fingerprints are computed and the document store is read as by the crawler
+from crawler.fingerprint import simhash, SimHashIndex
+from crawler.documentstore import read_documents
+from index.postings import write_postings
+from index.docstats import compute_doc_stats, save_doc_stats
+from index.preprocessing import StemCache, preprocess_batch, preprocess_worker_batch
 
-def preprocess(text:str, stem:bool, language:str) -> list[str]:
-    """Tokenizes and stems text
+
+def load_corpus(filename:str) -> pd.DataFrame:
+    """Loads the corpus, either a JSON list of documents or the JSONL document store written
+    by the crawler, in which case the documents are indexed by their id.
+
+    Parameters
+    ----------
+    filename: str
+        Name of the corpus file, the document store if it ends with '.jsonl'
     
+    Returns
+    -------
+    pd.DataFrame
+        Corpus, with columns 'title', 'content' and 'h1' at least
+    """
+    if not filename.endswith('.jsonl'):
+        return pd.read_json(filename, encoding='utf-8')
+
+    # a page crawled again is appended with the same id, the last version is kept
+    return pd.DataFrame(read_documents(filename), columns=['id', 'url', 'title', 'h1', 'content']).set_index('id')
+
+def export_documents(data:pd.DataFrame, filename:str) -> None:
+    """Writes the url, id and title of the documents, as expected by the ranking.
+
     Parameters
     ----------
-    test: str
-        String to process
-    stem: bool
-        If True stemming is used, otherwise we only tokenize
-    language: str
-        Language of the corpus, from languages available in nltk
+    data: pd.DataFrame
+        Corpus, with columns 'url' and 'title'
+    filename: str
+        Name of file in which we should save the documents
     
     Returns
     -------
-    list[str]
-        List of tokens
+    None
     """
-    processed_text = word_tokenize(text, language=language)
-    if stem:
-        stemmer = SnowballStemmer(language=language)
-        processed_text = [stemmer.stem(token) for token in processed_text]
-    return processed_text
+    documents = [{'url': url, 'id': int(idx), 'title': title}
+                 for idx, url, title in zip(data.index, data['url'], data['title'])]
+    with open(filename, "w", encoding='utf-8') as json_file:
+        json.dump(documents, json_file)
+
+    print(f"JSON file saved at: {filename}")
+
+def drop_duplicates(data:pd.DataFrame, max_distance:int) -> pd.DataFrame:
+    """Removes documents having the same url as a previous document, or whose text is an exact
+    or near duplicate of the text of a previous document (SimHash fingerprints of their title,
+    h1 and content differing by at most max_distance bits).
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        Corpus
+    max_distance: int
+        Maximum number of differing bits for two documents to be duplicates
+    
+    Returns
+    -------
+    pd.DataFrame
+        Corpus without duplicates, documents keep their index (id)
+    """
+    # documents having the url of a previous document
+    duplicate_urls = data['url'].duplicated().tolist() if 'url' in data.columns else [False]*len(data)
+
+    # fingerprints of the texts, fields joined column by column
+    fields = [field for field in ('title', 'h1', 'content') if field in data.columns]
+    texts = data[fields].astype(str).agg(' '.join, axis=1) if fields else pd.Series('', index=data.index)
+    fingerprints = [None if duplicate else simhash(text) for text, duplicate in zip(texts, duplicate_urls)]
 
-def preprocess_data(data:pd.DataFrame, stem:bool, language:str) -> None:
+    index = SimHashIndex(max_distance)
+    keep = [not duplicate and (fingerprint is None or index.add_if_new(idx, fingerprint) is None)
+            for idx, fingerprint, duplicate in zip(data.index, fingerprints, duplicate_urls)]
+
+    return data[keep]
+
+def preprocess_data(data:pd.DataFrame, stem:bool, language:str, jobs:int=1, batch_size:int=500,
+                    cache:StemCache|None=None) -> StemCache|None:
     """Applies preprocessing to columns 'title', 'content' and 'h1' of corpus.
     
     Parameters
@@ -45,15 +101,44 @@ def preprocess_data(data:pd.DataFrame, stem:bool, language:str) -> None:
         If True stemming is used, otherwise we only tokenize
     language: str
         Language of the corpus, from languages available in nltk
+    jobs: int
+        Number of processes preprocessing the corpus, -1 for all processors, default 1
+    batch_size: int
+        Number of texts sent at once to a process, default 500
+    cache: StemCache|None
+        Cache of the stems, a new one is used if None and stem is True
     
     Returns
     -------
-    None
+    StemCache|None
+        The cache of the stems shared by all fields, None if stem is False.
         The corpus DataFrame is directly modified
     """
-    data['title_preprocessed'] = [preprocess(title, stem, language) for title in data['title']]
-    data['content_preprocessed'] = [preprocess(content, stem, language) for content in data['content']]
-    data['h1_preprocessed'] = [preprocess(h1, stem, language) for h1 in data['h1']]
+    fields = ['title', 'content', 'h1']
+    if stem and cache is None:
+        cache = StemCache()
+
+    if jobs == 1:
+        for field in fields:
+            data[field+'_preprocessed'] = preprocess_batch(data[field], stem, language, cache)
+        return cache
+
+    # batches of all fields are given to the same pool, results are returned in the same order.
+    # each worker stems with its own cache, whose stems used and counts are merged in this one
+    batches = [(field, list(data[field][start:start+batch_size]))
+               for field in fields for start in range(0, len(data), batch_size)]
+    cache_size, cache_filename = (cache.max_size, cache.filename) if stem else (0, None)
+    results = Parallel(n_jobs=jobs)(delayed(preprocess_worker_batch)(texts, stem, language, cache_size, cache_filename)
+                                    for _, texts in batches)
+
+    processed = {field: [] for field in fields}
+    for (field, _), (result, used_stems, hits, misses) in zip(batches, results):
+        if stem:
+            cache.merge(used_stems, hits, misses)
+        processed[field].extend(result)
+    for field in fields:
+        data[field+'_preprocessed'] = processed[field]
+    return cache
 
 
 def compute_metadata(data:pd.DataFrame) -> dict:
@@ -91,6 +176,45 @@ def compute_metadata(data:pd.DataFrame) -> dict:
 
     return metadata
 
+def build_inverted_indexes(data:pd.DataFrame, attributes:list[str]) -> dict[str, dict[str, dict]]:
+    """Computes the positional and non positional inverted indexes of several fields in a single
+    pass over the documents
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        Corpus, with the preprocessed columns of the attributes
+    attributes: list[str]
+        Fields on which indexes should be built (among 'title', 'content' and 'h1')
+    
+    Returns
+    -------
+    dict[str, dict[str, dict]]
+        For each attribute, its 'positional' index token: {docId: list[int]} and its
+        'non_positional' index token: list[docIds]
+    """
+    ids = data.index.tolist()
+    columns = [data[attribute+'_preprocessed'].tolist() for attribute in attributes]
+    positional_indexes = [{} for _ in attributes]
+
+    for i, doc in enumerate(ids):
+        for column, inv_index in zip(columns, positional_indexes):
+            for position, token in enumerate(column[i]):
+                postings = inv_index.get(token)
+                if postings is None:
+                    inv_index[token] = {doc: [position]}
+                    continue
+                positions = postings.get(doc)
+                if positions is None:
+                    postings[doc] = [position]
+                else:
+                    positions.append(position)
+
+    # documents of a token are in the order of the corpus, as in the non positional index
+    return {attribute: {'positional': inv_index,
+                        'non_positional': {token: list(postings) for token, postings in inv_index.items()}}
+            for attribute, inv_index in zip(attributes, positional_indexes)}
+
 def compute_inverted_index(data:pd.DataFrame, attribute:str, positional:bool) -> dict:
     """Computes simple inverted index
 
@@ -108,30 +232,8 @@ def compute_inverted_index(data:pd.DataFrame, attribute:str, positional:bool) ->
     dict
         The computed (positional or not) inverted index, keys are tokens.
     """
-    inv_index = {}
-
-    # simple inverted index token: list[docIds]
-    if not positional:
-        for idx, row in data.iterrows():
-            for token in list(set(row[attribute+'_preprocessed'])):
-                if token in inv_index.keys():
-                    inv_index[token].append(idx)
-                else:
-                    inv_index[token] = [idx]
-    
-    # positional inverted index token: {docId: list[int]}
-    else:
-        for idx, row in data.iterrows():
-            tokenized = row[attribute+'_preprocessed']
-            for i in range(len(tokenized)):
-                if tokenized[i] in inv_index.keys():
-                    if idx in inv_index[tokenized[i]].keys():
-                        inv_index[tokenized[i]][idx].append(i)
-                    else:
-                        inv_index[tokenized[i]][idx] = [i]
-                else:
-                    inv_index[tokenized[i]] = {idx: [i]}
-    return inv_index
+    indexes = build_inverted_indexes(data, [attribute])[attribute]
+    return indexes['positional' if positional else 'non_positional']
 
 
 def save_json(data:dict, filename:str, sort_keys:bool=True) -> None:
@@ -157,14 +259,16 @@ def save_json(data:dict, filename:str, sort_keys:bool=True) -> None:
         data = dict(sorted(data.items()))
 
     for token, values in data.items():
+        # tokens can contain quotes or backslashes
+        key = json.dumps(token, ensure_ascii=False)
         if isinstance(values, dict):
             val_str = "{"
             for docId, pos in sorted(values.items()):
                 val_str += f'"{docId}": {pos}, '
             val_str = val_str.rstrip(", ") + "}"
-            json_str += f'    "{token}": {val_str},\n'
+            json_str += f'    {key}: {val_str},\n'
         else:
-            json_str += f'    "{token}": {values},\n'
+            json_str += f'    {key}: {values},\n'
     json_str = json_str.rstrip(",\n") + "\n"+"}"
 
     # save the formatted json string to filename
@@ -173,6 +277,13 @@ def save_json(data:dict, filename:str, sort_keys:bool=True) -> None:
 
     print(f"JSON file saved at: {filename}")
 
+def save_index(index:dict, filename:str, format:str) -> None:
+    """Writes an inverted index in the 'json' or 'binary' format (see postings.py)"""
+    if format == 'binary':
+        write_postings(index, filename)
+    else:
+        save_json(index, filename)
+
 def main() -> None:
     """Allows to run functions"""
 
@@ -181,7 +292,7 @@ def main() -> None:
 
     parser.add_argument("-c", "--corpus", 
                         default='crawled_urls.json', 
-                        help="Filename of corpus to create the index for, default 'crawled_urls.json'.",
+                        help="Filename of corpus to create the index for, can be the '.jsonl' document store of the crawler, default 'crawled_urls.json'.",
                         type=str)
     parser.add_argument("-m", "--metadata", 
                         default='metadata.json', 
@@ -206,35 +317,98 @@ def main() -> None:
                         help="Whether to compute a positional index, default False.",
                         type=bool,
                         choices=[True, False]),
+    parser.add_argument("-al", "--all", 
+                        default=False, 
+                        help="Whether to compute the positional and non positional indexes of all attributes at once, written as '[mon_stemmer.]{attribute}.pos_index.json' and '[mon_stemmer.]{attribute}.non_pos_index.json' ('.bin' in the binary format) in the directory of the index, default False.",
+                        type=bool,
+                        choices=[True, False]),
+    parser.add_argument("-fo", "--format", 
+                        default='json', 
+                        help="Format of the index files, 'binary' being the compressed format of postings.py, default 'json'.",
+                        type=str,
+                        choices=['json', 'binary'])
     parser.add_argument("-l", "--language", 
                         default='french', 
                         help="Main language of corpus, default 'french'.",
                         type=str,
                         choices=['french', 'english'])
+    parser.add_argument("-j", "--jobs", 
+                        default=1, 
+                        help="Number of processes preprocessing the corpus, -1 for all processors, default 1.",
+                        type=int)
+    parser.add_argument("-sc", "--stem_cache", 
+                        default=None, 
+                        help="JSON file in which stems are kept between runs, default None (stems are only cached during the run).",
+                        type=str)
+    parser.add_argument("-ss", "--stem_cache_size", 
+                        default=100000, 
+                        help="Maximum number of stems cached, default 100000.",
+                        type=int)
+    parser.add_argument("-dd", "--dedup_distance", 
+                        default=None, 
+                        help="If given, documents with the url of a previous document or whose SimHash fingerprint differs by at most this number of bits from a previous document are not indexed, default None (all documents are indexed).",
+                        type=int)
+    parser.add_argument("-d", "--documents", 
+                        default=None, 
+                        help="Filename to export the url, id and title of the documents for the ranking, default None (not exported).",
+                        type=str)
+    parser.add_argument("-st", "--doc_stats", 
+                        default=None, 
+                        help="Filename to save the statistics of the titles used by the ranking ('.npz'), default None (not saved).",
+                        type=str)
     
     args = parser.parse_args()
 
-    print(f"Creating a{' positional ' if args.positional else 'n '}inverted index on '{args.attribute}' for {args.corpus}...")
+    if args.all:
+        print(f"Creating the inverted indexes of all attributes for {args.corpus}...")
+    else:
+        print(f"Creating a{' positional ' if args.positional else 'n '}inverted index on '{args.attribute}' for {args.corpus}...")
 
     # load data
-    crawled_urls = pd.read_json(args.corpus, encoding='utf-8')
+    crawled_urls = load_corpus(args.corpus)
+
+    # remove duplicates before they are processed and add postings
+    if args.dedup_distance is not None:
+        nb_docs = len(crawled_urls)
+        crawled_urls = drop_duplicates(crawled_urls, args.dedup_distance)
+        print(f"{nb_docs-len(crawled_urls)} duplicate documents removed.")
 
     # process text fields and add them to the dataframe
-    preprocess_data(crawled_urls, args.stemming, args.language)
+    cache = StemCache(args.stem_cache_size, args.stem_cache) if args.stemming else None
+    preprocess_data(crawled_urls, args.stemming, args.language, args.jobs, cache=cache)
+    if cache is not None:
+        print(f"Stem cache: {cache.summary()}")
+        cache.save()
 
     # compute metadata and save to json
     metadata = compute_metadata(crawled_urls)
     save_json(metadata, args.metadata, sort_keys=False)
 
     # compute inverted index and save to json
-    inverted_index = compute_inverted_index(crawled_urls, args.attribute, args.positional)
-    save_json(inverted_index, args.index)
+    if args.all:
+        attributes = ['title', 'content', 'h1']
+        prefix = 'mon_stemmer.' if args.stemming else ''
+        for attribute, indexes in build_inverted_indexes(crawled_urls, attributes).items():
+            for kind, suffix in (('positional', 'pos_index'), ('non_positional', 'non_pos_index')):
+                filename = os.path.join(os.path.dirname(args.index), f"{prefix}{attribute}.{suffix}")
+                save_index(indexes[kind], filename + ('.bin' if args.format == 'binary' else '.json'), args.format)
+    else:
+        inverted_index = compute_inverted_index(crawled_urls, args.attribute, args.positional)
+        save_index(inverted_index, args.index, args.format)
+
+    # export documents for the ranking
+    if args.documents is not None:
+        export_documents(crawled_urls, args.documents)
+    if args.doc_stats is not None:
+        stats = compute_doc_stats([int(idx) for idx in crawled_urls.index], crawled_urls['title'].tolist(), args.language)
+        save_doc_stats(stats, args.doc_stats)
 
 
 if __name__=="__main__":
     
     main()
 
-    # non positional inverted index              : python3 main.py -i title.non_pos_index.json
-    # non positional inverted index with stemming: python3 main.py -i mon_stemmer.title.non_pos_index.json -s True
-    # positional inverted index                  : python3 main.py -i title.pos_index.json -p True
+    # from the root of the repository:
+    # non positional inverted index              : python3 -m index.main -c index/crawled_urls.json -i index/title.non_pos_index.json
+    # non positional inverted index with stemming: python3 -m index.main -c index/crawled_urls.json -i index/mon_stemmer.title.non_pos_index.json -s True
+    # positional inverted index                  : python3 -m index.main -c index/crawled_urls.json -i index/title.pos_index.json -p True
@@ -0,0 +1,408 @@
+"""
+postings.py
+
+Binary format of the inverted indexes, smaller and faster to load than JSON.
+
+A file is made of:
+    - a header: magic number, version, flags (positional or not), number of terms, and the
+      offsets of the term and postings blocks in the file,
+    - a table of nb_terms+1 entries (term offset, postings offset, document frequency), sorted
+      by term, the last entry giving the end of both blocks,
+    - the terms, encoded in utf-8 one after the other,
+    - the postings lists of the terms, as unsigned varints (7 bits per byte, high bit set on
+      every byte but the last of a number): the documents as deltas of their ids, then for a
+      positional index the number of positions of each document, then the positions of each
+      document as deltas from the previous position in the same document.
+"""
+
+import json
+import mmap
+import struct
+import argparse
+
+import numpy as np
+
+MAGIC = b'PIDX'
+VERSION = 1
+POSITIONAL = 1
+
+HEADER = struct.Struct('<4sBBxxIQQ')   # magic, version, flags, nb_terms, terms offset, postings offset
+ENTRY = struct.Struct('<QQI')          # term offset, postings offset, document frequency
+
+
+def encode_varints(values) -> bytes:
+    """Encodes non negative integers as unsigned varints.
+
+    Parameters
+    ----------
+    values: list[int]|np.ndarray
+        Integers to encode, lower than 2**64
+
+    Returns
+    -------
+    bytes
+        Varints of the integers, one after the other
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b''
+
+    # number of bytes of each value, 7 bits per byte
+    nb_bytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        nb_bytes += rest > 0
+        rest >>= np.uint64(7)
+
+    starts = np.cumsum(nb_bytes) - nb_bytes
+    encoded = np.empty(int(nb_bytes.sum()), dtype=np.uint8)
+    for k in range(int(nb_bytes.max())):
+        mask = nb_bytes > k
+        low_bits = (values[mask] >> np.uint64(7*k)) & np.uint64(0x7f)
+        encoded[starts[mask]+k] = low_bits.astype(np.uint8) | ((nb_bytes[mask] > k+1).astype(np.uint8) << 7)
+    return encoded.tobytes()
+
+def decode_varints(buffer) -> np.ndarray:
+    """Decodes unsigned varints.
+
+    Parameters
+    ----------
+    buffer: bytes|memoryview
+        Varints one after the other, the last one being complete
+
+    Returns
+    -------
+    np.ndarray
+        Decoded integers (uint64)
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    ends = (data & 0x80) == 0
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    # rank of each byte in its number, the first byte holding the lowest bits
+    value_of_byte = np.cumsum(ends) - ends
+    shifts = (7 * (np.arange(len(data)) - starts[value_of_byte])).astype(np.uint64)
+    return np.add.reduceat((data & 0x7f).astype(np.uint64) << shifts, starts)
+
+
+def encode_postings(postings, positional:bool) -> tuple[bytes, int]:
+    """Encodes the postings list of a term.
+
+    Parameters
+    ----------
+    postings: dict|list
+        Documents of the term: a list of docIds for a non positional index, a dictionnary
+        docId: positions for a positional index, positions being a list of int or a dictionnary
+        with a 'positions' key as in the index of the ranking
+    positional: bool
+        Whether postings has positions
+
+    Returns
+    -------
+    tuple[bytes, int]
+        Encoded postings and number of documents
+    """
+    if not positional:
+        docs = np.array(sorted(int(doc) for doc in postings), dtype=np.uint64)
+        return encode_varints(np.diff(docs, prepend=np.uint64(0))), len(docs)
+
+    docs = sorted((int(doc), positions['positions'] if isinstance(positions, dict) else positions)
+                  for doc, positions in postings.items())
+    doc_ids = np.array([doc for doc, _ in docs], dtype=np.uint64)
+    counts = [len(positions) for _, positions in docs]
+    position_deltas = []
+    for _, positions in docs:
+        previous = 0
+        for position in sorted(positions):
+            position_deltas.append(position - previous)
+            previous = position
+    values = np.concatenate((np.diff(doc_ids, prepend=np.uint64(0)),
+                             np.array(counts, dtype=np.uint64),
+                             np.array(position_deltas, dtype=np.uint64)))
+    return encode_varints(values), len(docs)
+
+def _ranges(starts:np.ndarray, lengths:np.ndarray) -> np.ndarray:
+    """Indices start, ..., start+length-1 of each range, one range after the other"""
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(int(lengths.sum()))
+
+def _segment_cumsum(values:np.ndarray, lengths:np.ndarray) -> np.ndarray:
+    """Cumulative sums of consecutive segments of values, restarting from 0 in each segment"""
+    sums = np.cumsum(values)
+    segment_starts = np.cumsum(lengths) - lengths
+    return sums - np.repeat(np.concatenate(([0], sums))[segment_starts], lengths)
+
+def decode_postings(values:np.ndarray, value_starts:list[int], nb_docs:list[int], positional:bool) -> list:
+    """Decodes the postings lists of several terms from their varints (see encode_postings).
+
+    Parameters
+    ----------
+    values: np.ndarray
+        Decoded varints of the postings lists
+    value_starts: list[int]
+        Index in values of the first varint of each term
+    nb_docs: list[int]
+        Number of documents of each term
+    positional: bool
+        Whether the index has positions
+
+    Returns
+    -------
+    list[dict[int, list[int]]|list[int]]
+        Positions in each document for a positional index, list of docIds otherwise, for each term
+    """
+    values = values.astype(np.int64)
+    value_starts = np.asarray(value_starts, dtype=np.int64)
+    nb_docs = np.asarray(nb_docs, dtype=np.int64)
+
+    docs = _segment_cumsum(values[_ranges(value_starts, nb_docs)], nb_docs).tolist()
+    term_ends = np.cumsum(nb_docs).tolist()
+    term_starts = [0] + term_ends[:-1]
+    if not positional:
+        return [docs[start:end] for start, end in zip(term_starts, term_ends)]
+
+    counts = values[_ranges(value_starts + nb_docs, nb_docs)]
+    count_sums = np.concatenate(([0], np.cumsum(counts)))
+    nb_positions = count_sums[term_ends] - count_sums[term_starts]
+    positions = _segment_cumsum(values[_ranges(value_starts + 2*nb_docs, nb_positions)], counts).tolist()
+
+    doc_ends = np.cumsum(counts).tolist()
+    doc_positions = [positions[start:end] for start, end in zip([0] + doc_ends[:-1], doc_ends)]
+    return [dict(zip(docs[start:end], doc_positions[start:end])) for start, end in zip(term_starts, term_ends)]
+
+
+def is_postings_file(filename:str) -> bool:
+    """Whether filename is an index in the binary format"""
+    with open(filename, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+def write_postings(index:dict, filename:str) -> None:
+    """Writes an inverted index in the binary format.
+
+    Parameters
+    ----------
+    index: dict
+        Inverted index, either non positional token: list[docIds] or positional token: {docId: positions}
+    filename: str
+        Name of file in which we should save the index
+
+    Returns
+    -------
+    None
+    """
+    terms = sorted(index)
+    positional = any(isinstance(postings, dict) for postings in index.values())
+
+    encoded_terms = []
+    encoded_postings = []
+    entries = []
+    term_offset = postings_offset = 0
+    for term in terms:
+        encoded_term = term.encode('utf-8')
+        postings, nb_docs = encode_postings(index[term], positional)
+        entries.append(ENTRY.pack(term_offset, postings_offset, nb_docs))
+        encoded_terms.append(encoded_term)
+        encoded_postings.append(postings)
+        term_offset += len(encoded_term)
+        postings_offset += len(postings)
+    entries.append(ENTRY.pack(term_offset, postings_offset, 0))
+
+    terms_start = HEADER.size + len(entries)*ENTRY.size
+    with open(filename, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, POSITIONAL if positional else 0, len(terms),
+                               terms_start, terms_start+term_offset))
+        file.write(b''.join(entries))
+        file.write(b''.join(encoded_terms))
+        file.write(b''.join(encoded_postings))
+
+    print(f"Postings file saved at: {filename}")
+
+def read_postings(filename:str) -> dict:
+    """Loads a whole inverted index written by write_postings.
+
+    Parameters
+    ----------
+    filename: str
+        Name of the binary index file
+
+    Returns
+    -------
+    dict
+        Inverted index, token: {docId: list[int]} if positional, token: list[docIds] otherwise
+    """
+    with open(filename, 'rb') as file:
+        data = file.read()
+
+    magic, version, flags, nb_terms, terms_start, postings_start = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{filename} is not an index in the binary format version {VERSION}")
+    positional = bool(flags & POSITIONAL)
+
+    entries = np.frombuffer(data, dtype=np.dtype([('term', '<u8'), ('postings', '<u8'), ('docs', '<u4')]),
+                            count=nb_terms+1, offset=HEADER.size)
+    term_offsets = (entries['term'] + terms_start).tolist()
+    terms = [data[start:end].decode('utf-8') for start, end in zip(term_offsets[:-1], term_offsets[1:])]
+
+    # all varints are decoded at once, then split by term
+    postings_data = np.frombuffer(data, dtype=np.uint8, offset=postings_start)
+    values = decode_varints(postings_data)
+    value_starts = np.concatenate(([0], np.cumsum((postings_data & 0x80) == 0)))[entries['postings'].astype(np.int64)]
+
+    return dict(zip(terms, decode_postings(values, value_starts[:-1], entries['docs'][:-1], positional)))
+
+class PostingsReader():
+
+    def __init__(self, filename:str) -> None:
+        """Reads the postings lists of a binary index on demand: the file is memory mapped,
+        terms are found by binary search in the sorted term table, and only the postings
+        lists which are asked for are decoded, so that opening an index and answering a query
+        do not depend on the size of the vocabulary.
+
+        Attributes
+        ----------
+        filename: str
+            Name of the binary index file.
+        positional: bool
+            Whether the index has positions.
+        __nb_terms: int
+            Number of terms of the index.
+        __terms_start: int
+            Offset of the terms in the file.
+        __postings_start: int
+            Offset of the postings lists in the file.
+        __data: mmap.mmap
+            Content of the file.
+        """
+        self.filename = filename
+        with open(filename, 'rb') as file:
+            self.__data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, flags, self.__nb_terms, self.__terms_start, self.__postings_start = HEADER.unpack_from(self.__data)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{filename} is not an index in the binary format version {VERSION}")
+        self.positional = bool(flags & POSITIONAL)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.__nb_terms
+
+    def __contains__(self, term:str) -> bool:
+        return self.find(term) is not None
+
+    def __getitem__(self, term:str):
+        postings = self.postings(term)
+        if postings is None:
+            raise KeyError(term)
+        return postings
+
+    def __entry(self, i:int) -> tuple[int, int, int]:
+        """Term offset, postings offset and document frequency of the i-th term"""
+        return ENTRY.unpack_from(self.__data, HEADER.size + i*ENTRY.size)
+
+    def __term(self, i:int) -> bytes:
+        start = self.__entry(i)[0]
+        end = self.__entry(i+1)[0]
+        return self.__data[self.__terms_start+start:self.__terms_start+end]
+
+    def find(self, term:str) -> int|None:
+        """Index of a term in the term table, None if it is not in the index.
+        Terms are sorted as strings, which is also the order of their utf-8 encodings."""
+        encoded_term = term.encode('utf-8')
+        low, high = 0, self.__nb_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self.__term(middle) < encoded_term:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.__nb_terms and self.__term(low) == encoded_term:
+            return low
+        return None
+
+    def doc_frequency(self, term:str) -> int:
+        """Number of documents of a term, without decoding its postings list"""
+        i = self.find(term)
+        return 0 if i is None else self.__entry(i)[2]
+
+    def postings(self, term:str) -> dict[int, list[int]]|list[int]|None:
+        """Decodes the postings list of a term, None if it is not in the index.
+
+        Returns
+        -------
+        dict[int, list[int]]|list[int]|None
+            Positions in each document for a positional index, list of docIds otherwise
+        """
+        i = self.find(term)
+        if i is None:
+            return None
+        _, start, nb_docs = self.__entry(i)
+        end = self.__entry(i+1)[1]
+        values = decode_varints(self.__data[self.__postings_start+start:self.__postings_start+end])
+        return decode_postings(values, [0], [nb_docs], self.positional)[0]
+
+    def close(self) -> None:
+        self.__data.close()
+
+
+def read_json_index(filename:str) -> dict:
+    """Loads an inverted index saved as JSON. Indexes written by previous versions of the
+    indexer did not escape their tokens, such files are read line by line, each line
+    being a token and its postings."""
+    with open(filename, encoding='utf-8') as file:
+        text = file.read()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    index = {}
+    for line in text.splitlines()[1:-1]:
+        line = line.strip().rstrip(',')
+        # the token ends at the first '": ' followed by valid postings
+        separator = line.find('": ')
+        while separator != -1:
+            try:
+                index[line[1:separator]] = json.loads(line[separator+3:])
+                break
+            except json.JSONDecodeError:
+                separator = line.find('": ', separator+1)
+        else:
+            raise ValueError(f"{filename} is not a JSON inverted index")
+    return index
+
+def convert_json(json_filename:str, postings_filename:str) -> None:
+    """Converts an inverted index saved as JSON (by the indexer or as expected by the ranking)
+    to the binary format"""
+    write_postings(read_json_index(json_filename), postings_filename)
+
+
+def main() -> None:
+    """Converts a JSON index to the binary format"""
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("json_index",
+                        help="Filename of the JSON inverted index to convert.",
+                        type=str)
+    parser.add_argument("postings",
+                        help="Filename of the binary index to write.",
+                        type=str)
+
+    args = parser.parse_args()
+
+    convert_json(args.json_index, args.postings)
+
+
+if __name__=="__main__":
+
+    main()
+
+    # example: python3 -m index.postings index/title.pos_index.json index/title.pos_index.bin
@@ -0,0 +1,214 @@
+"""
+preprocessing.py
+
+Tokenization and stemming of the texts of the corpus. These functions are in their own module
+so that the processes of the parallel preprocessing can import them (functions defined in the
+script run as __main__ can not be sent to them).
+"""
+
+import os
+import json
+import functools
+
+from collections import OrderedDict
+
+#import nltk
+#nltk.download('punkt')
+from nltk.tokenize import word_tokenize
+from nltk.stem.snowball import SnowballStemmer
+
+
+@functools.lru_cache(maxsize=None)
+def get_stemmer(language:str) -> SnowballStemmer:
+    """Returns the stemmer of a language, created once per process"""
+    return SnowballStemmer(language=language)
+
+
+class StemCache():
+
+    def __init__(self, max_size:int=100000, filename:str|None=None, track_used:bool=False) -> None:
+        """Stems of the tokens already stemmed, most tokens of a corpus being occurrences of a
+        small vocabulary. The least recently used stems are forgotten once max_size are kept.
+
+        Attributes
+        ----------
+        max_size: int
+            Maximum number of stems kept, default = 100000.
+        filename: str|None
+            JSON file from which the stems are loaded and to which they are saved, None to not
+            keep them between runs.
+        hits: int
+            Number of stems found in the cache.
+        misses: int
+            Number of stems computed by the stemmer.
+        track_used: bool
+            Whether the stems used are also kept until take_used_stems is called, so that a
+            worker of the parallel preprocessing sends them to the main process, default False.
+        __stems: OrderedDict[tuple[str, str], str]
+            Stem of each (token, language), from the least to the most recently used.
+        """
+        self.max_size = max_size
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        self.track_used = track_used
+        self.__stems = OrderedDict()
+        self.__used_stems = {}
+
+        if filename is not None and os.path.exists(filename):
+            try:
+                with open(filename, encoding='utf-8') as file:
+                    stems = json.load(file)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Error loading stem cache {filename}: {e}")
+                stems = {}
+            for language, tokens in stems.items():
+                for token, token_stem in tokens.items():
+                    if len(self.__stems) >= max_size:
+                        break
+                    self.__stems[(token, language)] = token_stem
+
+    def __len__(self) -> int:
+        return len(self.__stems)
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of the stems found in the cache"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stem(self, tokens:list[str], language:str) -> list[str]:
+        """Stems tokens, computing only the stems not in the cache"""
+        stems = self.__stems
+        stemmed = []
+        for token in tokens:
+            key = (token, language)
+            token_stem = stems.get(key)
+            if token_stem is None:
+                self.misses += 1
+                token_stem = stems[key] = get_stemmer(language).stem(token)
+                if len(stems) > self.max_size:
+                    stems.popitem(last=False)
+            else:
+                self.hits += 1
+                stems.move_to_end(key)
+            if self.track_used:
+                self.__used_stems[key] = token_stem
+            stemmed.append(token_stem)
+        return stemmed
+
+    def take_used_stems(self) -> dict[tuple[str, str], str]:
+        """Returns the stems used since the last call (if track_used)"""
+        used_stems, self.__used_stems = self.__used_stems, {}
+        return used_stems
+
+    def merge(self, stems:dict[tuple[str, str], str], hits:int, misses:int) -> None:
+        """Adds the stems and the counts of another cache (e.g. of a worker)"""
+        self.hits += hits
+        self.misses += misses
+        for key, token_stem in stems.items():
+            self.__stems[key] = token_stem
+            self.__stems.move_to_end(key)
+            if len(self.__stems) > self.max_size:
+                self.__stems.popitem(last=False)
+
+    def save(self) -> None:
+        """Writes the stems to filename, if any, to be reused by the next run"""
+        if self.filename is None:
+            return
+        stems = {}
+        for (token, language), token_stem in self.__stems.items():
+            stems.setdefault(language, {})[token] = token_stem
+        with open(self.filename, "w", encoding='utf-8') as json_file:
+            json.dump(stems, json_file, ensure_ascii=False)
+
+    def summary(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses (hit rate {self.hit_rate:.1%}), {len(self)} stems cached"
+
+
+def preprocess(text:str, stem:bool, language:str, cache:StemCache|None=None) -> list[str]:
+    """Tokenizes and stems text
+    
+    Parameters
+    ----------
+    test: str
+        String to process
+    stem: bool
+        If True stemming is used, otherwise we only tokenize
+    language: str
+        Language of the corpus, from languages available in nltk
+    cache: StemCache|None
+        Cache of the stems, shared by the calls, None to stem every token
+    
+    Returns
+    -------
+    list[str]
+        List of tokens
+    """
+    processed_text = word_tokenize(text, language=language)
+    if stem:
+        if cache is not None:
+            return cache.stem(processed_text, language)
+        stemmer = get_stemmer(language)
+        processed_text = [stemmer.stem(token) for token in processed_text]
+    return processed_text
+
+def preprocess_batch(texts:list[str], stem:bool, language:str, cache:StemCache|None=None) -> list[list[str]]:
+    """Tokenizes and stems a batch of texts, run by the workers of the parallel preprocessing
+    
+    Parameters
+    ----------
+    texts: list[str]
+        Strings to process
+    stem: bool
+        If True stemming is used, otherwise we only tokenize
+    language: str
+        Language of the corpus, from languages available in nltk
+    cache: StemCache|None
+        Cache of the stems, None to stem every token
+    
+    Returns
+    -------
+    list[list[str]]
+        List of tokens of each text
+    """
+    return [preprocess(text, stem, language, cache) for text in texts]
+
+@functools.lru_cache(maxsize=None)
+def get_worker_cache(max_size:int, filename:str|None) -> StemCache:
+    """Returns the stem cache of the current process, kept between the batches it preprocesses"""
+    return StemCache(max_size, filename, track_used=True)
+
+def preprocess_worker_batch(texts:list[str], stem:bool, language:str, cache_size:int=100000,
+                            cache_filename:str|None=None) -> tuple[list[list[str]], dict, int, int]:
+    """Tokenizes and stems a batch of texts in a worker of the parallel preprocessing, with the
+    stem cache of the worker
+    
+    Parameters
+    ----------
+    texts: list[str]
+        Strings to process
+    stem: bool
+        If True stemming is used, otherwise we only tokenize
+    language: str
+        Language of the corpus, from languages available in nltk
+    cache_size: int
+        Maximum number of stems of the cache of the worker, default 100000
+    cache_filename: str|None
+        JSON file from which the cache of the worker loads its first stems, None to start empty
+    
+    Returns
+    -------
+    tuple[list[list[str]], dict, int, int]
+        List of tokens of each text, and the stems used, hits and misses of the cache of the
+        worker for this batch, to be merged in the cache of the main process (the stems used 
+        and not only the ones computed, the cache of a worker reused by another call knowing 
+        stems which the main process does not)
+    """
+    if not stem:
+        return preprocess_batch(texts, False, language), {}, 0, 0
+
+    cache = get_worker_cache(cache_size, cache_filename)
+    hits, misses = cache.hits, cache.misses
+    tokens = preprocess_batch(texts, True, language, cache)
+    return tokens, cache.take_used_stems(), cache.hits - hits, cache.misses - misses
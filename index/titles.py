@@ -0,0 +1,33 @@
+"""
+titles.py
+
+Tokenization of the titles by the ranking (ranking/main.py) and weight of the stopwords in its
+scores. They are shared with the statistics of the documents computed with the index
+(docstats.py), which are only valid for the tokenizer and the weight they were computed with.
+"""
+
+import re
+
+# version of tokenize, to be increased whenever it changes: statistics of the documents computed
+# with another version are rejected by the ranking
+TOKENIZER_VERSION = 1
+
+# weight of stopwords in the ranking, stopword-weighted lengths of the titles are computed with it
+STOPWORDS_WEIGHT = 0.2
+
+
+def tokenize(text:str) -> list[str]:
+    """Tokenizes a string (lowers+splits by whitespaces).
+
+    Parameter
+    ---------
+    text: str
+        String to tokenize
+
+    Returns
+    -------
+    list[str]
+        List of tokens
+    """
+    text = re.sub(r' +', ' ', text)
+    return text.lower().split(' ')
@@ -2,44 +2,130 @@
 main.py
 """
 
-import re
 import json
 import math
+import heapq
+import time
 import argparse
+import functools
+import itertools
+import numpy as np
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 
 from nltk.corpus import stopwords
 
-def tokenize(text: str) -> list[str]:
-    """Tokenizes a string (lowers+splits by whitespaces).
-    
+# binary indexes and statistics of the documents are read with the modules of the indexer
+from index.postings import is_postings_file, PostingsReader
+from index.docstats import load_doc_stats
+# titles are tokenized and stopwords weighted as in the statistics of the documents
+from index.titles import tokenize, STOPWORDS_WEIGHT, TOKENIZER_VERSION
+
+# weigths to compute the score in linear_ranking 
+WEIGHTS = {"num_q_tokens_in_title": 1,
+           "prop_tokens": 0.5,
+           "position": 1.0,
+           "bm25": 1,
+           "order": 2,
+           "stopwords": STOPWORDS_WEIGHT
+           }
+
+@functools.lru_cache(maxsize=None)
+def get_stopwords(language: str) -> frozenset[str]:
+    """Computes the set of stopwords in a given language, loaded once per process
+
     Parameter
     ---------
-    text: str
-        String to tokenize
+    language: str
+        Language of the corpus
     
     Returns
     -------
-    list[str]
-        List of tokens
+    frozenset[str]
+        Stopwords in language, immutable as it is shared by all the calls
     """
-    text = re.sub(r' +', ' ', text)
-    return text.lower().split(' ')
+    lstopwords = frozenset(stopwords.words(language))
+    return lstopwords
 
-def get_stopwords(language: str) -> list[str]:
-    """Computes the list of stopwords in a given language
+def open_index(filename: str) -> dict[str, dict]|PostingsReader:
+    """Opens a positional index, either saved as JSON, in which case it is entirely loaded,
+    or in the binary format of the indexer (index/postings.py), in which case it is memory
+    mapped and postings lists are only read when needed (see query_postings)
 
     Parameter
     ---------
-    language: str
-        Language of the corpus
+    filename: str
+        Filename of the positional index
     
     Returns
     -------
-    list[str]
-        List of stopwords in language
+    dict[str, dict]|PostingsReader
+        Positional index, either loaded or opened
     """
-    lstopwords = set(stopwords.words(language))
-    return lstopwords
+    if not is_postings_file(filename):
+        with open(filename) as f:
+            return json.load(f)
+
+    index = PostingsReader(filename)
+    if not index.positional:
+        index.close()
+        raise ValueError(f"{filename} is not a positional index")
+    return index
+
+def query_postings(index: dict[str, dict]|PostingsReader, tokens: set[str]) -> dict[str, dict]:
+    """Postings of the tokens of a query, only these postings lists are decoded from a
+    binary index
+
+    Parameters
+    ----------
+    index: dict[str, dict]|PostingsReader
+        Positional index returned by open_index
+    tokens: set[str]
+        Tokens of the query
+    
+    Returns
+    -------
+    dict[str, dict]
+        Positional index restricted to the tokens of the query which are in the index, each
+        key is a token and the values are documents in which the token appears. Documents of
+        a binary index are int docIds with the positions as decoded by the reader, documents
+        of a JSON index are str docIds with the positions and the count (see doc_postings).
+    """
+    if isinstance(index, dict):
+        return {token: index[token] for token in tokens if token in index}
+
+    postings = {}
+    for token in tokens:
+        token_postings = index.postings(token)
+        if token_postings is not None:
+            postings[token] = token_postings
+    return postings
+
+def doc_postings(postings: dict, doc_id: int) -> tuple[list[int], int]|None:
+    """Positions and count of a token in a document, from the postings of the token returned
+    by query_postings (int docIds and positions for a binary index, str docIds with the
+    positions and the count for a JSON index)
+
+    Parameters
+    ----------
+    postings: dict
+        Documents in which the token appears
+    doc_id: int
+        DocId of the document
+
+    Returns
+    -------
+    tuple[list[int], int]|None
+        Positions of the token in the document and its count, None if it is not in the document
+    """
+    positions = postings.get(doc_id)
+    if positions is not None:
+        return positions, len(positions)
+    value = postings.get(str(doc_id))
+    if value is not None:
+        return value['positions'], value['count']
+    return None
 
 def compute_metadata(data: list[dict]) -> dict[str, float]:
     """Computes statistics about the corpus
@@ -67,50 +153,74 @@ def compute_metadata(data: list[dict]) -> dict[str, float]:
 
     return metadata
 
-def filter_docs(index:dict[str, dict], query:str, filter:str) -> list[int]:
+def filter_docs(index:dict[str, dict], query:str, filter:str, arrays:dict[str, tuple]|None=None) -> list[int]:
     """Filters documents having all of the query's tokens
+
+    Postings are used as sorted arrays of docIds: 'AND' starts from the rarest token and
+    keeps its documents found in the postings of the other tokens by binary search (from the
+    rarest to the most frequent), 'OR' merges the sorted postings of all tokens.
     
     Parameters
     ----------
     index: dict[str, dict]
-        Positional index, each key is a token and the values are documents in which
-        the token appears, with the positions and the count.
+        Positional index of the query tokens returned by query_postings, each key is a token
+        and the values are documents in which the token appears (see doc_postings).
     query: str
         Query entered by user
     filter: str
         Type of filter to select documents according to whether they contains all of
         the query's tokens or at least one. Either 'AND' or 'OR'.
+    arrays: dict[str, tuple]|None
+        Postings of the tokens converted by postings_arrays, filled with the tokens missing,
+        to convert them once for the filter and the ranking, None to only convert the docIds
     
     Returns
     -------
     list[int]
-        List of docIds which were filtered.
+        Sorted list of docIds which were filtered, empty if no query token is in the index.
     """
     # tokenize the query
     tokenized_query = tokenize(query)
 
     # check if all query tokens are in index
     # if not ignore these tokens
-    tokenized_query = [token for token in tokenized_query if token in index.keys()]
+    tokenized_query = [token for token in set(tokenized_query) if token in index.keys()]
+    if not tokenized_query:
+        return []
 
-    if filter=='OR':
-        docs = []
+    # sorted docIds of the tokens, only the docIds being converted if the arrays are not kept
+    if arrays is not None:
         for token in tokenized_query:
-            # only keep documents which contain at least one query token
-            docs = list(set(docs) | set(int(doc) for doc in index[token].keys()))
+            if token not in arrays:
+                arrays[token] = postings_arrays(index[token])
+        postings = [arrays[token][0] for token in tokenized_query]
+    else:
+        postings = [np.sort(np.fromiter(map(int, index[token].keys()), dtype=np.int64, count=len(index[token])))
+                    for token in tokenized_query]
+    postings.sort(key=len)
+
+    if filter=='OR':
+        # only keep documents which contain at least one query token: the sorted postings are
+        # merged by a stable sort (which merges sorted runs), and duplicates are removed
+        docs = np.sort(np.concatenate(postings), kind='stable')
+        docs = docs[np.concatenate(([True], docs[1:] != docs[:-1]))] if len(docs) else docs
     else: # default behaviour = 'AND'
-        docs = list(index[tokenized_query[0]].keys())
-        for token in tokenized_query[1:]:
+        docs = postings[0]
+        for token_docs in postings[1:]:
+            if not len(docs):
+                break
             # only keep documents which contain all the previous tokens
-            docs = [int(doc) for doc in docs if str(doc) in index[token].keys()]    
-    return docs
+            rows = np.minimum(np.searchsorted(token_docs, docs), len(token_docs)-1)
+            docs = docs[token_docs[rows] == docs]
+    return docs.tolist()
 
 def linear_ranking(query:str, 
                    filtered_docs:list[dict], 
                    index:dict[str, dict], 
                    weights:dict[str, float],
                    metadata:dict[str, float],
-                   language:str) -> dict[int, int]:
+                   language:str,
+                   doc_stats:dict|None=None) -> dict[int, int]:
     """Ranks documents based on a linear ranking score.
 
     This score is a weighted sum of four different scores:
@@ -133,14 +243,17 @@ def linear_ranking(query:str,
     filtered_docs: list[dict]
         List of documents corresponding to documents selected by the filter
     index: dict[str, dict]
-        Positional index, each key is a token and the values are documents in which
-        the token appears, with the positions and the count.
+        Positional index of the query tokens returned by query_postings, each key is a token
+        and the values are documents in which the token appears (see doc_postings).
     weights: dict[str, float]
         Weights associated to each score and stopwords
     metadata: dict[str, float]
         Dictionnary of statistics computed about the corpus
     language: str
         Language of the corpus (e.g. 'french', 'english',...)
+    doc_stats: dict|None
+        Statistics of the titles computed with the index (see index/docstats.py), None to
+        compute the lengths of the titles of the filtered documents
 
     Returns
     -------
@@ -156,6 +269,11 @@ def linear_ranking(query:str,
     # stopwords list
     lstopwords = get_stopwords(language)
 
+    # stopword-weighted lengths of the titles can only be used if computed with the same weight
+    weighted_lengths = None
+    if doc_stats is not None and doc_stats['stopwords_weight'] == weights['stopwords']:
+        weighted_lengths = doc_stats['weighted_length']
+
     # compute scores for each document
     for document in filtered_docs:
         doc_id = document['id']
@@ -171,14 +289,22 @@ def linear_ranking(query:str,
         score += weights['num_q_tokens_in_title']*num_q_tokens_in_title
 
         # score 2: nb token of query in title/nb of tokens in title$
-        num_tokens_in_title = sum([weights['stopwords'] if tok in lstopwords else 1 for tok in tokenized_title])
+        if weighted_lengths is not None:
+            num_tokens_in_title = weighted_lengths[doc_id]
+        else:
+            num_tokens_in_title = sum([weights['stopwords'] if tok in lstopwords else 1 for tok in tokenized_title])
         score += weights['prop_tokens'] * num_q_tokens_in_title/num_tokens_in_title
 
+        # fieldLen/avg(fieldLen) of bm25
+        field_len = doc_stats['field_length'][doc_id] if doc_stats is not None else len(tokenize(title))
+        avg_field_len = metadata['mean_nb_tokens_title']
+
         l_positions = []
         bm25 = 0
         for token in query_tokens:
-            if token in index.keys() and str(doc_id) in index[token]:
-                positions = index[token][str(doc_id)]['positions']
+            token_doc = doc_postings(index[token], doc_id) if token in index.keys() else None
+            if token_doc is not None:
+                positions, freq_tok_in_doc = token_doc
                 l_positions.append(positions)
 
                 # score 3: the closer tokens are to the beginning of a sentence, the bigger the weight
@@ -192,11 +318,7 @@ def linear_ranking(query:str,
                 k1 = 1.2
                 # compute inverse document frequency
                 idf = math.log(metadata['nb_doc']/len(index[token].keys()))
-                # compute the frequency (count) of token in title of doc
-                freq_tok_in_doc = index[token][str(doc_id)]['count']
-                # fieldLen/avg(fieldLen)
-                field_len = len(tokenize(title))
-                avg_field_len = metadata['mean_nb_tokens_title']
+                # freq_tok_in_doc is the frequency (count) of token in title of doc
                 bm25 += idf*(freq_tok_in_doc*(k1+1))/(freq_tok_in_doc+k1*(1-b+b*field_len/avg_field_len))
 
         
@@ -214,14 +336,444 @@ def linear_ranking(query:str,
 
     return ranks
 
-def format_ranking_results(documents: list[dict], ranking:dict[int, int]) -> list[dict]:
-    """Create results dictionnary, taking ranked docIds and associating the 
-    corresponding titles and urls.
+def build_title_words(documents: list[dict]) -> dict[str, np.ndarray]:
+    """Computes the documents whose title contains each word, titles being split as in
+    linear_ranking (which is not the tokenization of the index)
+
+    Parameter
+    ---------
+    documents: list[dict]
+        Corpus of documents
+    
+    Returns
+    -------
+    dict[str, np.ndarray]
+        Sorted docIds of the documents having each word in their title
+    """
+    title_words = {}
+    for document in documents:
+        for word in set(document['title'].lower().split()):
+            title_words.setdefault(word, []).append(document['id'])
+    return {word: np.array(sorted(ids), dtype=np.int64) for word, ids in title_words.items()}
+
+def postings_arrays(postings: dict[str, dict]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Converts the postings of a token to arrays
     
+    Parameter
+    ---------
+    postings: dict
+        Documents in which the token appears, as returned by query_postings: int docIds with 
+        the positions (binary index), or str docIds with the positions and the count (JSON index)
+    
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        Sorted docIds, and for each of them the count of the token, the number of positions, 
+        and the index of its first position in the last array, the positions of all documents
+    """
+    nb_docs = len(postings)
+    values = list(postings.values())
+    docs = np.fromiter(map(int, postings.keys()), dtype=np.int64, count=nb_docs)
+    if nb_docs and isinstance(values[0], dict):
+        # JSON index
+        counts = np.fromiter((value['count'] for value in values), dtype=np.int64, count=nb_docs)
+        values = [value['positions'] for value in values]
+        lengths = np.fromiter(map(len, values), dtype=np.int64, count=nb_docs)
+    else:
+        lengths = np.fromiter(map(len, values), dtype=np.int64, count=nb_docs)
+        counts = lengths
+    positions = np.fromiter(itertools.chain.from_iterable(values), dtype=np.int64, count=int(lengths.sum()))
+    starts = np.cumsum(lengths) - lengths
+
+    order = np.argsort(docs, kind='stable')
+    return docs[order], counts[order], lengths[order], starts[order], positions
+
+def linear_scores(query:str, 
+                  filtered_docs:list[dict], 
+                  index:dict[str, dict], 
+                  weights:dict[str, float],
+                  metadata:dict[str, float],
+                  language:str,
+                  doc_stats:dict|None=None,
+                  title_words:dict[str, np.ndarray]|None=None,
+                  arrays:dict[str, tuple]|None=None) -> np.ndarray:
+    """Computes the linear ranking score of linear_ranking for all documents at once with 
+    arrays instead of one document after the other.
+
+    Scores are computed with the same operations in the same order as linear_ranking, so that
+    they are exactly equal. The score of a document does not depend on the other filtered
+    documents.
+
+    Parameters
+    ----------
+    query: str
+        Query entered by user
+    filtered_docs: list[dict]
+        List of documents corresponding to documents selected by the filter
+    index: dict[str, dict]
+        Positional index of the query tokens returned by query_postings, each key is a token
+        and the values are documents in which the token appears (see doc_postings).
+    weights: dict[str, float]
+        Weights associated to each score and stopwords
+    metadata: dict[str, float]
+        Dictionnary of statistics computed about the corpus
+    language: str
+        Language of the corpus (e.g. 'french', 'english',...)
+    doc_stats: dict|None
+        Statistics of the titles computed with the index (see index/docstats.py), None to
+        compute the lengths of the titles of the filtered documents
+    title_words: dict[str, np.ndarray]|None
+        Documents whose title contains each word (see build_title_words), None to split
+        the titles of the filtered documents
+    arrays: dict[str, tuple]|None
+        Postings of the tokens converted by postings_arrays, filled with the tokens missing,
+        to convert them once when scoring documents in several calls
+
+    Returns
+    -------
+    np.ndarray
+        Score of each document of filtered_docs
+    """
+    # tokenize the query
+    query_tokens = query.lower().split()
+
+    # stopwords list
+    lstopwords = get_stopwords(language)
+
+    nb_docs = len(filtered_docs)
+    doc_ids = np.fromiter((document['id'] for document in filtered_docs), dtype=np.int64, count=nb_docs)
+
+    # lengths of the titles
+    tokenized_titles = None
+    if doc_stats is not None:
+        field_len = np.asarray(doc_stats['field_length'])[doc_ids]
+    else:
+        field_len = np.array([len(tokenize(document['title'].lower())) for document in filtered_docs], dtype=np.int64)
+    if doc_stats is not None and doc_stats['stopwords_weight'] == weights['stopwords']:
+        num_tokens_in_title = np.asarray(doc_stats['weighted_length'])[doc_ids]
+    else:
+        tokenized_titles = [document['title'].lower().split() for document in filtered_docs]
+        num_tokens_in_title = np.array([sum([weights['stopwords'] if tok in lstopwords else 1 for tok in tokenized_title])
+                                        for tokenized_title in tokenized_titles], dtype=np.float64)
+
+    # score 1: nb of query tokens in title (stopwords don't count as much as non stopwords)
+    num_q_tokens_in_title = np.zeros(nb_docs)
+    for tok in list(set(query_tokens)):
+        if title_words is not None:
+            in_title = np.isin(doc_ids, title_words.get(tok, np.zeros(0, dtype=np.int64)))
+        else:
+            if tokenized_titles is None:
+                tokenized_titles = [document['title'].lower().split() for document in filtered_docs]
+            in_title = np.array([tok in tokenized_title for tokenized_title in tokenized_titles], dtype=bool)
+        num_q_tokens_in_title += np.where(in_title, weights['stopwords'] if tok in lstopwords else 1, 0)
+
+    score = np.zeros(nb_docs)
+    score += weights['num_q_tokens_in_title']*num_q_tokens_in_title
+
+    # score 2: nb token of query in title/nb of tokens in title
+    score += weights['prop_tokens'] * num_q_tokens_in_title/num_tokens_in_title
+
+    b= 0.75
+    k1 = 1.2
+    avg_field_len = metadata['mean_nb_tokens_title']
+
+    bm25 = np.zeros(nb_docs)
+    num_ordered_pairs = np.zeros(nb_docs, dtype=np.int64)
+    previous_min = np.zeros(nb_docs, dtype=np.int64)
+    has_previous = np.zeros(nb_docs, dtype=bool)
+    if arrays is None:
+        arrays = {}
+    for token in query_tokens:
+        if token not in index.keys():
+            continue
+        if token not in arrays:
+            arrays[token] = postings_arrays(index[token])
+        docs, counts, lengths, starts, positions = arrays[token]
+
+        # documents of the token among the filtered documents
+        rows = np.minimum(np.searchsorted(docs, doc_ids), max(len(docs)-1, 0))
+        present = (docs[rows] == doc_ids) if len(docs) else np.zeros(nb_docs, dtype=bool)
+        doc_lengths = np.where(present, lengths[rows], 0) if len(docs) else np.zeros(nb_docs, dtype=np.int64)
+
+        # score 3: the closer tokens are to the beginning of a sentence, the bigger the weight
+        # unless token is a stopword in which case we don't count it as much.
+        # positions are added one after the other, as sum does
+        discount = weights['stopwords'] if token in lstopwords else 1
+        pos_score = np.zeros(nb_docs)
+        min_pos = np.full(nb_docs, np.iinfo(np.int64).max)
+        for k in range(int(doc_lengths.max()) if nb_docs else 0):
+            has_k = doc_lengths > k
+            pos = positions[np.where(has_k, starts[rows] + k, 0)]
+            pos_score += np.where(has_k, discount / np.sqrt(pos+1), 0.0)
+            min_pos = np.where(has_k, np.minimum(min_pos, pos), min_pos)
+        score += np.where(present, weights['position'] * pos_score, 0.0)
+
+        # score 4: bm25
+        idf = math.log(metadata['nb_doc']/len(index[token].keys()))
+        freq_tok_in_doc = counts[rows] if len(docs) else np.zeros(nb_docs, dtype=np.int64)
+        bm25 += np.where(present, idf*(freq_tok_in_doc*(k1+1))/(freq_tok_in_doc+k1*(1-b+b*field_len/avg_field_len)), 0.0)
+
+        # score 5: pairs of consecutive query tokens found in the title
+        num_ordered_pairs += has_previous & present & (previous_min < min_pos)
+        previous_min = np.where(present, min_pos, previous_min)
+        has_previous |= present
+
+    score += weights['bm25'] * bm25
+    score += weights['order']*num_ordered_pairs
+
+    return score
+
+def linear_ranking_vectorized(query:str, 
+                              filtered_docs:list[dict], 
+                              index:dict[str, dict], 
+                              weights:dict[str, float],
+                              metadata:dict[str, float],
+                              language:str,
+                              doc_stats:dict|None=None,
+                              title_words:dict[str, np.ndarray]|None=None,
+                              arrays:dict[str, tuple]|None=None) -> dict[int, int]:
+    """Ranks documents based on the linear ranking score of linear_ranking, computed for all 
+    documents at once by linear_scores.
+
+    Scores being exactly equal to the ones of linear_ranking, the ranking is the same 
+    (documents with equal scores keep the order of filtered_docs). Parameters are the ones
+    of linear_scores.
+
+    Returns
+    -------
+    dict[int, int]
+        Dictionnary with keys being the rank and the value the corresponding docId
+    """
+    score = linear_scores(query, filtered_docs, index, weights, metadata, language, doc_stats, title_words, arrays)
+
+    # rank documents based on scores, equal scores keep the order of filtered_docs
+    doc_ids = [document['id'] for document in filtered_docs]
+    ranks = {rank+1: doc_ids[i] for rank, i in enumerate(np.argsort(-score, kind='stable').tolist())}
+
+    return ranks
+
+def term_upper_bound(arrays:tuple, nb_docs_token:int, discount:float, weights:dict[str, float],
+                     metadata:dict[str, float]) -> float:
+    """Upper bound of the part of the linear ranking score which a query token adds to a 
+    document containing it: its position score, its bm25 score and an ordered pair.
+
     Parameters
     ----------
+    arrays: tuple
+        Postings of the token converted by postings_arrays
+    nb_docs_token: int
+        Number of documents containing the token
+    discount: float
+        Weight of the token, weights['stopwords'] for stopwords and 1 otherwise
+    weights: dict[str, float]
+        Weights associated to each score and stopwords, all positive
+    metadata: dict[str, float]
+        Dictionnary of statistics computed about the corpus
+
+    Returns
+    -------
+    float
+        Maximum of the score over the documents containing the token
+    """
+    _, counts, lengths, starts, positions = arrays
+    if not len(counts):
+        return 0.0
+
+    # highest position score of a document, sums of the positions of each document
+    # being differences of the cumulated sum of the positions of all documents
+    cumulated = np.concatenate(([0.0], np.cumsum(1 / np.sqrt(positions+1))))
+    max_pos_score = float((cumulated[starts+lengths] - cumulated[starts]).max())
+
+    # bm25 increases with the count and decreases with the length of the title (at least 0)
+    b = 0.75
+    k1 = 1.2
+    idf = math.log(metadata['nb_doc']/nb_docs_token)
+    max_count = int(counts.max())
+    max_bm25 = idf*(max_count*(k1+1))/(max_count+k1*(1-b))
+
+    return weights['position']*discount*max_pos_score + weights['bm25']*max_bm25 + weights['order']
+
+def top_k_ranking(query:str, 
+                  filtered_docs:list[dict], 
+                  index:dict[str, dict], 
+                  weights:dict[str, float],
+                  metadata:dict[str, float],
+                  language:str,
+                  top_k:int,
+                  doc_stats:dict|None=None,
+                  title_words:dict[str, np.ndarray]|None=None,
+                  prune:bool=True,
+                  bounds:dict[str, float]|None=None,
+                  arrays:dict[str, tuple]|None=None) -> dict[int, int]:
+    """Ranks the top_k best documents for the linear ranking score, keeping them in a heap of
+    top_k documents instead of sorting all of them.
+
+    With prune, documents are scored (by linear_scores) by blocks, in decreasing order of an 
+    upper bound of their score as in MaxScore: the sum of the upper bounds of the query 
+    tokens they contain (see term_upper_bound), plus the highest possible scores 1 and 2. 
+    Once the bound of the next documents is below the score of the last document of the heap, 
+    no other document can enter it and the remaining documents are skipped. This is useful 
+    for 'OR' queries, whose documents do not contain all tokens; documents of 'AND' queries 
+    all have the same bound.
+
+    The ranking is the first top_k documents of linear_ranking_vectorized, documents with equal 
+    scores keeping the order of filtered_docs.
+
+    Parameters
+    ----------
+    query: str
+        Query entered by user
+    filtered_docs: list[dict]
+        List of documents corresponding to documents selected by the filter
+    index: dict[str, dict]
+        Positional index of the query tokens returned by query_postings, each key is a token
+        and the values are documents in which the token appears (see doc_postings).
+    weights: dict[str, float]
+        Weights associated to each score and stopwords
+    metadata: dict[str, float]
+        Dictionnary of statistics computed about the corpus
+    language: str
+        Language of the corpus (e.g. 'french', 'english',...)
+    top_k: int
+        Number of documents to rank
+    doc_stats: dict|None
+        Statistics of the titles computed with the index (see index/docstats.py)
+    title_words: dict[str, np.ndarray]|None
+        Documents whose title contains each word (see build_title_words)
+    prune: bool
+        Whether documents which cannot be in the top_k are skipped, only done if all weights
+        are positive (bounds are not upper bounds otherwise), default True
+    bounds: dict[str, float]|None
+        Upper bounds of the tokens (see term_upper_bound), filled with the tokens missing, 
+        to compute them once for several queries on the same index
+    arrays: dict[str, tuple]|None
+        Postings of the tokens converted by postings_arrays (see linear_scores)
+
+    Returns
+    -------
+    dict[int, int]
+        Dictionnary with keys being the rank and the value the corresponding docId
+    """
+    nb_docs = len(filtered_docs)
+    if top_k <= 0 or nb_docs == 0:
+        return {}
+
+    query_tokens = query.lower().split()
+    lstopwords = get_stopwords(language)
+    prune = prune and nb_docs > top_k and min(weights.values()) >= 0
+    if bounds is None:
+        bounds = {}
+
+    # statistics as arrays once for all blocks
+    if doc_stats is not None:
+        doc_stats = {**doc_stats, 'field_length': np.asarray(doc_stats['field_length']),
+                     'weighted_length': np.asarray(doc_stats['weighted_length'])}
+
+    if arrays is None:
+        arrays = {}
+    if prune:
+        doc_ids = np.fromiter((document['id'] for document in filtered_docs), dtype=np.int64, count=nb_docs)
+
+        # scores 1 and 2, exactly if the words of the titles and their lengths are known, otherwise
+        # at most the weights of all query tokens and 1 (query tokens in the title are at most all 
+        # tokens of the title)
+        if title_words is not None and doc_stats is not None and doc_stats['stopwords_weight'] == weights['stopwords']:
+            num_q_tokens_in_title = np.zeros(nb_docs)
+            for tok in set(query_tokens):
+                in_title = np.isin(doc_ids, title_words.get(tok, np.zeros(0, dtype=np.int64)))
+                num_q_tokens_in_title += np.where(in_title, weights['stopwords'] if tok in lstopwords else 1, 0)
+            upper_bound = (weights['num_q_tokens_in_title']*num_q_tokens_in_title
+                           + weights['prop_tokens']*num_q_tokens_in_title/doc_stats['weighted_length'][doc_ids])
+        else:
+            max_num_q_tokens = sum([weights['stopwords'] if tok in lstopwords else 1 for tok in set(query_tokens)])
+            upper_bound = np.full(nb_docs, weights['num_q_tokens_in_title']*max_num_q_tokens + weights['prop_tokens'])
+
+        nb_present = np.zeros(nb_docs, dtype=np.int64)
+        for token in query_tokens:
+            if token not in index.keys():
+                continue
+            if token not in arrays:
+                arrays[token] = postings_arrays(index[token])
+            docs = arrays[token][0]
+            if token not in bounds:
+                discount = weights['stopwords'] if token in lstopwords else 1
+                bounds[token] = term_upper_bound(arrays[token], len(index[token].keys()), discount, weights, metadata)
+            if len(docs):
+                rows = np.minimum(np.searchsorted(docs, doc_ids), len(docs)-1)
+                present = docs[rows] == doc_ids
+                upper_bound += np.where(present, bounds[token], 0.0)
+                nb_present += present
+        # the bound of each token counts an ordered pair, there is one pair less than tokens
+        upper_bound -= weights['order']*(nb_present > 0)
+        # margin for the rounding errors of the scores, added in another order
+        upper_bound += 1e-9*(1 + np.abs(upper_bound))
+
+        order = np.argsort(-upper_bound, kind='stable')
+        block_size = max(2*top_k, 128)
+    else:
+        upper_bound = np.full(nb_docs, np.inf)
+        order = np.arange(nb_docs)
+        block_size = nb_docs
+
+    # heap of (score, -index in filtered_docs) of the top_k best documents, the first one
+    # being the lowest score, and for equal scores the last document of filtered_docs
+    heap = []
+    start = 0
+    while start < nb_docs:
+        block = order[start:start+block_size]
+        if len(heap) == top_k:
+            threshold = heap[0][0]
+            if upper_bound[block[0]] < threshold:
+                break
+            block = block[upper_bound[block] >= threshold]
+
+        score = linear_scores(query, [filtered_docs[i] for i in block.tolist()], index, weights, metadata,
+                              language, doc_stats, title_words, arrays)
+        for i, doc_score in zip(block.tolist(), score.tolist()):
+            if len(heap) < top_k:
+                heapq.heappush(heap, (doc_score, -i))
+            elif (doc_score, -i) > heap[0]:
+                heapq.heapreplace(heap, (doc_score, -i))
+
+        start += block_size
+        block_size *= 2
+
+    ranks = {rank+1: filtered_docs[-i]['id'] for rank, (_, i) in enumerate(sorted(heap, reverse=True))}
+
+    return ranks
+
+def build_document_table(documents: list[dict]) -> tuple[list[dict|None], np.ndarray]:
+    """Indexes the documents by docId, so that a document is found without going through 
+    the whole corpus
+
+    Parameter
+    ---------
     documents: list[dict]
         Corpus of documents
+
+    Returns
+    -------
+    tuple[list[dict|None], np.ndarray]
+        Document of each docId (None for docIds without document, the first document for
+        docIds of several documents), and index of each docId in documents (-1 without document)
+    """
+    size = max((document['id'] for document in documents), default=-1) + 1
+    document_table = [None]*size
+    document_order = np.full(size, -1, dtype=np.int64)
+    for i, document in enumerate(documents):
+        if document_table[document['id']] is None:
+            document_table[document['id']] = document
+            document_order[document['id']] = i
+    return document_table, document_order
+
+def format_ranking_results(document_table: list[dict|None], ranking:dict[int, int]) -> list[dict]:
+    """Create results dictionnary, taking ranked docIds and associating the 
+    corresponding titles and urls.
+    
+    Parameters
+    ----------
+    document_table: list[dict|None]
+        Document of each docId, see build_document_table
     ranking: dict[int, int]
         Ranking returned by the linear_ranking function
     
@@ -234,7 +786,7 @@ def format_ranking_results(documents: list[dict], ranking:dict[int, int]) -> lis
     formated_ranking = []
 
     for _, docid in ranking.items():
-        doc = [doc for doc in documents if doc['id']==docid][0]
+        doc = document_table[docid]
         res = {'title': doc['title'],
                'url': doc['url']}
         formated_ranking.append(res)
@@ -269,6 +821,245 @@ def save_json(data: list[dict], filename: str) -> None:
 
     print(f"JSON file saved at: {filename}")
 
+class Ranker():
+
+    def __init__(self, index_file: str, documents_file: str, language: str, weights: dict[str, float]=WEIGHTS,
+                 doc_stats_file: str|None=None, vectorized: bool=True) -> None:
+        """Index, documents and statistics loaded once to answer several queries.
+
+        Attributes
+        ----------
+        index: dict[str, dict]|PostingsReader
+            Title positional index, see open_index.
+        documents: list[dict]
+            Corpus of documents, each with keys [url, id, title].
+        document_table: list[dict|None]
+            Document of each docId, see build_document_table.
+        document_order: np.ndarray
+            Index of each docId in documents, -1 for docIds without document.
+        metadata: dict[str, float]
+            Statistics about the corpus.
+        doc_stats: dict|None
+            Statistics of the titles computed with the index (see index/docstats.py), None if
+            they are computed for each query. Statistics computed for another language, stopwords
+            weight or tokenizer are rejected with a ValueError.
+        vectorized: bool
+            Whether documents are ranked with linear_ranking_vectorized instead of linear_ranking.
+        title_words: dict[str, np.ndarray]|None
+            Documents whose title contains each word, for linear_ranking_vectorized.
+        language: str
+            Language of the corpus, to compute stopwords list.
+        weights: dict[str, float]
+            Weights associated to each score and stopwords.
+        term_bounds: dict[str, float]
+            Upper bounds of the scores of the tokens already searched, for top_k_ranking.
+        """
+        self.index = open_index(index_file)
+
+        # load document info as a list of dictionnaries, each with keys [url, id, title]
+        with open(documents_file) as f:
+            self.documents = json.load(f)
+        self.document_table, self.document_order = build_document_table(self.documents)
+
+        # compute metadata about the corpus, unless computed with the index
+        self.doc_stats = None
+        if doc_stats_file is not None:
+            self.doc_stats = load_doc_stats(doc_stats_file)
+            if self.doc_stats['language'] != language:
+                raise ValueError(f"{doc_stats_file} was computed for language '{self.doc_stats['language']}', not '{language}'")
+            if self.doc_stats['stopwords_weight'] != weights['stopwords']:
+                raise ValueError(f"{doc_stats_file} was computed with a stopwords weight of "
+                                 f"{self.doc_stats['stopwords_weight']}, not {weights['stopwords']}")
+            if self.doc_stats.get('tokenizer_version') != TOKENIZER_VERSION:
+                raise ValueError(f"{doc_stats_file} was computed with another tokenizer, compute it again")
+            self.metadata = {key: self.doc_stats[key] for key in ('nb_doc', 'nb_tokens_title_total', 'mean_nb_tokens_title')}
+        else:
+            self.metadata = compute_metadata(self.documents)
+
+        self.language = language
+        self.weights = weights
+        self.vectorized = vectorized
+        self.title_words = build_title_words(self.documents) if vectorized else None
+        self.term_bounds = {}
+        get_stopwords(language)
+
+    def search(self, query: str, filter: str='AND', top_k: int|None=None) -> tuple[list[dict], int]:
+        """Ranks the documents for a query
+
+        Parameters
+        ----------
+        query: str
+            Query entered by user
+        filter: str
+            Either 'AND' or 'OR', see filter_docs
+        top_k: int|None
+            Number of documents to return (see top_k_ranking), None for all documents
+        
+        Returns
+        -------
+        tuple[list[dict], int]
+            Ordered list of documents, each with its title and its URL, and number of 
+            documents kept by the filter
+        """
+        # postings of the query tokens (tokenized as by the filter and the ranking)
+        query_index = query_postings(self.index, set(tokenize(query)) | set(query.lower().split()))
+
+        # filtering documents containing all of the query tokens, postings being converted
+        # to arrays once for the filter and the ranking
+        arrays = {}
+        filtered_docs_ids = np.array(filter_docs(query_index, query, filter, arrays), dtype=np.int64)
+
+        # selecting documents whos ids where kept through the filter, in the order of the corpus
+        # (the order of documents with equal scores)
+        known = filtered_docs_ids[filtered_docs_ids < len(self.document_order)]
+        known = known[self.document_order[known] >= 0]
+        known = known[np.argsort(self.document_order[known], kind='stable')]
+        filtered_docs = [self.document_table[doc_id] for doc_id in known.tolist()]
+
+        # ranking the documents
+        if top_k is not None and self.vectorized:
+            # documents of 'AND' queries contain all tokens, their bounds are all equal
+            ranking = top_k_ranking(query, 
+                                    filtered_docs, 
+                                    query_index, 
+                                    self.weights, 
+                                    self.metadata,
+                                    self.language,
+                                    top_k,
+                                    self.doc_stats,
+                                    self.title_words,
+                                    prune=filter=='OR',
+                                    bounds=self.term_bounds,
+                                    arrays=arrays)
+        elif self.vectorized:
+            ranking = linear_ranking_vectorized(query, 
+                                                filtered_docs, 
+                                                query_index, 
+                                                self.weights, 
+                                                self.metadata,
+                                                self.language,
+                                                self.doc_stats,
+                                                self.title_words,
+                                                arrays)
+        else:
+            ranking = linear_ranking(query, 
+                                     filtered_docs, 
+                                     query_index, 
+                                     self.weights, 
+                                     self.metadata,
+                                     self.language,
+                                     self.doc_stats)
+            if top_k is not None:
+                ranking = {rank: doc_id for rank, doc_id in ranking.items() if rank <= top_k}
+
+        # extract title and url of ranked documents
+        return format_ranking_results(self.document_table, ranking), len(filtered_docs_ids)
+
+
+def rank_batch(ranker: Ranker, queries_file: str, results_file: str, filter: str='AND', top_k: int|None=None) -> None:
+    """Answers the queries of a JSONL file, one JSON object {"query", "filter", "top_k"} per line
+    ("filter" and "top_k" being optional), and writes one line per query to results_file with 
+    the fields of the request and its "nb_filtered" documents and "results"
+
+    Parameters
+    ----------
+    ranker: Ranker
+        Loaded index and documents
+    queries_file: str
+        JSONL file of queries
+    results_file: str
+        JSONL file to which results should be saved
+    filter: str
+        Filter of the queries without one, default 'AND'
+    top_k: int|None
+        Number of results of the queries without "top_k", None for all documents
+    
+    Returns
+    -------
+    None
+    """
+    nb_queries = 0
+    start = time.perf_counter()
+    with open(queries_file, encoding='utf-8') as queries, open(results_file, "w", encoding='utf-8') as results:
+        for line in queries:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            ranking, nb_filtered = ranker.search(request['query'], request.get('filter', filter), request.get('top_k', top_k))
+            results.write(json.dumps({**request, 'nb_filtered': nb_filtered, 'results': ranking}, ensure_ascii=False) + '\n')
+            nb_queries += 1
+
+    elapsed = time.perf_counter() - start
+    print(f"{nb_queries} queries answered in {elapsed:.3f}s ({1000*elapsed/max(nb_queries, 1):.1f} ms per query)")
+    print(f"JSONL file saved at: {results_file}")
+
+def serve(ranker: Ranker, host: str, port: int) -> None:
+    """Answers queries over HTTP until interrupted: GET /search?query=...&filter=AND&top_k=10 
+    ("filter" and "top_k" being optional) returns a JSON object with the "query", its "nb_filtered" documents, its "results" and the 
+    time taken in "ms"
+
+    Parameters
+    ----------
+    ranker: Ranker
+        Loaded index and documents
+    host: str
+        Address to listen on
+    port: int
+        Port to listen on
+    
+    Returns
+    -------
+    None
+    """
+    class SearchHandler(BaseHTTPRequestHandler):
+
+        def send_json(self, status: int, data: dict) -> None:
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path != '/search':
+                self.send_json(404, {'error': f"unknown path {url.path}, use /search?query=..."})
+                return
+            if 'query' not in params:
+                self.send_json(400, {'error': "missing parameter 'query'"})
+                return
+            query = params['query'][0]
+            filter = params.get('filter', ['AND'])[0]
+            if filter not in ('AND', 'OR'):
+                self.send_json(400, {'error': "parameter 'filter' should be 'AND' or 'OR'"})
+                return
+            top_k = params.get('top_k', [None])[0]
+            if top_k is not None:
+                if not top_k.isdigit():
+                    self.send_json(400, {'error': "parameter 'top_k' should be a non-negative integer"})
+                    return
+                top_k = int(top_k)
+
+            start = time.perf_counter()
+            try:
+                ranking, nb_filtered = ranker.search(query, filter, top_k)
+            except Exception as e:
+                self.send_json(500, {'error': str(e)})
+                return
+            self.send_json(200, {'query': query, 'nb_filtered': nb_filtered, 'results': ranking,
+                                 'ms': round(1000*(time.perf_counter()-start), 3)})
+
+    server = ThreadingHTTPServer((host, port), SearchHandler)
+    print(f"Serving queries on http://{host}:{server.server_address[1]}/search?query=...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
 def main() -> None:
     """Allows to use functions"""
 
@@ -276,16 +1067,22 @@ def main() -> None:
     parser = argparse.ArgumentParser()
 
     parser.add_argument("query",
-                        help="query for ranking",
+                        nargs='?',
+                        default=None,
+                        help="query for ranking, not given with --batch or --port",
                         type=str)
     parser.add_argument("-f", "--filter",
                         default='AND',
                         help="filter for the documents according to the query, default 'AND'.",
                         type=str,
                         choices=['AND', 'OR'])
+    parser.add_argument("-k", "--top_k",
+                        default=None,
+                        help="number of documents to rank, default None (all documents kept by the filter)",
+                        type=int)
     parser.add_argument("-it", "--index_title", 
                         default='title_pos_index.json', 
-                        help="filename of title positional index, default 'title_pos_index.json'",
+                        help="filename of title positional index, JSON or binary, default 'title_pos_index.json'",
                         type=str)
     parser.add_argument("-ic", "--index_content", 
                         default='content_pos_index.json', 
@@ -297,58 +1094,49 @@ def main() -> None:
                         type=str)
     parser.add_argument("-r", "--results", 
                         default='results.json', 
-                        help="filename for ranking results, default 'results.json'",
+                        help="filename for ranking results, default 'results.json' (JSONL with --batch)",
                         type=str)
     parser.add_argument("-l", "--language", 
                         default='french', 
                         help="language of documents, to compute stopwords list",
                         type=str)
+    parser.add_argument("-st", "--doc_stats", 
+                        default=None, 
+                        help="filename of the statistics of the documents computed with the index ('.npz'), default None (computed when ranking)",
+                        type=str)
+    parser.add_argument("-b", "--batch", 
+                        default=None, 
+                        help="JSONL file of queries, one {\"query\": ..., \"filter\": ...} object per line, answered with the index loaded once",
+                        type=str)
+    parser.add_argument("-p", "--port", 
+                        default=None, 
+                        help="if given, loads the index once and answers queries over HTTP on this port (0 for any free port)",
+                        type=int)
+    parser.add_argument("-ho", "--host", 
+                        default='127.0.0.1', 
+                        help="address of the HTTP server, default '127.0.0.1'",
+                        type=str)
     
     args = parser.parse_args()
 
-    # loading title positional index
-    with open(args.index_title) as f:
-        index_title = json.load(f)
-
-    # load document info as a list of dictionnaries, each with keys [url, id, title]
-    with open(args.documents) as f:
-        documents = json.load(f)
-    print(f"Number of documents: {len(documents)}")
-
-    # compute metadata about the corpus
-    metadata = compute_metadata(documents)
-
-    # setting the query 
-    query = args.query
-
-    # filtering documents containing all of the query tokens 
-    filtered_docs_ids = filter_docs(index_title, query, args.filter)
-    print(f"Number of documents kept by the filter    : {len(filtered_docs_ids)}")
-    print(f"Proportion of documents kept by the filter: {round(100*len(filtered_docs_ids)/len(documents),3)}%")
-
+    if sum([args.query is not None, args.batch is not None, args.port is not None]) != 1:
+        parser.error("give either a query, --batch or --port")
 
-    # selecting documents whos ids where kept through the filter
-    filtered_docs = [doc for doc in documents if doc['id'] in filtered_docs_ids]
+    # loading index, documents and metadata once
+    ranker = Ranker(args.index_title, args.documents, args.language, doc_stats_file=args.doc_stats)
+    print(f"Number of documents: {len(ranker.documents)}")
 
-    # setting weigths to compute the score in linear_ranking 
-    weights = {"num_q_tokens_in_title": 1,
-               "prop_tokens": 0.5,
-               "position": 1.0,
-               "bm25": 1,
-               "order": 2,
-               "stopwords": 0.2
-               }
+    if args.port is not None:
+        serve(ranker, args.host, args.port)
+        return
 
-    # ranking the documents
-    ranking = linear_ranking(query, 
-                             filtered_docs, 
-                             index_title, 
-                             weights, 
-                             metadata,
-                             args.language)
+    if args.batch is not None:
+        rank_batch(ranker, args.batch, args.results, args.filter, args.top_k)
+        return
 
-    # extract title and url of ranked documents
-    formated_ranking = format_ranking_results(documents, ranking)
+    formated_ranking, nb_filtered = ranker.search(args.query, args.filter, args.top_k)
+    print(f"Number of documents kept by the filter    : {nb_filtered}")
+    print(f"Proportion of documents kept by the filter: {round(100*nb_filtered/len(ranker.documents),3)}%")
 
     # save results as a list of dictionnaries, each with keys [title, url]
     save_json(formated_ranking, args.results)
@@ -357,4 +1145,5 @@ def main() -> None:
 if __name__=="__main__":
     
     main()
-    # example: python3 main.py 'pourquoi erreur'
\ No newline at end of file
+    # example (from the root of the repository): python3 -m ranking.main 'pourquoi erreur' -d ranking/documents.json
+    # server : python3 -m ranking.main -it index/title.pos_index.bin -d ranking/documents.json -p 8000, then GET http://127.0.0.1:8000/search?query=pourquoi+erreur
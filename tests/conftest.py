@@ -0,0 +1,196 @@
+"""
+Import path of the tests: the crawler, the indexer and the ranking are imported as packages from
+the root of the repository, as when they are run. Also the local websites crawled by the tests of
+the crawler, and the data shared by the tests of the index and of the ranking.
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def nltk_data_available() -> bool:
+    """Whether the tokenizer and stopwords of nltk are installed (they are downloaded separately)"""
+    from nltk.tokenize import word_tokenize
+    from nltk.corpus import stopwords
+    try:
+        word_tokenize('test', language='french')
+        stopwords.words('french')
+    except LookupError:
+        return False
+    return True
+
+
+requires_nltk = pytest.mark.skipif(not nltk_data_available(), reason="nltk data (punkt_tab, stopwords) is not installed")
+
+
+# local websites crawled by the tests of the crawler
+NB_HOSTS = 3
+NB_PAGES = 4 # per host
+CRAWL_DELAY = 0.3 # seconds
+HOST_CRAWL_DELAY = 1 # Crawl-delay of the robots.txt of the last host (read as an integer by robotparser)
+
+
+class Websites():
+
+    def __init__(self) -> None:
+        """Local websites on 127.0.0.1, one port per host, recording the pages requested.
+
+        Every page links to the next page of its host, to the first page of the other hosts and
+        to a page disallowed by the robots.txt. The second host lists its last pages in a sitemap,
+        the last one asks for a longer delay with Crawl-delay. Pages have an ETag and are answered
+        304 Not Modified to a matching If-None-Match, except the pages of the second host.
+        """
+        self.requests = [] # (host, path, time)
+        self.not_modified = [] # (host, path) answered 304 Not Modified
+        self.changed = set() # urls of the pages whose text was changed
+        self.texts = {} # text of the pages replacing their default text, by url
+        self.sitemap_errors = 0 # number of next requests of the sitemap answered with an error
+        self.lock = threading.Lock()
+        self.servers = [ThreadingHTTPServer(('127.0.0.1', 0), self.handler()) for _ in range(NB_HOSTS)]
+        self.hosts = [f'http://127.0.0.1:{server.server_address[1]}' for server in self.servers]
+
+    def handler(self) -> type:
+        websites = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                host = f'http://127.0.0.1:{self.server.server_address[1]}'
+                with websites.lock:
+                    websites.requests.append((host, self.path, time.monotonic()))
+                body = websites.body(host, self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                etag = None
+                if self.path.endswith('.html') and host != websites.hosts[1]:
+                    etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                    if self.headers.get('If-None-Match') == etag:
+                        with websites.lock:
+                            websites.not_modified.append((host, self.path))
+                        self.send_response(304)
+                        self.send_header('ETag', etag)
+                        self.end_headers()
+                        return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/xml' if self.path.endswith('.xml') else 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def body(self, host:str, path:str) -> bytes|None:
+        index = self.hosts.index(host)
+        if path == '/robots.txt':
+            lines = ['User-agent: *', 'Disallow: /private.html']
+            if index == 1:
+                lines.append(f'Sitemap: {host}/sitemap.xml')
+            if index == NB_HOSTS-1:
+                lines.append(f'Crawl-delay: {HOST_CRAWL_DELAY}')
+            return '\n'.join(lines).encode('utf-8')
+        if path == '/sitemap.xml' and index == 1:
+            if self.sitemap_errors > 0:
+                self.sitemap_errors -= 1
+                return None
+            locs = ''.join(f'<url><loc>{host}/page{i}.html</loc></url>' for i in range(2, NB_PAGES))
+            return f'<?xml version="1.0"?><urlset>{locs}</urlset>'.encode('utf-8')
+        for i in range(NB_PAGES):
+            if path == f'/page{i}.html':
+                links = [f'{host}/private.html'] + [f'{other}/page0.html' for other in self.hosts if other != host]
+                if i+1 < NB_PAGES:
+                    links.append(f'{host}/page{i+1}.html')
+                anchors = ''.join(f'<a href="{link}">link</a>' for link in links)
+                text = self.texts.get(host+path, f'text of page {i} of host {index}')
+                text += ' changed' if host+path in self.changed else ''
+                return (f'<html><head><title>page {i} of {host}</title></head>'
+                        f'<body><h1>page {i}</h1><p>{text}</p>{anchors}</body></html>').encode('utf-8')
+        return None
+
+    def __enter__(self) -> 'Websites':
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+
+@pytest.fixture
+def websites():
+    with Websites() as websites:
+        yield websites
+
+
+# small list of stopwords, so that the ranking can be tested without the stopwords of nltk
+STOPWORDS = ['le', 'la', 'de', 'pour', 'pourquoi', 'un', 'une', 'et', 'les', 'des', 'à', 'du', 'en']
+
+
+class FakeStopwords():
+
+    @staticmethod
+    def words(language:str) -> list[str]:
+        return STOPWORDS
+
+
+@pytest.fixture
+def fake_stopwords(monkeypatch):
+    """Stopwords of the ranking and of the statistics of the documents replaced by STOPWORDS"""
+    import ranking.main
+    import index.docstats
+    monkeypatch.setattr(ranking.main, 'stopwords', FakeStopwords)
+    monkeypatch.setattr(index.docstats, 'stopwords', FakeStopwords)
+    ranking.main.get_stopwords.cache_clear()
+    yield STOPWORDS
+    ranking.main.get_stopwords.cache_clear()
+
+
+@pytest.fixture(scope='session')
+def documents() -> list[dict]:
+    """Documents of the ranking (url, id, title)"""
+    with open(os.path.join(ROOT, 'ranking', 'documents.json'), encoding='utf-8') as file:
+        return json.load(file)
+
+
+@pytest.fixture(scope='session')
+def title_index() -> dict:
+    """Positional index of the titles of the documents, as written by the indexer"""
+    from index.postings import read_json_index
+    return read_json_index(os.path.join(ROOT, 'index', 'title.pos_index.json'))
+
+
+def sample_queries(documents:list[dict], nb_queries:int, seed:int=0) -> list[str]:
+    """Queries made of 1 to 4 consecutive words of random titles, and a few edge cases"""
+    rng = random.Random(seed)
+    queries = ['', 'zzzqqq', 'zzzqqq erreur', 'pourquoi erreur', 'erreur 404', 'de la erreur', 'le le la']
+    while len(queries) < nb_queries:
+        words = rng.choice(documents)['title'].lower().split()
+        if not words:
+            continue
+        length = rng.randint(1, min(4, len(words)))
+        start = rng.randint(0, len(words)-length)
+        queries.append(' '.join(words[start:start+length]))
+    return queries
@@ -0,0 +1,100 @@
+"""
+Crawl of local websites: resuming an interrupted crawl, refreshing a crawl with conditional requests
+"""
+import os
+import json
+import asyncio
+
+import pytest
+
+from conftest import NB_HOSTS, NB_PAGES
+from crawler.crawler import Crawler
+from crawler.database import CrawlDatabase
+from crawler.scheduler import PolitenessScheduler
+
+
+def read_crawled(path:str, filename:str='crawled.txt') -> list[str]:
+    with open(os.path.join(path, filename), encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def interrupt_after(monkeypatch, method:str, nb_urls:int) -> None:
+    """Interrupts the crawl when it takes an url from the frontier after nb_urls urls were taken"""
+    take_url = getattr(PolitenessScheduler, method)
+    taken = []
+
+    def interrupted(self):
+        if len(taken) == nb_urls:
+            raise KeyboardInterrupt
+        url = take_url(self)
+        if url is not None:
+            taken.append(url)
+        return url
+
+    monkeypatch.setattr(PolitenessScheduler, method, interrupted)
+
+
+@pytest.mark.parametrize('method', ['crawl', 'crawl_async'])
+def test_interrupted_crawl_is_resumed_without_fetching_pages_again(websites, tmp_path, monkeypatch, method):
+    max_urls_crawled = NB_HOSTS*NB_PAGES - 2
+
+    def crawl(resume:bool) -> None:
+        crawler = Crawler(websites.hosts[0]+'/page0.html', max_urls_crawled=max_urls_crawled, crawl_delay=0.05,
+                          robot_delay=0, checkpoint_every=100)
+        if method == 'crawl':
+            crawler.crawl('crawled.txt', 'crawl.db', 'webpages_age', str(tmp_path), resume)
+        else:
+            # one page at a time, so that no page is being crawled when the crawl is interrupted
+            asyncio.run(crawler.crawl_async('crawled.txt', 'crawl.db', 'webpages_age', str(tmp_path), 1, resume))
+
+    # interrupted between two pages, the state of the crawl is saved by the last checkpoint
+    with monkeypatch.context() as patch:
+        interrupt_after(patch, 'pop' if method == 'crawl' else 'pop_ready', 5)
+        with pytest.raises(KeyboardInterrupt):
+            crawl(resume=False)
+    pages = [(host, path) for host, path, _ in websites.requests if path.endswith('.html')]
+    assert len(pages) == 5
+
+    crawl(resume=True)
+    crawled = read_crawled(str(tmp_path))
+    assert len(crawled) == len(set(crawled)) == max_urls_crawled
+
+    # no page is fetched twice, and only the pages crawled are fetched
+    pages = [(host, path) for host, path, _ in websites.requests if path.endswith('.html')]
+    assert len(pages) == len(set(pages)) == max_urls_crawled
+    assert set(crawled) == {host+path for host, path in pages}
+
+
+def test_recrawl_only_downloads_and_parses_changed_pages(websites, tmp_path, capsys):
+    all_pages = {f'{host}/page{i}.html' for host in websites.hosts for i in range(NB_PAGES)}
+    crawler = Crawler(websites.hosts[0]+'/page0.html', max_urls_crawled=len(all_pages), crawl_delay=0, robot_delay=0)
+    crawler.crawl('crawled.txt', 'crawl.db', 'webpages_age', str(tmp_path), documents='documents.jsonl')
+    assert set(read_crawled(str(tmp_path))) == all_pages
+
+    changed = websites.hosts[0]+'/page1.html'
+    websites.changed.add(changed)
+    websites.requests.clear()
+    capsys.readouterr()
+
+    crawler = Crawler(websites.hosts[0]+'/page0.html', max_urls_crawled=len(all_pages), crawl_delay=0, robot_delay=0)
+    crawler.recrawl('recrawled.txt', 'crawl.db', 'webpages_age', str(tmp_path), documents='documents.jsonl')
+    assert set(read_crawled(str(tmp_path), 'recrawled.txt')) == all_pages
+
+    # pages with an ETag are requested conditionally: only the changed page is downloaded again,
+    # pages of the host without ETag are downloaded but not parsed, their content being the same
+    pages = [host+path for host, path, _ in websites.requests if path.endswith('.html')]
+    assert sorted(pages) == sorted(all_pages)
+    assert {host+path for host, path in websites.not_modified} == {page for page in all_pages
+                                                                   if not page.startswith(websites.hosts[1])} - {changed}
+    assert f"{len(all_pages)-1}/{len(all_pages)} pages unchanged since the last crawl." in capsys.readouterr().out
+
+    # only the changed page is stored again
+    with open(os.path.join(tmp_path, 'documents.jsonl'), encoding='utf-8') as file:
+        stored = [json.loads(line) for line in file]
+    assert len(stored) == len(all_pages) + 1
+    assert stored[-1]['url'] == changed and 'changed' in stored[-1]['content'].split()
+
+    db = CrawlDatabase('crawl.db', str(tmp_path))
+    validators = db.validators(db.latest_table('webpages_age'))
+    db.close()
+    assert all((validators[page][0] is None) == page.startswith(websites.hosts[1]) for page in all_pages)
@@ -0,0 +1,85 @@
+"""
+Asynchronous crawl of several local websites: pages visited and politeness of each host
+"""
+import os
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import NB_HOSTS, NB_PAGES, CRAWL_DELAY, HOST_CRAWL_DELAY
+from crawler.crawler import Crawler
+from crawler.database import CrawlDatabase
+from crawler.robots import RobotsCache
+from crawler.sitemaps import SitemapCache
+
+
+def test_async_crawl_visits_every_host_politely(websites, tmp_path):
+    crawler = Crawler(websites.hosts[0]+'/page0.html',
+                      max_urls_crawled=NB_HOSTS*NB_PAGES,
+                      crawl_delay=CRAWL_DELAY,
+                      robot_delay=0,
+                      timeout_delay=5,
+                      checkpoint_every=3)
+    asyncio.run(crawler.crawl_async('crawled.txt', 'crawl.db', 'webpages_age', str(tmp_path), max_concurrency=4))
+
+    with open(os.path.join(tmp_path, 'crawled.txt'), encoding='utf-8') as file:
+        crawled = {line.strip() for line in file if line.strip()}
+    assert crawled == {f'{host}/page{i}.html' for host in websites.hosts for i in range(NB_PAGES)}
+
+    page_requests = [(host, path, at) for host, path, at in websites.requests if path.endswith('.html')]
+    assert not [path for _, path, _ in page_requests if path == '/private.html']
+    # each page is requested once, robots.txt and the sitemap once per host
+    assert len(page_requests) == len(crawled)
+    assert sorted(path for _, path, _ in websites.requests if path == '/robots.txt') == ['/robots.txt'] * NB_HOSTS
+    assert [path for _, path, _ in websites.requests if path == '/sitemap.xml'] == ['/sitemap.xml']
+
+    for index, host in enumerate(websites.hosts):
+        times = [at for page_host, _, at in page_requests if page_host == host]
+        delay = HOST_CRAWL_DELAY if index == NB_HOSTS-1 else CRAWL_DELAY
+        gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+        assert min(gaps) >= delay - 0.01, (host, gaps)
+
+    # hosts do not wait for each other: the crawl is shorter than the delays of all hosts one after the other
+    page_times = [at for _, _, at in page_requests]
+    assert max(page_times) - min(page_times) < (NB_PAGES-1) * ((NB_HOSTS-1)*CRAWL_DELAY + HOST_CRAWL_DELAY)
+
+
+def test_sitemaps_of_a_host_are_fetched_once_by_concurrent_threads(websites):
+    sitemap_cache = SitemapCache(RobotsCache(robot_delay=0))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(sitemap_cache.urls, [websites.hosts[i % NB_HOSTS]+'/page0.html' for i in range(24)]))
+
+    assert results[1::NB_HOSTS] == [[f'{websites.hosts[1]}/page{i}.html' for i in range(2, NB_PAGES)]] * 8
+    assert results[0::NB_HOSTS] == [[]] * 8
+    assert [path for _, path, _ in websites.requests if path == '/sitemap.xml'] == ['/sitemap.xml']
+    assert sitemap_cache.misses == 1
+
+
+def test_sitemaps_which_could_not_be_fetched_are_fetched_again(websites, tmp_path):
+    websites.sitemap_errors = 1
+    sitemap_cache = SitemapCache(RobotsCache(robot_delay=0))
+    assert sitemap_cache.urls(websites.hosts[1]+'/page0.html') is None
+    assert sitemap_cache.urls(websites.hosts[1]+'/page0.html') == [f'{websites.hosts[1]}/page{i}.html'
+                                                                   for i in range(2, NB_PAGES)]
+
+    # the crawl reads the sitemap again for the next page of the host
+    websites.requests.clear()
+    websites.sitemap_errors = 1
+    crawler = Crawler(websites.hosts[1]+'/page0.html', max_urls_crawled=NB_PAGES, crawl_delay=0, robot_delay=0)
+    crawler.crawl('crawled.txt', 'crawl.db', 'webpages_age', str(tmp_path))
+    sitemap_requests = [path for _, path, _ in websites.requests if path == '/sitemap.xml']
+    assert sitemap_requests == ['/sitemap.xml'] * 2
+
+
+def test_sitemap_urls_are_fed_at_most_max_urls_per_page_at_a_time(websites, tmp_path):
+    crawler = Crawler(websites.hosts[1]+'/page0.html', max_urls_crawled=1, max_urls_per_page=1, crawl_delay=0, robot_delay=0)
+    crawler.crawl('crawled.txt', 'crawl.db', 'webpages_age', str(tmp_path))
+
+    db = CrawlDatabase('crawl.db', str(tmp_path))
+    state = db.load_checkpoint(db.latest_table('webpages_age'))
+    db.close()
+    # one link of the page and the first page of the sitemap, the host is not done with its sitemap
+    assert len(state['frontier']) == 2
+    assert f'{websites.hosts[1]}/page2.html' in state['frontier']
+    assert f'{websites.hosts[1]}/page3.html' not in state['frontier']
+    assert state['sitemap_hosts'] == set()
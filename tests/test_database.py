@@ -0,0 +1,77 @@
+"""
+Database of the crawl: ages of the urls computed by the view from the crawl sequence numbers
+"""
+import os
+
+from crawler.database import CrawlDatabase
+
+
+def view_ages(db:CrawlDatabase, tablename:str) -> dict[str, int]:
+    """Ages read with SQL from the view, as any other program reading the database"""
+    return dict(db.connection.execute(f"SELECT url, age FROM {tablename}").fetchall())
+
+
+def test_adding_an_url_ages_the_other_urls(tmp_path):
+    db = CrawlDatabase('crawl.db', str(tmp_path), batch_size=2)
+    tablename = db.create_table('webpages_age')
+    for url in ['a', 'b', 'c']:
+        db.add_url(url, tablename)
+    assert db.ages(tablename) == {'a': 2, 'b': 1, 'c': 0}
+
+    # crawled again, the url gets back to age 0 and the urls crawled after it age by 1
+    db.add_url('a', tablename)
+    db.add_url('d', tablename)
+    db.flush()
+    assert view_ages(db, tablename) == {'a': 1, 'b': 3, 'c': 2, 'd': 0}
+    assert db.ages(tablename) == view_ages(db, tablename)
+    db.close()
+
+    # the view is saved in the database
+    db = CrawlDatabase('crawl.db', str(tmp_path))
+    assert view_ages(db, tablename) == {'a': 1, 'b': 3, 'c': 2, 'd': 0}
+    db.close()
+
+
+def test_urls_waiting_to_be_written_are_read(tmp_path):
+    db = CrawlDatabase('crawl.db', str(tmp_path), batch_size=100)
+    tablename = db.create_table('webpages_age')
+    db.add_url('a', tablename, '"etag"', 'Mon, 01 Jan 2024 00:00:00 GMT', 'hash')
+    db.add_url('b', tablename)
+    assert view_ages(db, tablename) == {} # not written yet
+    assert db.ages(tablename) == {'a': 1, 'b': 0}
+    assert db.validators(tablename) == {'a': ('"etag"', 'Mon, 01 Jan 2024 00:00:00 GMT', 'hash'),
+                                        'b': (None, None, None)}
+    db.close()
+
+
+def test_existing_table_is_not_overwritten(tmp_path):
+    db = CrawlDatabase('crawl.db', str(tmp_path))
+    assert db.latest_table('webpages_age') is None
+    assert db.create_table('webpages_age') == 'webpages_age'
+    db.add_url('a', 'webpages_age')
+    assert db.create_table('webpages_age') == 'webpages_age_1'
+    assert db.create_table('webpages_age') == 'webpages_age_2'
+    assert db.latest_table('webpages_age') == 'webpages_age_2'
+    assert db.ages('webpages_age') == {'a': 0}
+    assert db.ages('webpages_age_2') == {}
+    db.close()
+
+
+def test_merged_tables_keep_the_sequence_numbers_of_the_workers(tmp_path):
+    db = CrawlDatabase('crawl.db', str(tmp_path))
+    tablename = db.create_table('webpages_age')
+
+    # two workers crawling urls in turn, with sequence numbers shared by the workers
+    for worker, urls in enumerate([[('a', 1), ('c', 3)], [('b', 2), ('d', 4), ('a', 5)]]):
+        worker_db = CrawlDatabase(f'crawl.db.worker{worker}', str(tmp_path))
+        worker_db.create_table(tablename)
+        for url, seq in urls:
+            worker_db.add_url(url, tablename, seq=seq)
+        worker_db.close()
+        db.merge(tablename, os.path.join(tmp_path, f'crawl.db.worker{worker}'))
+
+    assert view_ages(db, tablename) == {'a': 0, 'b': 3, 'c': 2, 'd': 1}
+    # urls added after the merge follow the sequence numbers of the workers
+    db.add_url('e', tablename)
+    assert db.ages(tablename) == {'a': 1, 'b': 4, 'c': 3, 'd': 2, 'e': 0}
+    db.close()
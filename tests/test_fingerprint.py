@@ -0,0 +1,106 @@
+"""
+SimHash fingerprints: near-duplicate pages are not stored by the crawler nor indexed
+"""
+import os
+import json
+import random
+
+import pandas as pd
+
+from conftest import NB_HOSTS, NB_PAGES
+from crawler.crawler import Crawler
+from crawler.fingerprint import shingles, simhash, hamming_distance, SimHashIndex
+from index.main import drop_duplicates
+
+def random_text(rng:random.Random, nb_words:int) -> str:
+    return ' '.join(f'mot{rng.randrange(1000)}' for _ in range(nb_words))
+
+
+def near_duplicate(text:str) -> str:
+    """Text with its word in the middle replaced"""
+    words = text.split()
+    words[len(words)//2] = 'modifié'
+    return ' '.join(words)
+
+
+def test_shingles():
+    assert shingles('Le chat, le chien') == ['le chat le', 'chat le chien']
+    assert shingles('Deux mots') == ['deux mots']
+    assert shingles(' ,; ') == []
+    assert simhash('') is None
+
+
+def test_near_duplicates_have_close_fingerprints():
+    rng = random.Random(0)
+    distances_near, distances_other = [], []
+    for _ in range(100):
+        text = random_text(rng, 300)
+        assert simhash(text) == simhash(text.upper()) # lowercased
+        distances_near.append(hamming_distance(simhash(text), simhash(near_duplicate(text))))
+        distances_other.append(hamming_distance(simhash(text), simhash(random_text(rng, 300))))
+    # one shingle out of a hundred changed moves a few bits, different texts about half of them
+    assert sum(distances_near) / len(distances_near) <= 4
+    assert max(distances_near) <= 10
+    assert min(distances_other) > 15
+
+
+def test_simhash_index_finds_the_fingerprints_a_full_scan_finds():
+    rng = random.Random(1)
+    max_distance = 3
+    index = SimHashIndex(max_distance)
+    fingerprints = {}
+    for key in range(2000):
+        # random fingerprints, and fingerprints a few bits away from a previous one
+        if fingerprints and rng.random() < 0.3:
+            fingerprint = rng.choice(list(fingerprints.values()))
+            for bit in rng.sample(range(64), rng.randint(0, 5)):
+                fingerprint ^= 1 << bit
+        else:
+            fingerprint = rng.getrandbits(64)
+
+        close = [other for other, other_fingerprint in fingerprints.items()
+                 if hamming_distance(fingerprint, other_fingerprint) <= max_distance]
+        duplicate = index.add_if_new(key, fingerprint)
+        if close:
+            assert duplicate in close
+        else:
+            assert duplicate is None
+            fingerprints[key] = fingerprint
+    assert len(index) == len(fingerprints)
+
+
+def test_near_duplicate_pages_are_not_stored_by_the_crawler(websites, tmp_path):
+    # pages of the same host, their title and h1 differing only by the number of the page, with a long
+    # text so that the few shingles of the title and h1 weigh little against the shingles of the text
+    text = ' '.join([random_text(random.Random(2), 1000)] * 10)
+    duplicate_pages = [websites.hosts[0]+'/page1.html', websites.hosts[0]+'/page2.html']
+    websites.texts = {websites.hosts[0]+'/page0.html': text,
+                      duplicate_pages[0]: text, # same text
+                      duplicate_pages[1]: near_duplicate(text)} # one word replaced
+
+    all_pages = {f'{host}/page{i}.html' for host in websites.hosts for i in range(NB_PAGES)}
+    crawler = Crawler(websites.hosts[0]+'/page0.html', max_urls_crawled=NB_HOSTS*NB_PAGES, crawl_delay=0,
+                      robot_delay=0, dedup_distance=3)
+    crawler.crawl('crawled.txt', 'crawl.db', 'webpages_age', str(tmp_path), documents='documents.jsonl')
+
+    with open(os.path.join(tmp_path, 'documents.jsonl'), encoding='utf-8') as file:
+        stored = {json.loads(line)['url'] for line in file}
+    assert crawler.duplicates == 2
+    assert stored == all_pages - set(duplicate_pages)
+
+
+def test_duplicates_are_not_indexed():
+    rng = random.Random(1)
+    texts = [random_text(rng, 300) for _ in range(3)]
+    # fingerprints of the title, h1 and content joined
+    assert 0 < hamming_distance(simhash('titre  '+texts[0]), simhash('titre  '+near_duplicate(texts[0]))) <= 3
+    data = pd.DataFrame({'url': ['u0', 'u1', 'u2', 'u0', 'u3', 'u4', 'u5'],
+                         'title': ['titre'] * 7,
+                         'h1': [''] * 7,
+                         'content': [texts[0], texts[1], texts[2], texts[2], texts[1], near_duplicate(texts[0]), '']},
+                        index=[10, 11, 12, 13, 14, 15, 16])
+
+    # same url, exact and near duplicates are dropped, the first document being kept
+    assert drop_duplicates(data, 3).index.tolist() == [10, 11, 12, 16]
+    # only the same url and exact duplicates of the fingerprints
+    assert drop_duplicates(data, 0).index.tolist() == [10, 11, 12, 15, 16]
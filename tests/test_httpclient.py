@@ -0,0 +1,119 @@
+"""
+HttpClient against a local HTTP server: decompression, maximum body size and keep-alive
+"""
+import gzip
+import zlib
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from crawler import httpclient
+from crawler.httpclient import HttpClient
+
+PAGE = b'<html><head><title>page</title></head><body>' + b'contenu de la page ' * 500 + b'</body></html>'
+BOMB_SIZE = 8 * 1024 * 1024 # bytes once decompressed
+
+BODIES = {'/plain': (PAGE, None),
+          '/gzip': (gzip.compress(PAGE), 'gzip'),
+          '/deflate': (zlib.compress(PAGE), 'deflate'),
+          '/bomb': (gzip.compress(b'\0' * BOMB_SIZE), 'gzip')}
+if httpclient.brotli is not None:
+    BODIES['/br'] = (httpclient.brotli.compress(PAGE), 'br')
+    BODIES['/br_bomb'] = (httpclient.brotli.compress(b'\0' * BOMB_SIZE), 'br')
+
+requires_brotli = pytest.mark.skipif(httpclient.brotli is None, reason="brotli >= 1.2 is not installed")
+
+
+ACCEPTED_ENCODINGS = [] # Accept-Encoding of each request
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive
+
+    def do_GET(self):
+        ACCEPTED_ENCODINGS.append(self.headers.get('Accept-Encoding'))
+        body, encoding = BODIES[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('path', ['/plain', '/gzip', '/deflate', pytest.param('/br', marks=requires_brotli)])
+def test_bodies_are_decoded(server_url, path):
+    client = HttpClient()
+    try:
+        assert client.get(server_url + path) == PAGE
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize('path', ['/bomb', pytest.param('/br_bomb', marks=requires_brotli)])
+def test_decompressed_body_larger_than_max_body_size_is_rejected(server_url, path):
+    compressed_size = len(BODIES[path][0])
+    client = HttpClient(max_body_size=1024 * 1024)
+    assert compressed_size < client.max_body_size < BOMB_SIZE
+    try:
+        with pytest.raises(ValueError):
+            client.get(server_url + path)
+        # the limit holds for each read, not only for the whole body
+        with client.request(server_url + path) as response:
+            with pytest.raises(ValueError):
+                while True:
+                    chunk = response.read(compressed_size)
+                    assert len(chunk) <= client.max_body_size + 1
+                    if not chunk:
+                        break
+    finally:
+        client.close()
+
+
+def test_body_of_the_maximum_size_is_accepted(server_url):
+    client = HttpClient(max_body_size=len(PAGE))
+    try:
+        assert client.get(server_url + '/gzip') == PAGE
+    finally:
+        client.close()
+
+
+def test_connections_are_reused(server_url):
+    client = HttpClient()
+    try:
+        for path in ['/plain', '/gzip', '/deflate', '/plain']:
+            assert client.get(server_url + path) == PAGE
+        stats = client.stats
+        assert stats['requests'] == 4
+        assert stats['connections_opened'] == 1
+        assert stats['connections_reused'] == 3
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize('brotli_module', [None, pytest.param(httpclient.brotli, marks=requires_brotli)])
+def test_brotli_is_only_accepted_if_its_output_can_be_bounded(server_url, monkeypatch, brotli_module):
+    monkeypatch.setattr(httpclient, 'brotli', brotli_module)
+    client = HttpClient()
+    try:
+        client.get(server_url + '/plain')
+    finally:
+        client.close()
+    encodings = [encoding.strip() for encoding in ACCEPTED_ENCODINGS[-1].split(',')]
+    assert ('br' in encodings) == (brotli_module is not None)
@@ -0,0 +1,76 @@
+"""
+Binary format of the indexes: same postings and same rankings as the JSON indexes
+"""
+import os
+import json
+import random
+
+import pytest
+
+from conftest import ROOT, sample_queries
+from index.postings import (encode_varints, decode_varints, write_postings, read_postings, read_json_index,
+                            PostingsReader)
+from ranking.main import Ranker
+
+
+def test_varints_roundtrip():
+    rng = random.Random(0)
+    values = [0, 1, 127, 128, 255, 16383, 16384, 2**32, 2**63 + 5] + [rng.randrange(2**rng.randint(1, 62)) for _ in range(1000)]
+    assert decode_varints(encode_varints(values)).tolist() == values
+    assert decode_varints(encode_varints([])).tolist() == []
+
+
+@pytest.mark.parametrize('name', ['title.pos_index.json', 'title.non_pos_index.json'])
+def test_binary_index_has_the_postings_of_the_json_index(tmp_path, name):
+    json_index = read_json_index(os.path.join(ROOT, 'index', name))
+    filename = os.path.join(tmp_path, 'index.bin')
+    write_postings(json_index, filename)
+
+    positional = name.startswith('title.pos')
+    if positional:
+        expected = {term: {int(doc): sorted(positions) for doc, positions in postings.items()}
+                    for term, postings in json_index.items()}
+    else:
+        expected = {term: sorted(int(doc) for doc in postings) for term, postings in json_index.items()}
+    assert read_postings(filename) == expected
+
+    rng = random.Random(1)
+    terms = rng.sample(sorted(json_index), 300) + [min(json_index), max(json_index)]
+    with PostingsReader(filename) as reader:
+        assert reader.positional == positional
+        assert len(reader) == len(json_index)
+        for term in terms:
+            assert term in reader
+            assert reader.postings(term) == expected[term]
+            assert reader.doc_frequency(term) == len(expected[term])
+        for term in ['', 'zzzqqq', min(json_index)[:-1], max(json_index)+'z']:
+            if term not in json_index:
+                assert term not in reader
+                assert reader.postings(term) is None
+                assert reader.doc_frequency(term) == 0
+
+
+def test_ranking_with_binary_index_is_the_ranking_with_json_index(tmp_path, fake_stopwords, documents, title_index):
+    # JSON index in the format of the ranking, and the same index in the binary format
+    json_filename = os.path.join(tmp_path, 'index.json')
+    with open(json_filename, 'w', encoding='utf-8') as file:
+        json.dump({term: {doc: {'positions': sorted(positions), 'count': len(positions)}
+                          for doc, positions in postings.items()}
+                   for term, postings in title_index.items()}, file)
+    binary_filename = os.path.join(tmp_path, 'index.bin')
+    write_postings(title_index, binary_filename)
+
+    documents_filename = os.path.join(ROOT, 'ranking', 'documents.json')
+    json_ranker = Ranker(json_filename, documents_filename, 'french')
+    binary_ranker = Ranker(binary_filename, documents_filename, 'french')
+    assert isinstance(binary_ranker.index, PostingsReader)
+
+    nb_results = 0
+    for query in sample_queries(documents, 20):
+        for filter in ['AND', 'OR']:
+            for top_k in [None, 10]:
+                results = binary_ranker.search(query, filter, top_k)
+                assert results == json_ranker.search(query, filter, top_k), (query, filter, top_k)
+                nb_results += len(results[0])
+    assert nb_results > 0
+    binary_ranker.index.close()
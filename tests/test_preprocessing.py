@@ -0,0 +1,80 @@
+"""
+Preprocessing of the corpus by the indexer, with one or several processes
+"""
+import sys
+import json
+import random
+import subprocess
+
+import pandas as pd
+import pytest
+
+from conftest import ROOT, requires_nltk
+from index.preprocessing import StemCache
+
+
+WORDS = ["erreur", "erreurs", "windows", "mise", "à", "jour", "de", "la", "pourquoi", "l'installation",
+         "échoue", "chats", "chat", "maison", "maisons", "python", "404", "!", "?", "(beta)"]
+
+def make_corpus(nb_docs: int) -> list[dict]:
+    rng = random.Random(0)
+    def text(nb_words: int) -> str:
+        return ' '.join(rng.choice(WORDS) for _ in range(nb_words))
+    return [{'url': f'https://example{i % 7}.com/page{i}', 'title': text(6), 'h1': text(3), 'content': text(40)}
+            for i in range(nb_docs)]
+
+
+@requires_nltk
+@pytest.mark.parametrize("stemming", [False, True])
+def test_jobs_write_identical_index_files(tmp_path, stemming):
+    corpus = tmp_path / 'corpus.json'
+    corpus.write_text(json.dumps(make_corpus(1200)), encoding='utf-8')
+
+    files = {}
+    for jobs in (1, 2):
+        out = tmp_path / f'jobs{jobs}'
+        out.mkdir()
+        command = [sys.executable, '-m', 'index.main', '-c', str(corpus), '-al', 'True', '-i', str(out / 'index.json'),
+                   '-m', str(out / 'metadata.json'), '-j', str(jobs)] + (['-s', 'True'] if stemming else [])
+        subprocess.run(command, cwd=ROOT, check=True, capture_output=True)
+        files[jobs] = {path.name: path.read_bytes() for path in sorted(out.iterdir())}
+
+    assert len(files[1]) == 7
+    assert files[1] == files[2]
+
+@requires_nltk
+def test_parallel_preprocessing_keeps_the_order_of_the_corpus():
+    from index.main import preprocess_data
+
+    data = {jobs: pd.DataFrame(make_corpus(700)) for jobs in (1, 2)}
+    for jobs, corpus in data.items():
+        preprocess_data(corpus, True, 'french', jobs=jobs, batch_size=100)
+
+    for field in ('title', 'content', 'h1'):
+        assert data[1][field+'_preprocessed'].tolist() == data[2][field+'_preprocessed'].tolist()
+
+@requires_nltk
+def test_workers_stem_with_their_own_cache_merged_in_the_main_one():
+    from index.main import preprocess_data
+
+    caches = {}
+    for jobs in (1, 2):
+        caches[jobs] = preprocess_data(pd.DataFrame(make_corpus(700)), True, 'french', jobs=jobs, batch_size=100)
+
+    nb_tokens = caches[1].hits + caches[1].misses
+    assert caches[2].hits + caches[2].misses == nb_tokens
+    # the stems computed by the workers are merged, as the ones of a single process
+    assert len(caches[2]) == len(caches[1]) > 0
+
+def test_stem_cache_merge():
+    cache = StemCache(max_size=2)
+    cache.merge({('chats', 'french'): 'chat', ('maisons', 'french'): 'maison', ('erreurs', 'french'): 'erreur'}, 5, 3)
+    assert (cache.hits, cache.misses, len(cache)) == (5, 3, 2)
+
+    worker = StemCache(track_used=True)
+    worker.stem(['chats', 'chats', 'maisons'], 'french')
+    assert worker.take_used_stems() == {('chats', 'french'): 'chat', ('maisons', 'french'): 'maison'}
+    assert worker.take_used_stems() == {}
+    worker.stem(['chats'], 'french')
+    assert (worker.hits, worker.misses) == (2, 2)
+    assert worker.take_used_stems() == {('chats', 'french'): 'chat'}
@@ -0,0 +1,209 @@
+"""
+Optimized ranking functions against the reference implementations: same documents, same order
+"""
+import os
+import json
+
+import numpy as np
+import pytest
+
+from conftest import ROOT, sample_queries
+import ranking.main as R
+from index.docstats import compute_doc_stats, save_doc_stats
+from index.postings import write_postings, PostingsReader
+
+
+@pytest.fixture(scope='module')
+def ranking_index(title_index) -> dict[str, dict]:
+    """Title positional index in the format of the ranking"""
+    return {term: {doc: {'positions': positions, 'count': len(positions)} for doc, positions in postings.items()}
+            for term, postings in title_index.items()}
+
+
+def query_documents(index:dict[str, dict], documents:list[dict], query:str, filter:str) -> tuple[dict, list[dict]]:
+    """Postings of the query and documents kept by the filter, in the order of the corpus"""
+    query_index = R.query_postings(index, set(R.tokenize(query)) | set(query.lower().split()))
+    ids = set(R.filter_docs(query_index, query, filter))
+    return query_index, [document for document in documents if document['id'] in ids]
+
+
+@pytest.mark.parametrize('with_stats', [False, True])
+def test_vectorized_ranking_is_the_loop_ranking(fake_stopwords, documents, ranking_index, with_stats):
+    doc_stats = None
+    metadata = R.compute_metadata(documents)
+    if with_stats:
+        doc_stats = compute_doc_stats([doc['id'] for doc in documents], [doc['title'] for doc in documents], 'french')
+        metadata = {key: doc_stats[key] for key in ('nb_doc', 'nb_tokens_title_total', 'mean_nb_tokens_title')}
+    title_words = R.build_title_words(documents)
+
+    nb_ranked = 0
+    for query in sample_queries(documents, 30, seed=2):
+        for filter in ['AND', 'OR']:
+            query_index, filtered_docs = query_documents(ranking_index, documents, query, filter)
+            expected = R.linear_ranking(query, filtered_docs, query_index, R.WEIGHTS, metadata, 'french', doc_stats)
+            for words in [title_words, None]:
+                ranking = R.linear_ranking_vectorized(query, filtered_docs, query_index, R.WEIGHTS, metadata, 'french',
+                                                      doc_stats, words)
+                assert ranking == expected, (query, filter)
+            nb_ranked += len(expected)
+    assert nb_ranked > 0
+
+
+@pytest.mark.parametrize('with_stats', [False, True])
+def test_top_k_ranking_is_the_beginning_of_the_full_ranking(fake_stopwords, documents, ranking_index, with_stats):
+    doc_stats = None
+    metadata = R.compute_metadata(documents)
+    if with_stats:
+        doc_stats = compute_doc_stats([doc['id'] for doc in documents], [doc['title'] for doc in documents], 'french')
+    title_words = R.build_title_words(documents)
+    bounds = {} # shared by the queries, as by the Ranker
+
+    # frequent tokens, so that 'OR' queries have many more documents than the blocks of the pruning
+    queries = sample_queries(documents, 12, seed=3) + ['erreur de', 'windows 10 erreur de mise à jour', 'la de le et']
+    for query in queries:
+        for filter in ['AND', 'OR']:
+            query_index, filtered_docs = query_documents(ranking_index, documents, query, filter)
+            full = R.linear_ranking_vectorized(query, filtered_docs, query_index, R.WEIGHTS, metadata, 'french',
+                                               doc_stats, title_words)
+            for top_k in [1, 10, 100]:
+                expected = {rank: doc_id for rank, doc_id in full.items() if rank <= top_k}
+                for prune in [True, False]:
+                    ranking = R.top_k_ranking(query, filtered_docs, query_index, R.WEIGHTS, metadata, 'french', top_k,
+                                              doc_stats, title_words, prune=prune, bounds=bounds)
+                    assert ranking == expected, (query, filter, top_k, prune)
+
+
+def test_ranker_top_k_results_are_the_first_results(fake_stopwords, tmp_path, title_index):
+    index_filename = os.path.join(tmp_path, 'index.bin')
+    write_postings(title_index, index_filename)
+    ranker = R.Ranker(index_filename, os.path.join(ROOT, 'ranking', 'documents.json'), 'french')
+    for query in ['erreur 404', 'de la erreur', 'pourquoi erreur', 'zzzqqq']:
+        for filter in ['AND', 'OR']:
+            results, nb_filtered = ranker.search(query, filter)
+            for top_k in [1, 10]:
+                assert ranker.search(query, filter, top_k) == (results[:top_k], nb_filtered)
+    ranker.index.close()
+
+
+def set_filter(index:dict[str, dict], query:str, filter:str) -> set[int]:
+    """Documents kept by the filter, computed with sets of docIds"""
+    postings = [{int(doc) for doc in index[token]} for token in set(R.tokenize(query)) if token in index]
+    if not postings:
+        return set()
+    return set.union(*postings) if filter == 'OR' else set.intersection(*postings)
+
+
+def test_sorted_array_filter_is_the_set_filter(documents, ranking_index):
+    for query in sample_queries(documents, 200, seed=4) + ['de la', 'le la de et', 'de la les des du']:
+        query_index = R.query_postings(ranking_index, set(R.tokenize(query)))
+        for filter in ['AND', 'OR']:
+            expected = sorted(set_filter(query_index, query, filter))
+            docs = R.filter_docs(query_index, query, filter)
+            assert docs == expected, (query, filter)
+            assert all(type(doc) is int for doc in docs)
+            # with the postings converted to arrays, shared with the ranking
+            arrays = {}
+            assert R.filter_docs(query_index, query, filter, arrays) == expected, (query, filter)
+            assert set(arrays) == set(query_index) & set(R.tokenize(query))
+
+
+
+def test_document_table_indexes_documents_by_id():
+    documents = [{'id': 5, 'url': 'u5', 'title': 't5'},
+                 {'id': 2, 'url': 'u2', 'title': 't2'},
+                 {'id': 7, 'url': 'u7', 'title': 't7'},
+                 {'id': 2, 'url': 'u2 bis', 'title': 't2 bis'}]
+    document_table, document_order = R.build_document_table(documents)
+
+    # first document of each docId, None without document
+    assert document_table == [None, None, documents[1], None, None, documents[0], None, documents[2]]
+    assert document_order.tolist() == [-1, -1, 1, -1, -1, 0, -1, 2]
+    assert R.format_ranking_results(document_table, {1: 7, 2: 2}) == [{'title': 't7', 'url': 'u7'},
+                                                                       {'title': 't2', 'url': 'u2'}]
+
+    document_table, document_order = R.build_document_table([])
+    assert document_table == [] and len(document_order) == 0
+
+
+def test_ranker_finds_the_documents_of_the_corpus(fake_stopwords, documents, tmp_path, title_index):
+    # corpus whose docIds have gaps (documents of the index without document) and are not sorted
+    corpus = documents[::3][::-1] + documents[1::3]
+    documents_filename = os.path.join(tmp_path, 'documents.json')
+    with open(documents_filename, 'w', encoding='utf-8') as file:
+        json.dump(corpus, file)
+    index_filename = os.path.join(tmp_path, 'index.bin')
+    write_postings(title_index, index_filename)
+    ranker = R.Ranker(index_filename, documents_filename, 'french')
+    results = {document['id']: {'title': document['title'], 'url': document['url']} for document in corpus}
+
+    for query in sample_queries(documents, 20, seed=5):
+        for filter in ['AND', 'OR']:
+            # documents looked up by going through the whole corpus
+            query_index = R.query_postings(ranker.index, set(R.tokenize(query)) | set(query.lower().split()))
+            ids = R.filter_docs(query_index, query, filter)
+            kept = set(ids)
+            filtered_docs = [document for document in corpus if document['id'] in kept]
+            ranking = R.linear_ranking_vectorized(query, filtered_docs, query_index, ranker.weights, ranker.metadata,
+                                                  'french', None, ranker.title_words)
+            expected = [results[doc_id] for doc_id in ranking.values()]
+
+            assert ranker.search(query, filter) == (expected, len(ids)), (query, filter)
+            assert ranker.search(query, filter, 10) == (expected[:10], len(ids)), (query, filter)
+    ranker.index.close()
+
+
+def test_ranker_rejects_statistics_of_another_weight_or_tokenizer(fake_stopwords, documents, tmp_path, title_index):
+    index_filename = os.path.join(tmp_path, 'index.bin')
+    write_postings(title_index, index_filename)
+    documents_filename = os.path.join(ROOT, 'ranking', 'documents.json')
+    stats = compute_doc_stats([doc['id'] for doc in documents], [doc['title'] for doc in documents], 'french')
+    assert stats['stopwords_weight'] == R.WEIGHTS['stopwords']
+
+    stats_filename = os.path.join(tmp_path, 'doc_stats.npz')
+    save_doc_stats(stats, stats_filename)
+    R.Ranker(index_filename, documents_filename, 'french', doc_stats_file=stats_filename).index.close()
+    with pytest.raises(ValueError):
+        R.Ranker(index_filename, documents_filename, 'english', doc_stats_file=stats_filename)
+    with pytest.raises(ValueError):
+        R.Ranker(index_filename, documents_filename, 'french', {**R.WEIGHTS, 'stopwords': 0.5}, stats_filename)
+
+    for changed in [{'stopwords_weight': 0.5}, {'tokenizer_version': R.TOKENIZER_VERSION + 1}]:
+        save_doc_stats({**stats, **changed}, stats_filename)
+        with pytest.raises(ValueError):
+            R.Ranker(index_filename, documents_filename, 'french', doc_stats_file=stats_filename)
+
+
+def test_binary_query_postings_are_the_json_query_postings(fake_stopwords, documents, tmp_path, title_index):
+    # same index in the format of the ranking (str docIds) and in the binary format (int docIds)
+    json_index = {term: {doc: {'positions': sorted(positions), 'count': len(positions)} for doc, positions in postings.items()}
+                  for term, postings in title_index.items()}
+    index_filename = os.path.join(tmp_path, 'index.bin')
+    write_postings(title_index, index_filename)
+    metadata = R.compute_metadata(documents)
+
+    with PostingsReader(index_filename) as reader:
+        for query in sample_queries(documents, 20, seed=6):
+            tokens = set(R.tokenize(query)) | set(query.lower().split())
+            binary_postings = R.query_postings(reader, tokens)
+            json_postings = R.query_postings(json_index, tokens)
+            assert set(binary_postings) == set(json_postings)
+            for token, postings in binary_postings.items():
+                assert all(type(doc) is int for doc in postings)
+                for doc in json_postings[token]:
+                    assert R.doc_postings(postings, int(doc)) == R.doc_postings(json_postings[token], int(doc))
+                for binary_array, json_array in zip(R.postings_arrays(postings), R.postings_arrays(json_postings[token])):
+                    assert np.array_equal(binary_array, json_array)
+
+            for filter in ['AND', 'OR']:
+                ids = R.filter_docs(binary_postings, query, filter)
+                assert ids == R.filter_docs(json_postings, query, filter)
+                kept = set(ids)
+                filtered_docs = [document for document in documents if document['id'] in kept]
+                assert (R.linear_ranking(query, filtered_docs, binary_postings, R.WEIGHTS, metadata, 'french')
+                        == R.linear_ranking(query, filtered_docs, json_postings, R.WEIGHTS, metadata, 'french'))
+
+
+def test_stopwords_are_a_frozenset(fake_stopwords):
+    lstopwords = R.get_stopwords('french')
+    assert isinstance(lstopwords, frozenset)
+    assert lstopwords is R.get_stopwords('french')
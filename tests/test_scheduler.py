@@ -0,0 +1,97 @@
+"""
+Per-host politeness scheduler: order in which urls are handed out and delays between the pages of a host
+"""
+import time
+
+from crawler.scheduler import PolitenessScheduler
+
+
+def test_busy_host_is_not_handed_out_until_released():
+    frontier = PolitenessScheduler(crawl_delay=0.2)
+    frontier.extend(['http://a.fr/1', 'http://a.fr/2', 'http://b.fr/1'])
+
+    first = frontier.pop_ready()
+    second = frontier.pop_ready()
+    assert {first, second} == {'http://a.fr/1', 'http://b.fr/1'}
+    # both hosts are busy: the url left is not handed out, however long the crawl of its host takes
+    assert frontier.pop_ready() is None
+    assert frontier.wait_time() is None
+    time.sleep(0.3)
+    assert frontier.pop_ready() is None
+
+    # the delay of the host is counted from its release
+    frontier.release('http://a.fr/1')
+    assert frontier.pop_ready() is None
+    assert 0.1 < frontier.wait_time() <= 0.2
+    time.sleep(frontier.wait_time())
+    assert frontier.pop_ready() == 'http://a.fr/2'
+    assert len(frontier) == 0
+
+
+def test_urls_added_to_a_busy_host_wait_for_its_release():
+    frontier = PolitenessScheduler(crawl_delay=0)
+    frontier.add('http://a.fr/1')
+    assert frontier.pop_ready() == 'http://a.fr/1'
+
+    frontier.add('http://a.fr/2')
+    assert frontier.pop_ready() is None
+    frontier.release('http://a.fr/1')
+    assert frontier.pop_ready() == 'http://a.fr/2'
+
+
+def test_urls_of_a_ready_host_are_handed_out_first():
+    frontier = PolitenessScheduler(crawl_delay=0.2)
+    frontier.extend(['http://a.fr/1', 'http://a.fr/2', 'http://a.fr/3', 'http://b.fr/1', 'http://c.fr/1'])
+
+    # one url per host while the others cool down, then the urls left of the first host
+    assert [frontier.pop() for _ in range(3)] == ['http://a.fr/1', 'http://b.fr/1', 'http://c.fr/1']
+    assert frontier.idle_time == 0
+    start = time.monotonic()
+    assert frontier.pop() == 'http://a.fr/2'
+    assert frontier.pop() == 'http://a.fr/3'
+    assert time.monotonic() - start >= 0.3 # waits for the delay of the host between its pages
+    assert 0.2 <= frontier.idle_time <= time.monotonic() - start
+
+
+def test_urls_of_a_host_keep_their_order_and_delay():
+    frontier = PolitenessScheduler(crawl_delay=0.1)
+    urls = [f'http://a.fr/{i}' for i in range(4)]
+    frontier.extend(urls)
+
+    times = []
+    popped = []
+    for _ in urls:
+        popped.append(frontier.pop())
+        times.append(time.monotonic())
+    assert popped == urls
+    assert all(later - earlier >= 0.09 for earlier, later in zip(times, times[1:]))
+
+
+def test_crawl_delay_of_a_host():
+    frontier = PolitenessScheduler(crawl_delay=0.1)
+    frontier.set_crawl_delay('http://a.fr/robots.txt', 0.3)
+    frontier.set_crawl_delay('http://b.fr/robots.txt', 0.01) # shorter than the default delay
+    frontier.set_crawl_delay('http://c.fr/robots.txt', None)
+    assert frontier.crawl_delay('http://a.fr/page') == 0.3
+    assert frontier.crawl_delay('http://b.fr/page') == 0.1
+    assert frontier.host_delays() == {'http://a.fr': 0.3}
+
+    frontier.extend(['http://a.fr/1', 'http://a.fr/2', 'http://b.fr/1', 'http://b.fr/2', 'http://b.fr/3'])
+    # the host with the longer delay is requested less often
+    assert [frontier.pop() for _ in range(5)] == ['http://a.fr/1', 'http://b.fr/1', 'http://b.fr/2',
+                                                  'http://b.fr/3', 'http://a.fr/2']
+
+
+def test_restored_frontier_keeps_the_order_and_delays():
+    frontier = PolitenessScheduler(crawl_delay=0)
+    frontier.set_crawl_delay('http://a.fr/', 0.2)
+    frontier.extend(['http://a.fr/1', 'http://b.fr/1', 'http://a.fr/2', 'http://b.fr/2'])
+
+    restored = PolitenessScheduler(crawl_delay=0)
+    restored.restore(frontier.queued(), frontier.host_delays())
+    assert restored.queued() == frontier.queued() == ['http://a.fr/1', 'http://a.fr/2', 'http://b.fr/1', 'http://b.fr/2']
+    assert restored.crawl_delay('http://a.fr/1') == 0.2
+    assert [restored.pop() for _ in range(4)] == ['http://a.fr/1', 'http://b.fr/1', 'http://b.fr/2', 'http://a.fr/2']
+    # the restored urls are seen, they are not queued again
+    assert restored.extend(['http://a.fr/1', 'http://b.fr/2', 'http://c.fr/1']) == 1
+    assert isinstance(restored.idle_time, float)
@@ -0,0 +1,36 @@
+"""
+Crawl budget shared by the processes of a distributed crawl
+"""
+import multiprocessing
+
+from crawler.sharding import ShardCoordinator
+
+
+def test_budget_given_back_by_a_worker_is_crawled_by_a_waiting_worker():
+    coordinator = ShardCoordinator(2, 2, multiprocessing.get_context('spawn'))
+    assert coordinator.reserve(0) and coordinator.reserve(0)
+
+    # worker 1 has urls but the whole budget is booked: it waits instead of stopping
+    assert not coordinator.reserve(1)
+    assert not coordinator.idle(1, waiting_for_budget=True)
+
+    # a page of worker 0 could not be crawled, its budget goes to worker 1
+    coordinator.confirm()
+    coordinator.release()
+    assert not coordinator.idle(0)
+    assert coordinator.reserve(1)
+    coordinator.confirm()
+
+    # the whole budget is crawled and no page is being crawled
+    assert not coordinator.reserve(1)
+    assert coordinator.idle(1, waiting_for_budget=True)
+    assert coordinator.idle(0)
+
+
+def test_crawl_is_over_when_all_workers_are_idle():
+    coordinator = ShardCoordinator(2, 10, multiprocessing.get_context('spawn'))
+    assert coordinator.reserve(0)
+    assert not coordinator.idle(1) # a page of worker 0 is being crawled
+    coordinator.confirm()
+    assert not coordinator.idle(1) # worker 0 may still find urls
+    assert coordinator.idle(0)